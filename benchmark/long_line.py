@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Compares the rendering of a single very long line by output_builder() (one pass over the match positions)
+with the previous one: partition() and replace() of the rest of the line for each placeholder (quadratic).
+
+For each size the template is a single line (minified JSON or JavaScript) of about that many bytes,
+with a placeholder every 64 bytes: each placeholder has its own name, its file is one of four small files.
+The previous renderer is skipped above --legacy-max, it would take hours: below it the outputs must be the same.
+
+The time per byte of output_builder() must stay about the same at every size:
+if it grows more than --max-growth times from the smallest to the largest size, the exit status is 1.
+> A quadratic renderer would grow as much as the ratio of the sizes (100 times with the default sizes)
+
+Usage:
+ long_line.py [--sizes=<list>] [--legacy-max=<n>] [--max-growth=<x>]
+ long_line.py (-h | --help)
+
+Options:
+ -h --help              Show this screen.
+ --sizes=<list>         Comma separated sizes of the template line in bytes [default: 100000,1000000,10000000].
+ --legacy-max=<n>       Largest size rendered with the previous renderer [default: 1000000].
+ --max-growth=<x>       Maximum growth of the time per byte [default: 3].
+"""
+
+import io
+import os
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+
+# add to the python path the folder with templately
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "templately"))
+
+import templately  # noqa: E402
+
+
+def legacy_output_builder(t_fin, t_fout, t_regex_pattern, t_placeholders_index):
+
+    """output_builder() as it was: the rest of the line is partitioned and replaced for each placeholder.
+
+    :param t_fin: template file
+    :type t_fin: :class:`_io.TextIO`
+    :param t_fout: output file
+    :type t_fout: :class:`_io.TextIO`
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :param dict t_placeholders_index: placeholder name -> file path dictionary
+    :return: None
+    """
+
+    line = t_fin.readline()
+
+    while line != "":
+        temp_line = line
+
+        if any(t_regex_pattern.finditer(temp_line)):
+            suffix = ""
+
+            for placeholder in t_regex_pattern.finditer(temp_line):
+                tosub = placeholder.group(0)
+                prefix, sep, suffix = temp_line.partition(tosub)
+                t_fout.write(prefix)
+
+                file_path = t_placeholders_index.get(placeholder.group(1))
+                if file_path is not None:
+                    t_fout.write(templately.fragment_cache.get(file_path))
+
+                temp_line = temp_line.replace(prefix + tosub, "")
+
+            t_fout.write(suffix)
+
+        else:
+            t_fout.write(temp_line)
+
+        line = t_fin.readline()
+
+
+def generate_line(t_size, t_fragments):
+
+    """Returns a template made of a single line of about <t_size> bytes, and its placeholders index.
+
+    :param int t_size: size of the line in bytes
+    :param list t_fragments: paths of the files to inject
+    :return: (template text, placeholder name -> file path dictionary) tuple
+    :rtype: tuple
+    """
+
+    parts = []
+    index = {}
+    length = 0
+    i = 0
+
+    while length < t_size:
+        name = "p" + str(i)
+        part = '{"key' + str(i) + '":"{{ ty.' + name + ' }}",'
+        # a placeholder every 64 bytes
+        part += " " * max(0, 64 - len(part))
+
+        parts.append(part)
+        index[name] = t_fragments[i % len(t_fragments)]
+        length += len(part)
+        i += 1
+
+    return "[" + "".join(parts) + "]\n", index
+
+
+def best_time(t_function, t_repeat=3):
+
+    """Returns the fastest of <t_repeat> runs of <t_function>, in seconds.
+
+    :param t_function: function without arguments
+    :param int t_repeat: number of runs
+    :return: seconds
+    :rtype: float
+    """
+
+    best = None
+    for _ in range(t_repeat):
+        start = time.perf_counter()
+        t_function()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+if __name__ == "__main__":
+
+    arguments = docopt(__doc__)
+
+    sizes = sorted(int(size) for size in arguments['--sizes'].split(","))
+    legacy_max = int(arguments['--legacy-max'])
+    max_growth = float(arguments['--max-growth'])
+
+    regex_pattern = templately.re_builder("{{", "ty.", "}}")
+
+    print("{:>10} {:>12} {:>14} {:>14} {:>14}".format("bytes", "placeholders", "previous ms", "offsets ms",
+                                                      "offsets ns/B"))
+
+    per_byte = []
+    with tempfile.TemporaryDirectory() as tmp:
+        fragments = []
+        for i in range(4):
+            fragments.append(os.path.join(tmp, "fragment" + str(i) + ".txt"))
+            with open(fragments[-1], "w") as fout:
+                fout.write("value" + str(i))
+
+        output = os.path.join(tmp, "output.txt")
+
+        for size in sizes:
+            text, index = generate_line(size, fragments)
+
+            # the files to inject stay inside the fragment cache: only the line is measured
+            seconds = best_time(lambda: templately.output_builder(io.StringIO(text), {"<output>": output},
+                                                                  regex_pattern, index))
+            per_byte.append(seconds / len(text))
+
+            legacy = "skipped"
+            if size <= legacy_max:
+                legacy_out = io.StringIO()
+                legacy_seconds = best_time(lambda: legacy_output_builder(io.StringIO(text), legacy_out,
+                                                                         regex_pattern, index), 1)
+                legacy = "{:.2f}".format(legacy_seconds * 1000)
+
+                with open(output, "r") as fin:
+                    if fin.read() != legacy_out.getvalue():
+                        print("The outputs of the two renderers are different!", file=sys.stderr)
+                        sys.exit(1)
+
+            print("{:>10} {:>12} {:>14} {:>14.2f} {:>14.2f}".format(len(text), len(index), legacy, seconds * 1000,
+                                                                    per_byte[-1] * 1e9))
+
+    growth = per_byte[-1] / per_byte[0]
+    print("Growth of the time per byte from {} to {} bytes: {:.2f}x (maximum {:.2f}x)".format(sizes[0], sizes[-1],
+                                                                                              growth, max_growth))
+    if growth > max_growth:
+        print("The rendering of a line isn't linear!", file=sys.stderr)
+        sys.exit(1)
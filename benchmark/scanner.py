@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Compares the throughput of the placeholder scanners:
+the re_builder() regex pattern and the regex-free TagScanner.
+
+The templates are generated with few placeholders (one every 1000 lines)
+and with many placeholders (two on each line).
+Text is scanned one line at a time (like the Template class does),
+bytes are scanned as a whole (like the MappedTemplate class does).
+
+Usage:
+ scanner.py [--size=<mb>] [--repeat=<n>]
+ scanner.py (-h | --help)
+
+Options:
+ -h --help              Show this screen.
+ --size=<mb>            Size of the generated templates in MB [default: 8].
+ --repeat=<n>           Number of runs of each scanner, the fastest is reported [default: 3].
+"""
+
+import os
+import sys
+import time
+
+from docopt import docopt
+
+# add to the python path the folder with templately
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "templately"))
+
+import templately  # noqa: E402
+
+
+def generate_template(t_size, t_many):
+
+    """Returns a template of about <t_size> characters.
+
+    :param int t_size: number of characters
+    :param bool t_many: two placeholders on each line, instead of one every 1000 lines
+    :return: template text
+    :rtype: str
+    """
+
+    if t_many:
+        lines = ["key: {{ ty.name }} value: {{ty.other}}\n"]
+    else:
+        lines = ["plain text of a template line, without placeholders\n"] * 999 + ["key: {{ ty.name }}\n"]
+
+    block = "".join(lines)
+    return block * max(1, t_size // len(block))
+
+
+def measure(t_scanner, t_texts, t_repeat):
+
+    """Returns the number of matches and the best time to scan all the texts.
+
+    :param t_scanner: regex pattern or TagScanner
+    :param list t_texts: texts to scan
+    :param int t_repeat: number of runs
+    :return: (matches, seconds) tuple
+    :rtype: tuple
+    """
+
+    best = None
+    matches = 0
+
+    for _ in range(t_repeat):
+        matches = 0
+        start = time.perf_counter()
+        for text in t_texts:
+            for _match in t_scanner.finditer(text):
+                matches += 1
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return matches, best
+
+
+if __name__ == "__main__":
+
+    arguments = docopt(__doc__)
+
+    size = int(float(arguments['--size']) * 1024 * 1024)
+    repeat = int(arguments['--repeat'])
+
+    print("{:<6} {:<6} {:<8} {:>10} {:>10}".format("tags", "input", "scanner", "matches", "MB/s"))
+
+    for many in (False, True):
+        text = generate_template(size, many)
+        megabytes = len(text) / (1024 * 1024)
+
+        for binary in (False, True):
+            if binary:
+                texts = [text.encode("utf-8")]
+            else:
+                texts = text.splitlines(True)
+
+            auto = templately.make_scanner("{{", "ty.", "}}", "auto", binary)
+
+            for kind in ("regex", "find"):
+                scanner = templately.make_scanner("{{", "ty.", "}}", kind, binary)
+                matches, seconds = measure(scanner, texts, repeat)
+
+                print("{:<6} {:<6} {:<8} {:>10} {:>10.1f}{}".format("many" if many else "few",
+                                                                    "bytes" if binary else "text",
+                                                                    kind, matches, megabytes / seconds,
+                                                                    "  (auto)" if scanner is auto else ""))
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Measures the cold start of templately and checks it against a budget.
+
+The import of the templately module is traced with "python -X importtime":
+the modules that only some modes need (docopt, concurrent.futures, ctypes, ...)
+must not be imported by the module itself, they are imported by the functions that use them.
+Then a tiny template is rendered from the command line in a new process, many times:
+its median time is compared with the one of an empty python process, measured the same way.
+The render budget is a multiple of that time, this way it doesn't depend on the speed of the machine.
+
+If a heavy module is imported eagerly, or a time is over its budget, the exit status is 1.
+
+Usage:
+ startup.py [--runs=<n>] [--import-budget=<ms>] [--render-budget=<ratio>]
+ startup.py (-h | --help)
+
+Options:
+ -h --help                Show this screen.
+ --runs=<n>               Number of processes started for each measure, the median is reported [default: 20].
+ --import-budget=<ms>     Maximum cumulative time of "import templately" in milliseconds [default: 15].
+ --render-budget=<ratio>  Maximum time of a tiny render, as a multiple of the time of an empty python process
+                          [default: 4].
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from docopt import docopt
+
+# folder with templately
+TEMPLATELY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "templately")
+
+# modules that "import templately" must not load
+LAZY_MODULES = ["docopt", "concurrent.futures", "ctypes", "csv", "json", "glob", "mmap", "select", "struct"]
+
+
+def import_times():
+
+    """Returns the modules imported by "import templately", with their cumulative import time.
+
+    :return: dictionary module name -> cumulative time in microseconds
+    :rtype: dict
+    """
+
+    # the bytecode is compiled before the trace, this way its time isn't counted
+    subprocess.run([sys.executable, "-m", "compileall", "-q", TEMPLATELY_DIR], check=True)
+
+    env = dict(os.environ, PYTHONPATH=TEMPLATELY_DIR)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import templately"],
+                             stderr=subprocess.PIPE, universal_newlines=True, env=env, check=True)
+
+    # each line is "import time: <self> | <cumulative> | <indented module name>"
+    times = {}
+    for line in process.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        times[fields[2].strip()] = int(fields[1])
+
+    return times
+
+
+def median_run(t_command, t_runs):
+
+    """Returns the median time to run a command in a new process.
+
+    :param list t_command: command and its arguments
+    :param int t_runs: number of runs
+    :return: median time in milliseconds
+    :rtype: float
+    """
+
+    timings = []
+    for _ in range(t_runs):
+        start = time.perf_counter()
+        subprocess.run(t_command, stdout=subprocess.DEVNULL, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+
+    arguments = docopt(__doc__)
+
+    runs = int(arguments['--runs'])
+    import_budget = float(arguments['--import-budget'])
+    render_budget = float(arguments['--render-budget'])
+
+    failed = False
+
+    # modules imported by the module itself
+    times = import_times()
+    eager = [module for module in LAZY_MODULES if module in times]
+    import_ms = times.get("templately", 0) / 1000
+
+    print("{:<24} {:>10.1f} ms (budget {:.1f} ms)".format("import templately", import_ms, import_budget))
+    if eager:
+        print("Modules imported eagerly: " + ", ".join(eager))
+        failed = True
+    if import_ms > import_budget:
+        failed = True
+
+    # tiny render from the command line, over an empty python process
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.txt")
+        fragment = os.path.join(tmp, "fragment.txt")
+        with open(template, "w") as fout:
+            fout.write("Hello {{ ty.name }}!\n")
+        with open(fragment, "w") as fout:
+            fout.write("world")
+
+        baseline = median_run([sys.executable, "-c", "pass"], runs)
+        render = median_run([sys.executable, os.path.join(TEMPLATELY_DIR, "templately.py"),
+                             template, os.path.join(tmp, "output.txt"), "name=" + fragment], runs)
+
+    print("{:<24} {:>10.1f} ms".format("python -c pass", baseline))
+    ratio = render / baseline
+    print("{:<24} {:>10.1f} ms ({:.1f}x python, budget {:.1f}x)".format("render", render, ratio, render_budget))
+    if ratio > render_budget:
+        failed = True
+
+    if failed:
+        print("Startup over budget!", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Benchmark suite of the hot paths of templately, on synthetic workloads.
+
+The workloads are generated inside a temporary folder:
+ many_per_line     many lines with ten placeholders each
+ long_line         a single very long line full of placeholders
+ huge_fragments    a few placeholders whose files are very big
+ many_arguments    tens of thousands of placeholders, one input argument each
+ repeated_renders  a small template rendered many times (the injected files come from the fragment cache)
+
+On each workload get_placeholders(), check_placeholder_arguments() and output_builder() are timed
+(the fastest of --repeat runs) and their peak memory is measured with tracemalloc (in a separate run,
+tracing slows the code down). The cold start of the command line is measured too: the median time
+of a tiny render in a new process and the peak RSS of those processes.
+
+The results are printed as a table and written as JSON to --output, to be compared across runs:
+with --compare the times are compared with a previous JSON file and, if one of them is
+more than --max-slowdown times slower, the exit status is 1.
+The size of every workload is multiplied by --scale (0.1 for a quick run).
+
+Usage:
+ suite.py [--output=<file>] [--compare=<file>] [--max-slowdown=<x>] [--repeat=<n>] [--scale=<x>] [--runs=<n>]
+ suite.py (-h | --help)
+
+Options:
+ -h --help              Show this screen.
+ --output=<file>        JSON file with the results, "-" for the standard output [default: benchmark.json].
+ --compare=<file>       JSON file of a previous run to compare the times with.
+ --max-slowdown=<x>     Maximum ratio between a time and the previous one [default: 1.5].
+ --repeat=<n>           Number of runs of each function, the fastest is reported [default: 3].
+ --scale=<x>            Size multiplier of the workloads [default: 1].
+ --runs=<n>             Number of processes started for the cold start, the median is reported [default: 10].
+"""
+
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from docopt import docopt
+
+# folder with templately
+TEMPLATELY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "templately")
+
+# add it to the python path
+sys.path.insert(0, TEMPLATELY_DIR)
+
+import templately  # noqa: E402
+
+# version of the JSON layout, increased when the results aren't comparable anymore
+RESULTS_VERSION = 1
+
+
+def write_fragments(t_dir, t_count, t_size):
+
+    """Writes <t_count> files to inject of <t_size> bytes each and returns their paths.
+
+    :param str t_dir: folder of the files
+    :param int t_count: number of files
+    :param int t_size: size of each file in bytes
+    :return paths: paths of the files
+    :rtype paths: list
+    """
+
+    paths = []
+    line = "fragment line of text injected into the output\n"
+
+    for i in range(t_count):
+        path = os.path.join(t_dir, "fragment" + str(i) + ".txt")
+        with open(path, "w") as fout:
+            fout.write((line * (t_size // len(line) + 1))[:t_size])
+        paths.append(path)
+
+    return paths
+
+
+def write_workload(t_dir, t_name, t_lines, t_fragments):
+
+    """Writes the template of a workload and returns the workload.
+
+    Each placeholder name is unique, this way the placeholders are valid:
+    its file is one of <t_fragments>, in turn.
+
+    :param str t_dir: folder of the files
+    :param str t_name: name of the workload
+    :param list t_lines: lines of the template, each line is a list of text parts and placeholder names
+                         (a name is a ``(name,)`` tuple)
+    :param list t_fragments: paths of the files to inject
+    :return workload: dictionary with the name, the template path, the input placeholders and the sizes
+    :rtype workload: dict
+    """
+
+    template = os.path.join(t_dir, t_name + ".txt")
+    names = []
+
+    with open(template, "w") as fout:
+        for line in t_lines:
+            for part in line:
+                if isinstance(part, tuple):
+                    names.append(part[0])
+                    fout.write("{{ ty." + part[0] + " }}")
+                else:
+                    fout.write(part)
+            fout.write("\n")
+
+    placeholders = [name + "=" + t_fragments[i % len(t_fragments)] for i, name in enumerate(names)]
+
+    return {"name": t_name,
+            "template": template,
+            "placeholders": placeholders,
+            "renders": 1,
+            "size": {"template_bytes": os.path.getsize(template),
+                     "lines": len(t_lines),
+                     "placeholders": len(names),
+                     "fragment_bytes": sum(os.path.getsize(path) for path in set(t_fragments))}}
+
+
+def generate_workloads(t_dir, t_scale):
+
+    """Generates the synthetic workloads inside <t_dir>.
+
+    :param str t_dir: folder of the files
+    :param float t_scale: size multiplier
+    :return workloads: list of workloads (see :func:`write_workload()`)
+    :rtype workloads: list
+    """
+
+    def scaled(t_value):
+        return max(1, int(t_value * t_scale))
+
+    # small files shared by the workloads with many placeholders, and four very big files
+    os.mkdir(os.path.join(t_dir, "small"))
+    small = write_fragments(os.path.join(t_dir, "small"), 100, 200)
+    os.mkdir(os.path.join(t_dir, "huge"))
+    huge = write_fragments(os.path.join(t_dir, "huge"), 4, scaled(16 * 1024 * 1024))
+
+    workloads = []
+
+    # many lines with ten placeholders each
+    workloads.append(write_workload(t_dir, "many_per_line",
+                                    [sum((["text before ", ("p" + str(line * 10 + i),)] for i in range(10)), [])
+                                     for line in range(scaled(2000))], small))
+
+    # a single very long line: text and placeholders alternate
+    # > benchmark/long_line.py renders lines up to 10 MB
+    workloads.append(write_workload(t_dir, "long_line",
+                                    [sum(([" literal text between two placeholders " * 3, ("p" + str(i),)]
+                                          for i in range(scaled(2000))), [])], small))
+
+    # a few placeholders, very big files
+    workloads.append(write_workload(t_dir, "huge_fragments",
+                                    [["header ", ("p" + str(i),), " footer"] for i in range(len(huge))], huge))
+
+    # tens of thousands of input arguments
+    workloads.append(write_workload(t_dir, "many_arguments",
+                                    [["item: ", ("p" + str(i),)] for i in range(scaled(20000))], small))
+
+    # a small template rendered many times
+    workload = write_workload(t_dir, "repeated_renders",
+                              [["this is"], [("p1",), " a ", ("p2",)], ["test ", ("p3",)]], small)
+    workload["renders"] = scaled(2000)
+    workloads.append(workload)
+
+    return workloads
+
+
+def measure(t_function, t_repeat, t_setup=None):
+
+    """Returns the fastest time of <t_function> over <t_repeat> runs, and its peak of traced memory.
+
+    :param t_function: function without arguments
+    :param int t_repeat: number of timed runs
+    :param t_setup: function without arguments called before each run (not timed), None for nothing
+    :return: (seconds, peak bytes) tuple
+    :rtype: tuple
+    """
+
+    best = None
+    for _ in range(t_repeat):
+        if t_setup is not None:
+            t_setup()
+
+        start = time.perf_counter()
+        t_function()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    # the memory is traced in another run: tracing slows down the allocations
+    if t_setup is not None:
+        t_setup()
+
+    tracemalloc.start()
+    try:
+        t_function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return best, peak
+
+
+def run_workload(t_workload, t_repeat, t_output):
+
+    """Times the hot paths on a workload.
+
+    :param dict t_workload: workload (see :func:`write_workload()`)
+    :param int t_repeat: number of timed runs
+    :param str t_output: path of the rendered output
+    :return results: list of result dictionaries
+    :rtype results: list
+    """
+
+    regex_pattern = templately.re_builder("{{", "ty.", "}}")
+    args = {"<output>": t_output, "<placeholder=file>": t_workload["placeholders"]}
+    renders = t_workload["renders"]
+
+    with open(t_workload["template"], "r") as fin:
+        template_text = fin.read()
+
+    def scan():
+        return templately.get_placeholders(io.StringIO(template_text), regex_pattern)
+
+    template_placeholders = scan()
+
+    def check():
+        if not templately.check_placeholder_arguments(args, template_placeholders):
+            raise ValueError("the placeholders of the workload " + t_workload["name"] + " aren't valid")
+
+    def build():
+        for _ in range(renders):
+            templately.output_builder(io.StringIO(template_text), args, regex_pattern)
+
+    results = []
+    # the files to inject are read from the disk once for each run (or once for all the repeated renders)
+    for function, callback, setup in (("get_placeholders", scan, None),
+                                      ("check_placeholder_arguments", check, None),
+                                      ("output_builder", build, templately.fragment_cache.clear)):
+        seconds, peak = measure(callback, t_repeat, setup)
+        results.append({"workload": t_workload["name"],
+                        "function": function,
+                        "seconds": seconds,
+                        "peak_bytes": peak,
+                        "calls": renders if function == "output_builder" else 1,
+                        "size": t_workload["size"]})
+
+    return results
+
+
+def cold_start(t_dir, t_runs):
+
+    """Measures the median time of a tiny render in a new process, and the peak RSS of those processes.
+
+    :param str t_dir: folder of the files
+    :param int t_runs: number of processes
+    :return result: result dictionary
+    :rtype result: dict
+    """
+
+    template = os.path.join(t_dir, "cold.txt")
+    fragment = os.path.join(t_dir, "cold_fragment.txt")
+    with open(template, "w") as fout:
+        fout.write("Hello {{ ty.name }}!\n")
+    with open(fragment, "w") as fout:
+        fout.write("world")
+
+    command = [sys.executable, os.path.join(TEMPLATELY_DIR, "templately.py"), template,
+               os.path.join(t_dir, "cold_output.txt"), "name=" + fragment]
+
+    timings = []
+    for _ in range(t_runs):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - start)
+
+    # the peak RSS of the terminated children (the cold start processes are the only children)
+    peak = None
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    except ImportError:
+        pass
+
+    return {"workload": "cold_start",
+            "function": "templately.py",
+            "seconds": statistics.median(timings),
+            "peak_bytes": peak,
+            "calls": 1,
+            "size": {"runs": t_runs}}
+
+
+def compare(t_results, t_previous, t_max_slowdown):
+
+    """Prints the ratio between each time and the one of a previous run, returns the results that got slower.
+
+    :param list t_results: results of this run
+    :param dict t_previous: JSON document of the previous run
+    :param float t_max_slowdown: maximum ratio between a time and the previous one
+    :return slower: (workload, function, ratio) tuples of the results over the maximum ratio
+    :rtype slower: list
+    """
+
+    previous = dict(((result["workload"], result["function"]), result) for result in t_previous.get("results", []))
+    slower = []
+
+    print()
+    print("{:<18} {:<28} {:>12} {:>12} {:>8}".format("workload", "function", "previous ms", "ms", "ratio"))
+
+    for result in t_results:
+        key = (result["workload"], result["function"])
+        if key not in previous:
+            continue
+
+        # workloads of a different size aren't comparable
+        if previous[key]["size"] != result["size"] or previous[key]["calls"] != result["calls"]:
+            print("{:<18} {:<28} {:>12} {:>12}".format(key[0], key[1], "other size", ""))
+            continue
+
+        ratio = result["seconds"] / previous[key]["seconds"] if previous[key]["seconds"] > 0 else 1.0
+        print("{:<18} {:<28} {:>12.2f} {:>12.2f} {:>8.2f}".format(key[0], key[1], previous[key]["seconds"] * 1000,
+                                                                  result["seconds"] * 1000, ratio))
+
+        if ratio > t_max_slowdown:
+            slower.append((key[0], key[1], ratio))
+
+    return slower
+
+
+if __name__ == "__main__":
+
+    arguments = docopt(__doc__)
+
+    repeat = int(arguments['--repeat'])
+    scale = float(arguments['--scale'])
+    runs = int(arguments['--runs'])
+    max_slowdown = float(arguments['--max-slowdown'])
+
+    # the placeholders are checked quietly, a workload that isn't valid raises an error
+    templately.testmode = True
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # the cold start goes first: the peak RSS of the children must be the one of the cold start processes
+        results.append(cold_start(tmp, runs))
+
+        for workload in generate_workloads(tmp, scale):
+            results.extend(run_workload(workload, repeat, os.path.join(tmp, "output.txt")))
+
+    print("{:<18} {:<28} {:>12} {:>12}".format("workload", "function", "ms", "peak MB"))
+    for result in results:
+        peak = "" if result["peak_bytes"] is None else "{:.2f}".format(result["peak_bytes"] / (1024 * 1024))
+        print("{:<18} {:<28} {:>12.2f} {:>12}".format(result["workload"], result["function"],
+                                                      result["seconds"] * 1000, peak))
+
+    document = {"version": RESULTS_VERSION,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "scale": scale,
+                "repeat": repeat,
+                "results": results}
+
+    if arguments['--output'] == "-":
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    else:
+        with open(arguments['--output'], "w") as fout:
+            json.dump(document, fout, indent=2)
+
+    if arguments['--compare']:
+        with open(arguments['--compare'], "r") as fin:
+            slower = compare(results, json.load(fin), max_slowdown)
+
+        if slower:
+            print("Slower than the previous run: " + ", ".join("{} {} ({:.2f}x)".format(*item) for item in slower),
+                  file=sys.stderr)
+            sys.exit(1)
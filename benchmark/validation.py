@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+
+Compares the placeholder validation of validate_placeholders() (one pass with dictionaries)
+with the previous one: has_duplicates() with list.count() in a loop (quadratic)
+and equal_vectors() with two sorted copies.
+
+For each size the template and the input have the same names in a different order,
+plus one duplicate on each side (the worst case for the previous has_duplicates(), which stops at the first one).
+The previous functions are skipped above --legacy-max, they would take hours.
+
+The time per placeholder of validate_placeholders() must stay about the same at every size:
+if it grows more than --max-growth times from the smallest to the largest size, the exit status is 1.
+> The dictionaries of the largest sizes don't fit in the CPU caches, which makes each name a bit slower:
+> a quadratic validation would grow as much as the ratio of the sizes (300 times with the default sizes)
+
+Usage:
+ validation.py [--sizes=<list>] [--legacy-max=<n>] [--max-growth=<x>]
+ validation.py (-h | --help)
+
+Options:
+ -h --help              Show this screen.
+ --sizes=<list>         Comma separated numbers of placeholders [default: 1000,10000,100000,300000].
+ --legacy-max=<n>       Largest size measured with the previous functions [default: 10000].
+ --max-growth=<x>       Maximum growth of the time per placeholder [default: 5].
+"""
+
+import os
+import random
+import sys
+import time
+
+from docopt import docopt
+
+# add to the python path the folder with templately
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "templately"))
+
+import templately  # noqa: E402
+
+
+def legacy_has_duplicates(t_vector):
+
+    """has_duplicates() as it was: list.count() for each element.
+
+    :param list t_vector: list with elements
+    :return: True if the list contains duplicates
+    :rtype: bool
+    """
+
+    i = 0
+    contains_duplicates = False
+
+    while i < len(t_vector) and not contains_duplicates:
+        if t_vector.count(t_vector[i]) > 1:
+            contains_duplicates = True
+        i += 1
+
+    return contains_duplicates
+
+
+def legacy_equal_vectors(t_v1, t_v2):
+
+    """equal_vectors() as it was: the sorted copies are compared.
+
+    :param list t_v1: first list of elements
+    :param list t_v2: second list of elements
+    :return: True if the lists have the same elements
+    :rtype: bool
+    """
+
+    t_v1_copy = t_v1[:]
+    t_v2_copy = t_v2[:]
+    t_v1_copy.sort()
+    t_v2_copy.sort()
+
+    return t_v1_copy == t_v2_copy
+
+
+def generate_names(t_size):
+
+    """Returns the placeholders of the template and of the input, with a duplicate at the end of both.
+
+    :param int t_size: number of distinct names
+    :return: (template names, input names) tuple
+    :rtype: tuple
+    """
+
+    names = ["placeholder" + str(i) for i in range(t_size)]
+    shuffled = names[:]
+    random.Random(t_size).shuffle(shuffled)
+
+    return names + [names[-1]], shuffled + [shuffled[-1]]
+
+
+def best_time(t_function, t_repeat=3):
+
+    """Returns the fastest of <t_repeat> runs of <t_function>, in seconds.
+
+    :param t_function: function without arguments
+    :param int t_repeat: number of runs
+    :return: seconds
+    :rtype: float
+    """
+
+    best = None
+    for _ in range(t_repeat):
+        start = time.perf_counter()
+        t_function()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+if __name__ == "__main__":
+
+    arguments = docopt(__doc__)
+
+    sizes = sorted(int(size) for size in arguments['--sizes'].split(","))
+    legacy_max = int(arguments['--legacy-max'])
+    max_growth = float(arguments['--max-growth'])
+
+    print("{:>10} {:>14} {:>14} {:>14}".format("names", "previous ms", "report ms", "report ns/name"))
+
+    per_name = []
+    for size in sizes:
+        template_names, input_names = generate_names(size)
+
+        report_seconds = best_time(lambda: templately.validate_placeholders(template_names, input_names))
+        per_name.append(report_seconds / size)
+
+        legacy = "skipped"
+        if size <= legacy_max:
+            legacy_seconds = best_time(lambda: (legacy_has_duplicates(input_names),
+                                                legacy_has_duplicates(template_names),
+                                                legacy_equal_vectors(input_names, template_names)), 1)
+            legacy = "{:.2f}".format(legacy_seconds * 1000)
+
+        print("{:>10} {:>14} {:>14.2f} {:>14.1f}".format(size, legacy, report_seconds * 1000, per_name[-1] * 1e9))
+
+    growth = per_name[-1] / per_name[0]
+    print("Growth of the time per name from {} to {} names: {:.2f}x (maximum {:.2f}x)".format(sizes[0], sizes[-1],
+                                                                                              growth, max_growth))
+    if growth > max_growth:
+        print("The validation isn't linear!", file=sys.stderr)
+        sys.exit(1)
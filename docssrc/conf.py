@@ -60,18 +60,18 @@ html_static_path = ['_static']
 
 def remove_module_docstring(app, what, name, obj, options, lines):
     '''
-    This function removes the docstring of the module "templately"
+    This function removes the docstring of the module "_templately"
 
     This is done because the docopt docstring format is poorely formatted
     by sphinx.
 
     The docstring is added manually with these lines inside the index.rst file
 
-    .. literalinclude:: ../../templately.py
+    .. literalinclude:: ../../_templately.py
        :start-after: """
        :end-before: """
     '''
-    if what == "module" and name == "templately":
+    if what == "module" and name == "_templately":
         del lines[:]
 
 
@@ -79,7 +79,7 @@ def setup(app):
     '''
     This function determines custom configurations:
     - a new stylesheet is added to use more width for the documentation page
-    - tell autodoc to not import the docstring of "templately" by calling
+    - tell autodoc to not import the docstring of "_templately" by calling
     the remove_module_docstring() function.
     '''
     app.add_css_file('style.css')
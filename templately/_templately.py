@@ -0,0 +1,6486 @@
+# -*- coding: utf-8 -*-
+"""
+
+Templately enables you to inject files content
+inside a main template file.
+
+Usage:
+ templately.py build [--ot=<opening_tag>] [--po=<pattern_opening>] [--ct=<closing_tag>] [--scanner=<name>]
+                     [--dialect=<tags>]... [--incremental] [--stamps=<file>] [--watch] [--debounce=<seconds>]
+                     [--recursive] [--max-depth=<n>] [--client] [--socket=<path>] [--stats=<format>]
+                     [--jobs=<n>] [--glob=<pattern>] [--fragments=<dir>] <src_dir> <out_dir>
+ templately.py [--ot=<opening_tag>] [--po=<pattern_opening>] [--ct=<closing_tag>] [--scanner=<name>]
+                     [--dialect=<tags>]... [--incremental] [--stamps=<file>] [--watch] [--debounce=<seconds>]
+                     [--recursive] [--max-depth=<n>] [--stream] [--chunk-size=<n>] [--engine=<name>]
+                     [--binary] [--cache-dir=<dir>] [--client] [--socket=<path>] [--timeout=<seconds>]
+                     [--stats=<format>] <template> <output> <placeholder=file>...
+ templately.py [--ot=<opening_tag>] [--po=<pattern_opening>] [--ct=<closing_tag>] [--scanner=<name>]
+                     [--dialect=<tags>]... [--incremental] [--stamps=<file>] [--cache-dir=<dir>] [--client]
+                     [--socket=<path>] [--stats=<format>] [--jobs=<n>] --batch=<manifest> <template>
+ templately.py serve [--socket=<path>] [--jobs=<n>]
+ templately.py (-h | --help)
+ templately.py --version
+
+Options:
+ -h --help              Show this screen.
+ --version              Show version.
+ --batch=<manifest>     Render the template once for each row of the manifest file.
+ --jobs=<n>             Number of processes (and threads) that render the rows of the manifest
+                        or the templates of the build, or number of threads that run the requests
+                        of the daemon (by default the number of CPUs).
+ --glob=<pattern>       Glob pattern of the templates, relative to <src_dir> [default: **/*].
+ --fragments=<dir>      Folder with the files to inject, the placeholders are the file names
+                        (by default the "fragments" folder inside <src_dir>).
+ --incremental          Skip the outputs whose template, injected files and tags
+                        didn't change since the last run.
+ --stamps=<file>        Stamp file of the incremental mode [default: .templately-stamps.json].
+ --watch                Keep running and render again the outputs that depend on a changed file.
+ --debounce=<seconds>   Seconds without changes to wait before rendering again [default: 0.2].
+ --stream               Render the template while it is read, in chunks: the memory used
+                        doesn't depend on the template size.
+ --chunk-size=<n>       Number of characters read at a time in stream mode [default: 65536].
+ --dialect=<tags>       More tags, written as "<opening_tag> <pattern_opening> <closing_tag>",
+                        whose placeholders are found together with the ones of --ot, --po and --ct
+                        in the same pass (it can be repeated).
+ --recursive            Expand the placeholders inside the injected files too
+                        (each injected file is expanded once).
+ --max-depth=<n>        Maximum number of nested includes in recursive mode [default: 16].
+ --scanner=<name>       How the placeholders are found: "regex", "find" (str.find, without regex)
+                        or "auto" (the faster of the two, measured at the start of each run) [default: regex].
+ --engine=<name>        Rendering engine: "text" reads the template as text, "mmap" maps it in memory
+                        and renders it as bytes (faster on big templates), "copy" copies the bytes
+                        of the template and of the files inside the kernel [default: text].
+ --binary               Read the template and the files to inject as bytes and write them as they are:
+                        no decoding, encoding or newline translation (the mmap and copy engines
+                        always work this way).
+ --cache-dir=<dir>      Folder of the compiled templates: the placeholder positions found in a template
+                        are saved there (a ".tyc" file per template content and tags) and the next runs
+                        load them instead of scanning the template again.
+ --timeout=<seconds>    Seconds given to each command or URL of the input placeholders
+                        to produce its content [default: 10].
+ --client               Send the command line to the daemon (see serve) instead of running it
+                        in a new process.
+ --socket=<path>        Unix socket of the daemon (by default "templately-<uid>.sock"
+                        inside $XDG_RUNTIME_DIR or inside the temporary folder).
+ --stats=<format>       Print to the standard error the time of each phase, the bytes injected
+                        from each file, the bytes written, the matches and the peak memory:
+                        "text" or "json" (a bare --stats is "text").
+
+
+Details:
+- <template> is the template file, "-" is the standard input (it implies --stream)
+- <output> is the output file, "-" is the standard output
+- <placeholder=file> : * "placeholder" is the string to search inside the template
+                       * "file" is a file path of which contents gets injected inside the template
+                       > "=" is the char that divides placeholder and the file path
+                       * "file" can also be "!<command>" (its standard output is injected)
+                         or an "http://" or "https://" URL (the body of the response is injected):
+                         the commands and the URLs are read at the same time, before rendering
+- build : renders each template of <src_dir> to the same path inside <out_dir>,
+          the placeholders are the files inside the fragments folder
+          > example: {{ ty.ssl/dev.conf }} is substituted by "<fragments>/ssl/dev.conf"
+- <manifest> : * JSON lines file, each line is an object like
+                 {"output": "<output>", "placeholders": {"<placeholder>": "<file>", ...}}
+                 > "placeholders" can also be a list like ["<placeholder>=<file>", ...]
+               * CSV file (".csv" extension) with an "output" column and one column
+                 for each placeholder, the column values are the files to inject
+- serve : keeps running and runs the command lines sent by --client, in the current directory of the client:
+          the compiled templates and the injected files stay cached between the requests
+          > the same arguments work with and without --client (except --watch)
+
+Exit status:
+ 0 success, 1 template not found, 2 bad placeholders, 3 output folder not found,
+ 4 at least one row of the manifest (or template of the build) failed, 5 bad option value,
+ 6 include cycle or too many nested includes (recursive mode),
+ 7 the socket of the daemon can't be reached (--client) or used (serve),
+ 8 a command or a URL of the input placeholders failed or timed out
+"""
+
+__author__ = "Zenaro Stefano"
+__version__ = "01_01 2019-12-21"
+
+import re
+import collections
+import contextlib
+import errno
+import functools
+import io
+import os
+import stat
+import sys
+import threading
+import time
+
+# the modules used only by some modes (docopt, concurrent.futures, csv, ctypes, glob, json, mmap, select, struct)
+# are imported by the functions that need them: templately is started many times, each import slows every start
+
+boold = False     # shows/hides debug messages
+testmode = False  # shows/hides errors (during unit testing error prints are hidden from the caller)
+
+# pattern variables: default variables say "{{ ty.<?> }}", <?> is the placeholder name
+opening_tag = "{{"
+pattern_opening = "ty."
+closing_tag = "}}"
+
+# byte budget of the default cache of the injected files (see the FragmentCache class)
+fragment_cache_max_bytes = 64 * 1024 * 1024
+
+# compiled templates of the same process, by their content hash (see the compile_template_text() function)
+# > at most compiled_templates_max templates, the least recently used are dropped first
+compiled_templates_max = 128
+compiled_templates = collections.OrderedDict()
+compiled_templates_lock = threading.Lock()
+
+# compiled patterns of the tag dialects, built only once per process (see the re_builder() function)
+# > (tags, bytes pattern) -> pattern
+pattern_registry = {}
+
+# kinds of the segments of a compiled template (see the Template class)
+SEGMENT_LITERAL = 0      # text copied as it is to the output
+SEGMENT_PLACEHOLDER = 1  # placeholder substituted by the content of its file
+
+# first bytes of the files of the compiled templates cache, changed with their format (see the TemplateCache class)
+TEMPLATE_CACHE_MAGIC = b"TYC\x01"
+
+# maximum number of nested includes of the recursive mode (see the IncludeExpander class)
+include_max_depth = 16
+
+# seconds the daemon waits for the running requests when it stops (see the RenderServer class)
+stop_timeout = 10.0
+
+# seconds given to each command or URL of the input placeholders (see the resolve_sources() function)
+source_timeout = 10.0
+
+# maximum number of threads that stat the injected files at the same time (see the StatCache class)
+stat_jobs = 16
+
+
+class TemplatelyError(Exception):
+
+    """Base class of the errors raised by templately."""
+
+
+class IncludeError(TemplatelyError):
+
+    """Include cycle, or too many nested includes, found while expanding the injected files.
+
+    :param str t_message: description of the error
+    :param list t_chain: names of the placeholders of the include chain, from the outermost one
+    """
+
+    def __init__(self, t_message, t_chain):
+        super().__init__(t_message + ": " + " -> ".join(t_chain))
+        self.chain = list(t_chain)
+
+
+class PlaceholderError(TemplatelyError, ValueError):
+
+    """The placeholders of the template and the given placeholders are not the same (see :func:`render()`).
+
+    :param list t_missing: placeholders of the template without a value
+    :param list t_extra: given placeholders that aren't inside the template
+    :param list t_duplicates: placeholders repeated inside the template
+    """
+
+    def __init__(self, t_missing, t_extra, t_duplicates):
+
+        problems = []
+        if t_missing:
+            problems.append("missing '" + "', '".join(t_missing) + "'")
+        if t_extra:
+            problems.append("not in the template '" + "', '".join(t_extra) + "'")
+        if t_duplicates:
+            problems.append("repeated in the template '" + "', '".join(t_duplicates) + "'")
+
+        super().__init__("bad placeholders: " + ", ".join(problems))
+        self.missing = list(t_missing)
+        self.extra = list(t_extra)
+        self.duplicates = list(t_duplicates)
+
+
+class SourceError(TemplatelyError):
+
+    """Commands or URLs of the input placeholders that didn't produce their content (see :func:`resolve_sources()`).
+
+    :param list t_failures: (placeholder name, source, reason) tuples
+    """
+
+    def __init__(self, t_failures):
+        super().__init__("; ".join("'" + name + "=" + source + "' " + reason for name, source, reason in t_failures))
+        self.failures = list(t_failures)
+
+
+def re_builder(t_opening_tag, t_pattern_opening, t_closing_tag):
+
+    """Builds the regex pattern string and returns its compiled version.
+
+    The function **escapes t_opening_tag, t_pattern_opening and t_closing_tag**
+    using the :func:`re.escape()` function
+    and then **concatenates them** into a regex pattern string.
+
+    The **regex string gets compiled** with the :func:`re.compile()` function and is returned by the function.
+
+    Usage example:
+
+    >>> regex_pattern = re_builder("{{", "ty.", "}}")
+    >>> print(regex_pattern)
+    re.compile('\\{\\{\\s*ty\\.(.*?)\\s*\\}\\}')
+
+    This regex will match the strings that start with `{{ty.` and end with "}}"
+    > One or more spaces after "{{" and before "}}" are valid
+
+    The compiled patterns are saved inside the module's ``pattern_registry``:
+    the same tags return the same pattern object, without building it again.
+
+    :param str t_opening_tag: patterns opening tag
+    :param str t_pattern_opening: patterns starting string
+    :param str t_closing_tag: patterns closing tag
+    :return t_regex_pattern: compiled regex pattern
+    :rtype: :class:`_sre.SRE_Pattern`
+    """
+
+    if boold:
+        print("Internal vars:")
+        print("t_opening_tag: '" + t_opening_tag + "'")
+        print("t_pattern_opening: '" + t_pattern_opening + "'")
+        print("t_closing_tag: '" + t_closing_tag + "'")
+
+    key = ((t_opening_tag, t_pattern_opening, t_closing_tag), False)
+    if key in pattern_registry:
+        return pattern_registry[key]
+
+    # concatenate escaped t_opening_tag, "\s*" ( num. X of spaces) and escaped t_pattern_opening
+    tmp_repattern_opening = re.escape(t_opening_tag) + r"\s*" + re.escape(t_pattern_opening)
+
+    # concatenate "\s*" ( num. X of spaces) and escaped t_closing_tag
+    tmp_repattern_closing = r"\s*" + re.escape(t_closing_tag)
+
+    # compile the regex pattern, which is the concatenation of tmp_repattern_opening, "(.*?)" and tmp_repattern_closing
+    # > "(.*?)" collects the characters after tmp_repattern_opening and before tmp_repattern_closing
+    t_regex_pattern = re.compile(tmp_repattern_opening + r"(.*?)" + tmp_repattern_closing)
+
+    if boold:
+        print("t_regex_pattern: '", t_regex_pattern, "'")
+
+    pattern_registry[key] = t_regex_pattern
+
+    return t_regex_pattern
+
+
+def re_builder_bytes(t_opening_tag, t_pattern_opening, t_closing_tag):
+
+    """Builds the bytes version of the :func:`re_builder()` regex pattern and returns it compiled.
+
+    The pattern is used on the whole template (not one line at a time, see :class:`MappedTemplate`),
+    so the spaces after the opening tag and before the closing tag can't be newlines:
+    "[^\\S\\n]*" is used instead of "\\s*", this way a placeholder can't span more lines
+    (like the placeholders found by :func:`re_builder()` on a single line).
+
+    The tags are encoded to UTF-8 before being escaped.
+
+    Usage example:
+
+    >>> regex_pattern = re_builder_bytes("{{", "ty.", "}}")
+    >>> print(regex_pattern)
+    re.compile(b'\\{\\{[^\\S\\n]*ty\\.(.*?)[^\\S\\n]*\\}\\}')
+
+    :param str t_opening_tag: patterns opening tag
+    :param str t_pattern_opening: patterns starting string
+    :param str t_closing_tag: patterns closing tag
+    :return t_regex_pattern: compiled bytes regex pattern
+    :rtype: :class:`_sre.SRE_Pattern`
+    """
+
+    key = ((t_opening_tag, t_pattern_opening, t_closing_tag), True)
+    if key in pattern_registry:
+        return pattern_registry[key]
+
+    # spaces that don't end the line
+    spaces = br"[^\S\n]*"
+
+    tmp_repattern_opening = re.escape(t_opening_tag.encode("utf-8")) + spaces \
+        + re.escape(t_pattern_opening.encode("utf-8"))
+    tmp_repattern_closing = spaces + re.escape(t_closing_tag.encode("utf-8"))
+
+    t_regex_pattern = re.compile(tmp_repattern_opening + br"(.*?)" + tmp_repattern_closing)
+
+    if boold:
+        print("t_regex_pattern: '", t_regex_pattern, "'")
+
+    pattern_registry[key] = t_regex_pattern
+
+    return t_regex_pattern
+
+
+def parse_dialect(t_dialect):
+
+    """Returns the (opening tag, pattern opening, closing tag) tuple of the dialect string <t_dialect>.
+
+    The three tags are separated by spaces.
+
+    Example:
+
+    >>> parse_dialect("%% template. %%")
+    ('%%', 'template.', '%%')
+
+    :param str t_dialect: dialect string
+    :return: tags of the dialect
+    :rtype: tuple
+    :raises ValueError: if the string doesn't contain exactly three tags
+    """
+
+    tags = t_dialect.split()
+    if len(tags) != 3:
+        raise ValueError("a dialect is made of three tags: '" + t_dialect + "'")
+
+    return tuple(tags)
+
+
+def re_builder_multi(t_dialects, t_binary=False):
+
+    """Returns the pattern that finds the placeholders of all the tag dialects <t_dialects> in a single pass.
+
+    Each dialect is a (opening tag, pattern opening, closing tag) tuple:
+    the patterns built by :func:`re_builder()` (:func:`re_builder_bytes()` if <t_binary>)
+    are joined into one alternation (see :class:`DialectPattern`).
+    A single dialect returns its own pattern.
+
+    Like :func:`re_builder()`, the patterns are saved inside the module's ``pattern_registry``.
+
+    Example:
+
+    >>> regex_pattern = re_builder_multi([("{{", "ty.", "}}"), ("%%", "template.", "%%")])
+    >>> regex_pattern.findall("{{ ty.a }} %% template.b %%")
+    ['a', 'b']
+
+    :param list t_dialects: list of (opening tag, pattern opening, closing tag) tuples
+    :param bool t_binary: build the bytes pattern
+    :return: pattern of the dialects
+    :rtype: :class:`_sre.SRE_Pattern` or :class:`DialectPattern`
+    """
+
+    t_dialects = tuple(tuple(dialect) for dialect in t_dialects)
+
+    builder = re_builder_bytes if t_binary else re_builder
+    if len(t_dialects) == 1:
+        return builder(*t_dialects[0])
+
+    key = (t_dialects, t_binary)
+    if key not in pattern_registry:
+        pattern_registry[key] = DialectPattern([builder(*dialect) for dialect in t_dialects])
+
+    return pattern_registry[key]
+
+
+class DialectPattern:
+
+    """Regex pattern of more tag dialects, with the same methods of a regex pattern that templately uses.
+
+    The patterns are joined into a single alternation, this way the text is scanned once:
+    the first placeholder of any dialect is found, if more dialects match at the same position
+    the first of <t_patterns> wins. Each pattern has only one group (the placeholder name),
+    the name of a match is the group of the pattern that matched.
+
+    :param list t_patterns: compiled patterns (all str or all bytes patterns)
+    """
+
+    def __init__(self, t_patterns):
+
+        sources = [pattern.pattern for pattern in t_patterns]
+
+        # each pattern becomes a non capturing group of the alternation
+        if isinstance(sources[0], bytes):
+            self.regex = re.compile(b"|".join(b"(?:" + source + b")" for source in sources))
+        else:
+            self.regex = re.compile("|".join("(?:" + source + ")" for source in sources))
+        self.pattern = self.regex.pattern
+
+    def finditer(self, t_text, t_pos=0, t_endpos=None):
+
+        """Yields the placeholders of <t_text> between <t_pos> and <t_endpos>, like ``Pattern.finditer()``.
+
+        :param t_text: text to scan
+        :param int t_pos: position from which the placeholders are sought
+        :param int t_endpos: position where the search ends, by default the end of the text
+        :return: generator of :class:`TagMatch` objects
+        :rtype: generator
+        """
+
+        if t_endpos is None:
+            matches = self.regex.finditer(t_text, t_pos)
+        else:
+            matches = self.regex.finditer(t_text, t_pos, t_endpos)
+
+        for match in matches:
+            # the only group that took part in the match is the name of its dialect
+            yield TagMatch(match.start(), match.end(), match.group(match.lastindex))
+
+    def findall(self, t_text):
+
+        """Returns the names of the placeholders of <t_text>, like ``Pattern.findall()``.
+
+        :param t_text: text to scan
+        :return: list of the placeholder names
+        :rtype: list
+        """
+
+        return [match.group(1) for match in self.finditer(t_text)]
+
+
+class TagMatch:
+
+    """Placeholder found by :class:`TagScanner`, with the same methods of a regex match that templately uses.
+
+    :param int t_start: position of the opening tag
+    :param int t_end: position after the closing tag
+    :param t_name: placeholder name
+    :type t_name: str or bytes
+    """
+
+    __slots__ = ("_start", "_end", "_name")
+
+    def __init__(self, t_start, t_end, t_name):
+        self._start = t_start
+        self._end = t_end
+        self._name = t_name
+
+    def start(self):
+        return self._start
+
+    def end(self):
+        return self._end
+
+    def group(self, t_group=0):
+        # the only group of the regex pattern is the placeholder name
+        return self._name
+
+
+class TagScanner:
+
+    """Finds the placeholders without regex: it can be used instead of the :func:`re_builder()` pattern.
+
+    :meth:`finditer()` jumps to the next opening tag with ``str.find()``/``bytes.find()``,
+    then it skips the spaces, checks the pattern opening and looks for the closing tag by hand.
+    The matches are the same of the regex pattern:
+    - text scanners match like :func:`re_builder()`, "\\s*" spaces
+    - bytes scanners (<t_binary>) match like :func:`re_builder_bytes()`, spaces that aren't newlines
+    > The placeholder name can't contain newlines
+
+    The scanner gives the same matches only if the opening and the closing tags aren't empty,
+    and if the pattern opening and the closing tag don't start with a space (see :meth:`supports()`).
+
+    Example:
+
+    >>> scanner = TagScanner("{{", "ty.", "}}")
+    >>> [match.group(1) for match in scanner.finditer("{{ ty.a }} {{ty.b}}")]
+    ['a', 'b']
+
+    :param t_opening_tag: patterns opening tag
+    :type t_opening_tag: str or bytes
+    :param t_pattern_opening: patterns starting string
+    :type t_pattern_opening: str or bytes
+    :param t_closing_tag: patterns closing tag
+    :type t_closing_tag: str or bytes
+    :param bool t_binary: scan bytes (the tags are encoded to UTF-8)
+    """
+
+    def __init__(self, t_opening_tag, t_pattern_opening, t_closing_tag, t_binary=False):
+
+        if t_binary:
+            t_opening_tag = t_opening_tag.encode("utf-8")
+            t_pattern_opening = t_pattern_opening.encode("utf-8")
+            t_closing_tag = t_closing_tag.encode("utf-8")
+
+        self.opening_tag = t_opening_tag
+        self.pattern_opening = t_pattern_opening
+        self.closing_tag = t_closing_tag
+        self.binary = t_binary
+
+    @staticmethod
+    def supports(t_opening_tag, t_pattern_opening, t_closing_tag):
+
+        """Returns True if the scanner finds the same placeholders of the regex pattern of these tags.
+
+        :param str t_opening_tag: patterns opening tag
+        :param str t_pattern_opening: patterns starting string
+        :param str t_closing_tag: patterns closing tag
+        :return: True if the scanner can replace the regex pattern
+        :rtype: bool
+        """
+
+        # the regex would give back some of the spaces it skipped to match these tags
+        return t_opening_tag != "" and t_closing_tag != "" and not t_pattern_opening[:1].isspace() \
+            and not t_closing_tag[:1].isspace()
+
+    def _is_space(self, t_char):
+
+        # bytes scanners don't skip the newlines, like "[^\S\n]"
+        if self.binary:
+            return t_char in b" \t\r\x0b\x0c"
+
+        return t_char.isspace()
+
+    def finditer(self, t_text, t_pos=0, t_endpos=None):
+
+        """Yields the placeholders of <t_text> between <t_pos> and <t_endpos>, like ``Pattern.finditer()``.
+
+        :param t_text: text to scan (str, or bytes-like object with a find() method for bytes scanners)
+        :param int t_pos: position from which the placeholders are sought
+        :param int t_endpos: position where the search ends, by default the end of the text
+        :return: generator of :class:`TagMatch` objects
+        :rtype: generator
+        """
+
+        if t_endpos is None:
+            t_endpos = len(t_text)
+
+        find = t_text.find
+        newline = b"\n" if self.binary else "\n"
+        opening_length = len(self.opening_tag)
+        pattern_length = len(self.pattern_opening)
+        closing_length = len(self.closing_tag)
+
+        i = find(self.opening_tag, t_pos, t_endpos)
+        while i != -1:
+
+            # skip the spaces after the opening tag
+            j = i + opening_length
+            while j < t_endpos and self._is_space(t_text[j]):
+                j += 1
+
+            if j + pattern_length <= t_endpos and t_text[j:j + pattern_length] == self.pattern_opening:
+
+                # the name ends at the first closing tag, without the spaces before it
+                name_start = j + pattern_length
+                closing = find(self.closing_tag, name_start, t_endpos)
+                if closing != -1:
+                    name_end = closing
+                    while name_end > name_start and self._is_space(t_text[name_end - 1]):
+                        name_end -= 1
+
+                    if find(newline, name_start, name_end) == -1:
+                        yield TagMatch(i, closing + closing_length, t_text[name_start:name_end])
+
+                        i = find(self.opening_tag, closing + closing_length, t_endpos)
+                        continue
+
+            # this opening tag isn't a placeholder
+            i = find(self.opening_tag, i + 1, t_endpos)
+
+    def findall(self, t_text):
+
+        """Returns the names of the placeholders of <t_text>, like ``Pattern.findall()``.
+
+        :param t_text: text to scan
+        :return: list of the placeholder names
+        :rtype: list
+        """
+
+        return [match.group(1) for match in self.finditer(t_text)]
+
+
+def compile_pattern(t_pattern):
+
+    """Returns the compiled version of the regex pattern string <t_pattern>.
+
+    Compiled patterns and scanners (like :class:`TagScanner`) are returned unchanged.
+
+    :param t_pattern: regex pattern
+    :type t_pattern: str, bytes, :class:`_sre.SRE_Pattern` or :class:`TagScanner`
+    :return: object with the finditer() method
+    """
+
+    if isinstance(t_pattern, (str, bytes)):
+        return re.compile(t_pattern)
+
+    return t_pattern
+
+
+@functools.lru_cache(maxsize=None)
+def make_scanner(t_opening_tag, t_pattern_opening, t_closing_tag, t_kind="regex", t_binary=False, t_dialects=()):
+
+    """Returns the object that finds the placeholders: the regex pattern or the :class:`TagScanner`.
+
+    <t_kind> can be:
+    - "regex": the :func:`re_builder()` pattern (:func:`re_builder_bytes()` if <t_binary>)
+    - "find": the :class:`TagScanner`, it raises ValueError if it doesn't support the tags
+    - "auto": the faster of the two, measured once per process on a sample template
+    (the regex pattern if the scanner doesn't support the tags)
+    > The measure takes a few milliseconds, more than a small render: "auto" is used only if requested
+
+    <t_dialects> are more (opening tag, pattern opening, closing tag) tuples matched together with the tags:
+    their placeholders are found by the single pattern of :func:`re_builder_multi()`
+    > The "find" scanner supports only one dialect
+
+    The result is cached: the same arguments return the same object.
+
+    Example:
+
+    >>> isinstance(make_scanner("{{", "ty.", "}}", "find"), TagScanner)
+    True
+
+    :param str t_opening_tag: patterns opening tag
+    :param str t_pattern_opening: patterns starting string
+    :param str t_closing_tag: patterns closing tag
+    :param str t_kind: "regex", "find" or "auto"
+    :param bool t_binary: find the placeholders inside bytes
+    :param tuple t_dialects: tuple of more (opening tag, pattern opening, closing tag) tuples
+    :return: object with the finditer() method
+    :rtype: :class:`_sre.SRE_Pattern`, :class:`DialectPattern` or :class:`TagScanner`
+    """
+
+    if t_kind not in ("regex", "find", "auto"):
+        raise ValueError("unknown scanner: '" + t_kind + "'")
+
+    if t_dialects:
+        if t_kind == "find":
+            raise ValueError("the find scanner supports only one dialect")
+        return re_builder_multi(((t_opening_tag, t_pattern_opening, t_closing_tag),) + tuple(t_dialects), t_binary)
+
+    if t_binary:
+        regex_pattern = re_builder_bytes(t_opening_tag, t_pattern_opening, t_closing_tag)
+    else:
+        regex_pattern = re_builder(t_opening_tag, t_pattern_opening, t_closing_tag)
+
+    if t_kind == "regex":
+        return regex_pattern
+
+    if not TagScanner.supports(t_opening_tag, t_pattern_opening, t_closing_tag):
+        if t_kind == "find":
+            raise ValueError("the find scanner doesn't support these tags")
+        return regex_pattern
+
+    scanner = TagScanner(t_opening_tag, t_pattern_opening, t_closing_tag, t_binary)
+
+    if t_kind == "find":
+        return scanner
+
+    return calibrate_scanner(regex_pattern, scanner, t_opening_tag, t_pattern_opening, t_closing_tag, t_binary)
+
+
+def calibrate_scanner(t_regex_pattern, t_scanner, t_opening_tag, t_pattern_opening, t_closing_tag, t_binary=False):
+
+    """Returns the faster of <t_regex_pattern> and <t_scanner>, measured on a sample template.
+
+    The sample template is mostly text, with a placeholder (made of the given tags) every few lines.
+
+    :param t_regex_pattern: regex pattern of the tags
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :param TagScanner t_scanner: scanner of the same tags
+    :param str t_opening_tag: patterns opening tag
+    :param str t_pattern_opening: patterns starting string
+    :param str t_closing_tag: patterns closing tag
+    :param bool t_binary: the placeholders are found inside bytes
+    :return: the faster of the two
+    :rtype: :class:`_sre.SRE_Pattern` or :class:`TagScanner`
+    """
+
+    # sample template: mostly text, with a placeholder every few lines
+    line = "plain text of a template line, without placeholders\n" * 7 \
+        + "key: " + t_opening_tag + " " + t_pattern_opening + "name " + t_closing_tag + "\n"
+    lines = [line] * 64
+    if t_binary:
+        # bytes are scanned as a whole (see MappedTemplate), text one line at a time (see Template)
+        lines = ["".join(lines).encode("utf-8")]
+    else:
+        lines = "".join(lines).splitlines(True)
+
+    timings = [time_scanner(candidate, lines) for candidate in (t_regex_pattern, t_scanner)]
+
+    if boold:
+        print("scanner timings (regex, find):", timings)
+
+    if timings[1] < timings[0]:
+        return t_scanner
+
+    return t_regex_pattern
+
+
+def time_scanner(t_scanner, t_texts, t_repeat=3):
+
+    """Returns the best time (in seconds) taken by <t_scanner> to find every placeholder of <t_texts>.
+
+    :param t_scanner: object with the finditer() method
+    :param list t_texts: texts to scan
+    :param int t_repeat: number of measures, the best one is returned
+    :return best: best time in seconds
+    :rtype best: float
+    """
+
+    best = None
+
+    for _ in range(t_repeat):
+        start = time.perf_counter()
+        for text in t_texts:
+            for _match in t_scanner.finditer(text):
+                pass
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+
+def get_placeholders(t_fin, t_regex_pattern):
+
+    """Reads the lines of <t_fin> (template file) one by one and returns the placeholders.
+
+    The file is read one line at the time and the regex pattern
+    is used to search for the placeholders inside the line
+
+    Example:
+
+    cat template.txt
+    this is
+    {{ ty.placeholder1 }} a {{ ty.placeholder2 }}
+    test {{ ty.placeholder3 }}
+    EOF
+
+    >>> get_placeholders(t_fin, '\\{\\{\\s*ty\\.(.*?)\\s*\\}\\}')
+    ["placeholder1", "placeholder2", "placeholder3"]
+
+    :param t_fin: template file
+    :type t_fin: :class:`_io.TextIO`
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :return t_placeholders: list of template placeholders
+    :rtype t_placeholders: list
+    """
+
+    # list of the template placeholder
+    t_placeholders = []
+
+    # read the first line of the file
+    line = t_fin.readline()
+
+    # loop through the file
+    while line != "":
+
+        t_placeholders += re.findall(t_regex_pattern, line)
+
+        # read the next line
+        line = t_fin.readline()
+
+    return t_placeholders
+
+
+def equal_vectors(t_v1, t_v2):
+
+    """Checks if the vectors are equal
+
+    The vectors are equal if they have the same elements, the order doesn't matter:
+    the occurrences of each element of the two vectors are counted (with a dictionary, in linear time)
+    and the counts are compared.
+    > The vectors have to have the same elements, which means that
+    > they also have to have the same number of elements
+
+    :param list t_v1: first list of elements
+    :param list t_v2: second list of elements
+    :return are_equal: boolean value that indicates if t_v1 and t_v2 are equal
+    :rtype are_equal: bool
+    :raises TypeError: if an element can't be counted (it isn't hashable, like a list)
+    """
+
+    # vectors with a different length can't have the same elements
+    if len(t_v1) != len(t_v2):
+        return False
+
+    try:
+        return collections.Counter(t_v1) == collections.Counter(t_v2)
+    except TypeError:
+        raise TypeError("Can't compare vectors with unhashable elements")
+
+
+def has_duplicates(t_vector):
+
+    """Checks if there are duplicates inside the passed vector
+
+    The function loops for each element inside the vector, the loop
+    stops if the vector ends or if a duplicate element is found.
+    > The elements already seen are kept in a set: each element is checked in constant time
+
+    :param list t_vector: list with elements
+    :return contains_duplicates: boolean, True if the list t_vector contains duplicates, False otherwise
+    :rtype contains_duplicates: bool
+    :raises TypeError: if an element isn't hashable
+    """
+
+    seen = set()
+
+    # loop for each element inside the vector
+    # stop if a duplicate element is found
+    for element in t_vector:
+        if element in seen:
+            return True
+        seen.add(element)
+
+    return False
+
+
+class PlaceholderReport:
+
+    """Result of the validation of the placeholders of a template against the input placeholders.
+
+    The placeholders are valid if the template has at least one placeholder, no name is repeated
+    (inside the template or inside the input) and the two sides have the same names.
+    Each list keeps the order in which the names are found.
+
+    :param list t_missing: names of the template without an input placeholder
+    :param list t_extra: names of the input that aren't inside the template
+    :param list t_template_duplicates: names repeated inside the template
+    :param list t_input_duplicates: names repeated inside the input
+    :param bool t_empty_template: the template has no placeholders
+    """
+
+    def __init__(self, t_missing, t_extra, t_template_duplicates, t_input_duplicates, t_empty_template=False):
+
+        self.missing = t_missing
+        self.extra = t_extra
+        self.template_duplicates = t_template_duplicates
+        self.input_duplicates = t_input_duplicates
+        self.empty_template = t_empty_template
+
+    @property
+    def valid(self):
+
+        """True if the placeholders are valid."""
+
+        return not (self.missing or self.extra or self.template_duplicates or self.input_duplicates
+                    or self.empty_template)
+
+    def as_dict(self):
+
+        """Returns the report as a dictionary (it can be written as JSON).
+
+        :return: dictionary with the "valid" key and one key for each attribute, in this order
+        :rtype: :class:`collections.OrderedDict`
+        """
+
+        return collections.OrderedDict((("valid", self.valid),
+                                        ("missing", self.missing),
+                                        ("extra", self.extra),
+                                        ("template_duplicates", self.template_duplicates),
+                                        ("input_duplicates", self.input_duplicates),
+                                        ("empty_template", self.empty_template)))
+
+    def __repr__(self):
+        return "PlaceholderReport(" + ", ".join(key + "=" + repr(value) for key, value in self.as_dict().items()) + ")"
+
+
+def count_names(t_names):
+
+    """Returns the name -> number of occurrences dictionary of <t_names>, in the order the names are found.
+
+    :param t_names: names (any iterable, a dictionary is counted by its keys)
+    :return counts: number of occurrences of each name
+    :rtype counts: :class:`collections.OrderedDict`
+    """
+
+    counts = collections.OrderedDict()
+    for name in t_names:
+        counts[name] = counts.get(name, 0) + 1
+
+    return counts
+
+
+def validate_placeholders(t_template_placeholders, t_input_names):
+
+    """Validates the placeholders of a template against the input placeholder names, in linear time.
+
+    Each side is counted once with a dictionary, then the names of each side are looked up in the other one:
+    the time grows with the number of placeholders (not with its square),
+    this way templates and inputs with hundreds of thousands of placeholders are validated quickly.
+
+    Example:
+
+    >>> validate_placeholders(["a", "b", "b"], ["a", "c", "c"])
+    PlaceholderReport(valid=False, missing=['b'], extra=['c'], template_duplicates=['b'], input_duplicates=['c'],
+    empty_template=False)
+
+    :param list t_template_placeholders: names of the placeholders of the template
+    :param t_input_names: names of the input placeholders (any iterable, like the keys of a dictionary)
+    :return report: what is wrong with the placeholders
+    :rtype report: :class:`PlaceholderReport`
+    """
+
+    # name -> number of occurrences, in the order the names are found
+    # > a Counter isn't ordered before Python 3.7
+    template_counts = count_names(t_template_placeholders)
+    input_counts = count_names(t_input_names)
+
+    return PlaceholderReport([name for name in template_counts if name not in input_counts],
+                             [name for name in input_counts if name not in template_counts],
+                             [name for name, count in template_counts.items() if count > 1],
+                             [name for name, count in input_counts.items() if count > 1],
+                             len(template_counts) == 0)
+
+
+def format_names(t_names, t_limit=10):
+
+    """Returns the names as a "'a', 'b', ..." string for the error messages, at most <t_limit> of them are shown.
+
+    :param list t_names: names
+    :param int t_limit: maximum number of names shown
+    :return: names
+    :rtype: str
+    """
+
+    text = "'" + "', '".join(t_names[:t_limit]) + "'"
+    if len(t_names) > t_limit:
+        text += " and " + str(len(t_names) - t_limit) + " more"
+
+    return text
+
+
+def check_input_placeholders(t_placeholders, t_stat_cache=None):
+
+    """Makes sure that all the input placeholders are correct
+
+    Specifically it checks if the placeholders contain only one equal sign,
+    and if the file paths exist.
+    The function returns a dictionary with the check result, the name
+    of the placeholders and the index of the valid placeholders.
+
+    The index associates each valid placeholder name to the path of its file,
+    this way the input placeholders are parsed only once: the renderer
+    (:func:`output_builder()`, :meth:`Template.render()`) finds a file with a single dictionary lookup.
+    > If a name is repeated, the index keeps the first file (the duplicate is an error anyway)
+
+    Example:
+
+    >>> check_input_placeholders(["a=file1.txt", "b=missing.txt"])
+    {"correct_placeholder": False, "placeholders_names": ["a", "b"], "placeholders_index": {"a": "file1.txt"}}
+
+    The files are stat'ed all at the same time with <t_stat_cache> (see :class:`StatCache`),
+    which keeps the results for the renderer: each file is stat'ed at most once in a run.
+
+    :param list t_placeholders: list of input placeholders
+    :param StatCache t_stat_cache: stat results of the run, None to use a new one
+    :return check_result: dictionary with a bool check result, a list with placeholders names
+                          and a dictionary with the valid placeholders names and their file paths
+    :rtype check_result: dict
+    """
+
+    # dictionary that gets returned by the function
+    check_result = {"correct_placeholder": True,  # all the checks are positive
+                    "placeholders_names": [],     # vector with the placeholder names
+                    "placeholders_index": {}      # placeholder name -> file path, only valid placeholders
+                    }
+
+    # check if there is at least one placeholder
+    # > this shouldn't happen since docopt requires at least one placeholder, otherwise it shows the help screen,
+    # > better be safe than sorry
+    if len(t_placeholders) == 0:
+        if not testmode:
+            print("Bad placeholders: the input doesn't have placeholders", file=sys.stderr)
+        check_result["correct_placeholder"] = False
+
+    # stat all the files at the same time, instead of one after the other in the loop
+    if t_stat_cache is None:
+        t_stat_cache = StatCache()
+    t_stat_cache.prefetch(placeholder.partition("=")[2] for placeholder in t_placeholders
+                          if placeholder.count("=") == 1)
+
+    # loop for each placeholder
+    for placeholder in t_placeholders:
+        # the placeholder has to have one equal sign
+        if placeholder.count("=") == 1:
+
+            # split the placeholder name from the file path
+            placeholder_name, _, file_path = placeholder.partition("=")
+
+            # add the name to the vector inside the check_result dict
+            check_result["placeholders_names"].append(placeholder_name)
+
+            # check if the file exists
+            if not t_stat_cache.isfile(file_path):
+                if not testmode:
+                    print("File to inject doesn't exist: '" + placeholder + "'", file=sys.stderr)
+                check_result["correct_placeholder"] = False
+
+            elif placeholder_name not in check_result["placeholders_index"]:
+                # the placeholder is valid, index it
+                check_result["placeholders_index"][placeholder_name] = file_path
+        else:
+            if not testmode:
+                print("Bad placeholder (use one '=' per placeholder): '" + placeholder + "'", file=sys.stderr)
+            check_result["correct_placeholder"] = False
+
+    return check_result
+
+
+def index_input_placeholders(t_placeholders):
+
+    """Parses the input placeholders into a dictionary with placeholder names as keys and file paths as values.
+
+    Unlike :func:`check_input_placeholders()` no check is made (and nothing is printed):
+    placeholders without exactly one equal sign are ignored and,
+    if a name is repeated, the first file is kept.
+
+    Example:
+
+    >>> index_input_placeholders(["placeholder1=file1.txt", "placeholder2=file2.txt"])
+    {"placeholder1": "file1.txt", "placeholder2": "file2.txt"}
+
+    :param list t_placeholders: list of input placeholders
+    :return placeholders_index: dictionary with placeholder names as keys and file paths as values
+    :rtype placeholders_index: dict
+    """
+
+    placeholders_index = {}
+
+    for placeholder in t_placeholders:
+        if placeholder.count("=") == 1:
+            placeholder_name, _, file_path = placeholder.partition("=")
+
+            if placeholder_name not in placeholders_index:
+                placeholders_index[placeholder_name] = file_path
+
+    return placeholders_index
+
+
+def is_source(t_value):
+
+    """Checks if the value of an input placeholder is a source instead of a file path.
+
+    A source is "!<command>" (its standard output is injected) or an "http://" or "https://" URL
+    (the body of the response is injected), see :func:`resolve_sources()`.
+    > A source can contain "=" (like the URL query), a file path can't
+    > An existing file is always a file, even if its path looks like a source: it is never run
+
+    :param str t_value: value of the input placeholder, after the first "="
+    :return: True if the value is a source
+    :rtype: bool
+    """
+
+    if not (t_value.startswith("!") or t_value[:8].lower().startswith(("http://", "https://"))):
+        return False
+
+    return not os.path.exists(t_value)
+
+
+def run_loop(t_coroutine):
+
+    """Runs the coroutine <t_coroutine> inside a new event loop of the calling thread and returns its result.
+
+    It is :func:`asyncio.run()` (Python 3.7+) for the older versions: the loop is the current loop of the thread
+    while the coroutine runs, then it is closed.
+
+    :param t_coroutine: coroutine object
+    :return: result of the coroutine
+    """
+
+    import asyncio
+
+    loop = asyncio.new_event_loop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(t_coroutine)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+async def close_writer(t_writer):
+
+    """Closes the writing side of a connection, then waits for it to be closed (Python 3.7+).
+
+    The errors of a peer that went away are ignored.
+
+    :param t_writer: writing side of the connection
+    :type t_writer: :class:`asyncio.StreamWriter`
+    :return: None
+    """
+
+    t_writer.close()
+
+    # before Python 3.7 the buffered data is sent by the transport after close(), there is nothing to wait for
+    if hasattr(t_writer, "wait_closed"):
+        with contextlib.suppress(OSError):
+            await t_writer.wait_closed()
+
+
+def pending_tasks(t_loop):
+
+    """Returns the tasks of the loop <t_loop> that aren't done, except the running one.
+
+    :param t_loop: event loop
+    :type t_loop: :class:`asyncio.AbstractEventLoop`
+    :return: set of tasks
+    :rtype: set
+    """
+
+    import asyncio
+
+    # asyncio.all_tasks() replaced Task.all_tasks() in Python 3.7 (which was removed in 3.9)
+    if hasattr(asyncio, "all_tasks"):
+        return asyncio.all_tasks(t_loop) - {asyncio.current_task(t_loop)}
+
+    return {task for task in asyncio.Task.all_tasks(t_loop) if not task.done()} - {asyncio.Task.current_task(t_loop)}
+
+
+async def fetch_url(t_url):
+
+    """Returns the body of the response to a GET request of <t_url>.
+
+    The request is HTTP/1.0 (the server closes the connection at the end of the body),
+    redirects aren't followed.
+
+    :param str t_url: "http://" or "https://" URL
+    :return: body of the response
+    :rtype: bytes
+    :raises OSError: if the server can't be reached, or the response status isn't 2xx
+    """
+
+    import asyncio
+    import urllib.parse
+
+    url = urllib.parse.urlsplit(t_url)
+    https = url.scheme.lower() == "https"
+    if not url.hostname:
+        raise OSError("the URL has no host")
+
+    reader, writer = await asyncio.open_connection(url.hostname, url.port or (443 if https else 80),
+                                                   ssl=True if https else None)
+    try:
+        target = (url.path or "/") + ("?" + url.query if url.query else "")
+        writer.write(("GET " + target + " HTTP/1.0\r\nHost: " + url.netloc.rpartition("@")[2]
+                      + "\r\nConnection: close\r\n\r\n").encode("utf-8"))
+        response = await reader.read()
+    finally:
+        await close_writer(writer)
+
+    # status line and headers, then the body
+    head, separator, body = response.partition(b"\r\n\r\n")
+    status_line = head.split(b"\r\n", 1)[0].split(None, 2)
+    if not separator or len(status_line) < 2 or not status_line[0].startswith(b"HTTP/"):
+        raise OSError("bad HTTP response")
+
+    if not status_line[1].startswith(b"2"):
+        raise OSError("HTTP status " + b" ".join(status_line[1:]).decode("latin-1"))
+
+    return body
+
+
+async def fetch_source(t_source, t_timeout):
+
+    """Returns the content of a source: the standard output of a command, or the body of a URL.
+
+    A command is run by the shell, in the current directory, and must exit with status 0.
+    The source that doesn't produce its content within <t_timeout> seconds is stopped (the command is killed).
+
+    :param str t_source: "!<command>" or URL (see :func:`is_source()`)
+    :param float t_timeout: seconds
+    :return: content
+    :rtype: bytes
+    :raises OSError: if the command fails or the URL can't be read
+    :raises asyncio.TimeoutError: if the timeout expires
+    """
+
+    import asyncio
+
+    if not t_source.startswith("!"):
+        return await asyncio.wait_for(fetch_url(t_source), t_timeout)
+
+    # the command waits inside a thread of the loop:
+    # before Python 3.8 the asyncio subprocesses work only in the main thread, the daemon renders in other threads
+    return await asyncio.get_event_loop().run_in_executor(None, run_command, t_source[1:], t_timeout)
+
+
+def run_command(t_command, t_timeout):
+
+    """Runs the shell command <t_command> and returns its standard output.
+
+    The command runs in the current directory and must exit with status 0.
+    The command that doesn't end within <t_timeout> seconds is killed, with the processes it started.
+
+    :param str t_command: shell command
+    :param float t_timeout: seconds
+    :return: standard output
+    :rtype: bytes
+    :raises OSError: if the command fails
+    :raises asyncio.TimeoutError: if the timeout expires
+    """
+
+    import asyncio
+    import subprocess
+
+    # the command has its own process group, this way the processes started by the shell can be killed too
+    process = subprocess.Popen(t_command, shell=True, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, start_new_session=True)
+    try:
+        stdout, stderr = process.communicate(timeout=t_timeout)
+    except BaseException as e:
+        # timeout (or interruption): the command doesn't outlive the render
+        if process.returncode is None:
+            import signal
+
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+
+        if isinstance(e, subprocess.TimeoutExpired):
+            raise asyncio.TimeoutError() from None
+        raise
+
+    if process.returncode != 0:
+        message = stderr.decode("utf-8", "replace").strip()
+        raise OSError("exit status " + str(process.returncode) + (": " + message if message else ""))
+
+    return stdout
+
+
+def resolve_sources(t_placeholders, t_directory, t_timeout=None):
+
+    """Replaces the sources of the input placeholders with files that contain what they produced.
+
+    The commands and the URLs (see :func:`is_source()`) are read at the same time with asyncio,
+    each one with its own timeout: the total time is the one of the slowest source, not their sum.
+    The content of each source is written to a file inside <t_directory>:
+    the renderers, the engines and the checks see regular files, like with "name=file".
+
+    Example:
+
+    >>> resolve_sources(["a=!echo hello", "b=file1.txt"], "/tmp/sources")
+    ['a=/tmp/sources/0', 'b=file1.txt']
+
+    :param list t_placeholders: input placeholders, "name=file", "name=!command" or "name=URL"
+    :param str t_directory: existing folder for the files of the sources
+    :param float t_timeout: seconds given to each source, by default ``source_timeout``
+    :return: input placeholders, with the files of the sources
+    :rtype: list
+    :raises SourceError: if at least one source failed or didn't finish in time
+    """
+
+    import asyncio
+
+    if t_timeout is None:
+        t_timeout = source_timeout
+
+    # index of the input placeholder -> (name, source)
+    sources = {}
+    for index, placeholder in enumerate(t_placeholders):
+        name, _, value = placeholder.partition("=")
+        if is_source(value):
+            sources[index] = (name, value)
+
+    if not sources:
+        return list(t_placeholders)
+
+    async def read_all():
+        return await asyncio.gather(*[fetch_source(source, t_timeout) for name, source in sources.values()],
+                                    return_exceptions=True)
+
+    resolved = list(t_placeholders)
+    failures = []
+    for (index, (name, source)), content in zip(sources.items(), run_loop(read_all())):
+
+        if isinstance(content, asyncio.TimeoutError):
+            failures.append((name, source, "timed out after " + str(t_timeout) + " seconds"))
+        elif isinstance(content, Exception):
+            failures.append((name, source, "failed: " + (str(content) or type(content).__name__)))
+        else:
+            path = os.path.join(t_directory, str(index))
+            with open(path, "wb") as fsource:
+                fsource.write(content)
+            resolved[index] = name + "=" + path
+
+    if failures:
+        raise SourceError(failures)
+
+    return resolved
+
+
+def check_placeholder_arguments(args, t_template_placeholders, t_check_ip_res=None):
+
+    """Makes sure that every placeholder argument is written in a valid form.
+
+    Specifically it checks :
+    - if the input placeholders contain only one equal sign,
+    and if the file paths exist with the :func:`check_input_placeholders()` function
+    - it makes sure that both the template placeholders and input placeholders have no duplicates,
+    and that the template placeholders and input placeholders are equal
+    with the :func:`validate_placeholders()` function (a single pass, in linear time)
+
+    Each problem is printed with the names it concerns.
+
+    :param args: dictionary with input arguments
+    :type args: docopt.Dict
+    :param list t_template_placeholders: list with the placeholders of the template file
+    :param dict t_check_ip_res: result of :func:`check_input_placeholders()` if it was already called
+                                on the input placeholders (by default the function calls it)
+    :return correct_placeholder: boolean value, True if everything is correct, False otherwise
+    :rtype correct_placeholder: bool
+    """
+
+    # copy the function input, never change the original values
+    t_arguments = args
+
+    # check if the input placeholders are correct and get the placeholder names
+    # > the caller can pass the result it already has, this way the input is parsed only once
+    check_ip_res = t_check_ip_res
+    if check_ip_res is None:
+        check_ip_res = check_input_placeholders(t_arguments['<placeholder=file>'])
+
+    # compare the two sides in a single pass
+    report = validate_placeholders(t_template_placeholders, check_ip_res["placeholders_names"])
+
+    if not testmode:
+        # check if the template has at least one placeholder
+        # > it shouldn't be a problem: the input placeholders should be at least one
+        # > and the template placeholders must be equal to the input placeholder.
+        # > This error is more useful to the user than to the script itself
+        if report.empty_template:
+            print("Bad placeholders: the template has no placeholders", file=sys.stderr)
+
+        if report.input_duplicates:
+            print("Bad placeholders: the input has placeholders duplicates: " + format_names(report.input_duplicates),
+                  file=sys.stderr)
+
+        if report.template_duplicates:
+            print("Bad placeholders: the template has duplicates of placeholders: "
+                  + format_names(report.template_duplicates), file=sys.stderr)
+
+        if report.missing or report.extra:
+            print("Bad placeholders: the input and the template placeholders must be the same", file=sys.stderr)
+        if report.missing:
+            print("  missing from the input: " + format_names(report.missing), file=sys.stderr)
+        if report.extra:
+            print("  not in the template: " + format_names(report.extra), file=sys.stderr)
+
+    # if this variable is True, the placeholders are correct
+    correct_placeholder = check_ip_res["correct_placeholder"] and report.valid
+
+    return correct_placeholder
+
+
+def check_repattern_arguments(args):
+
+    """The function checks if the user passed a specific placeholder pattern and returns the correct configuration.
+
+    The function checks:
+    - if the opening tag wasn't specified by the user, if so use the default
+    - if the pattern opening wasn't specified by the user, if so use the default
+    - if the closing tag wasn't specified by the user, if so use the default
+
+    Example:
+
+    >>> check_repattern_arguments({"--ot": None, "--po": None, "--ct": None})
+    {"--ot": "{{", "--po": "ty.", "--ct": "}}"}
+    >>> check_repattern_arguments({"--ot": "%%", "--po": "template.", "--ct": "%%"})
+    {"--ot": "%%", "--po": "template.", "--ct": "%%"}
+
+    :param dict args: dictionary with the input arguments
+    :return t_arguments: dictionary with valid the input argument
+    :rtype t_arguments: dict
+    """
+
+    # copy the function input, never change the original values
+    t_arguments = args
+
+    # if the input doesn't specify an opening tag, use the default one
+    if not t_arguments['--ot']:
+        t_arguments['--ot'] = opening_tag
+
+    # if the input doesn't specify a pattern opening, use the default one
+    if not t_arguments['--po']:
+        t_arguments['--po'] = pattern_opening
+
+    # if the input doesn't specify a closing tag, use the default one
+    if not t_arguments['--ct']:
+        t_arguments['--ct'] = closing_tag
+
+    if boold:
+        print("Checked arguments:")
+        print(t_arguments)
+
+    return t_arguments
+
+
+def output_builder(t_fin, t_args, t_regex_pattern, t_placeholders_index=None, t_fragment_cache=None):
+    """Builds the output file from the template file combined with placeholder files.
+
+    The function opens the output file (we know that the output directory exists),
+    then the template file <t_fin> is read one line at a time.
+
+    A regex pattern is used per line to know if it has placeholder(s),
+    if it has at least one placeholder an input placeholder is sought
+    to get the path of the file to inject into the output.
+    > The file to inject is also read one line at a time
+
+    The content of the file is written to the output file and then
+    this cycle repeats for all the placeholders of the line.
+
+    If there is no placeholder the line of the template file is directly written to the output.
+
+    Example:
+
+    1. this line is read from the template file
+    line = 'this {{ ty.placeholder1 }} is a {{ ty.placeholder2 }} test\\n'
+
+    2. the regex ( '{{ ty.<?> }}' ) finds the matches of the line in a single pass, a loop reads the first one,
+    the second one, ...
+
+    3. The part of the line between the end of the previous placeholder (the start of the line for the first one)
+    and the start of this one is written to the output file
+    > The positions of the match are used: the rest of the line is never searched or copied again,
+    > this way a line is rendered in a time proportional to its length, even with thousands of placeholders
+
+    4. The placeholder ( '<?>', 'placeholder1' ) is sought inside the placeholders index (a dictionary lookup).
+    > We already know that the input has a 'placeholder1=<path1>'
+
+    5. The file to inject path is read from the input placeholder (<path1>) and it is used to read that file.
+    The content of the file is written inside the output
+    > The content is taken from the fragment cache, the file is read only the first time it is used
+
+    6. Phase 3, 4, 5 are repeated until there are placeholders in the line
+
+    7. When all the placeholders have been substituted by the "file to inject" content, the part after
+    the last placeholder is written to the output file
+
+    8. The next line of the template file is read and everything repeats itself again
+
+    > If there was no placeholder inside the line, that line is directly written to the output file
+
+    :param t_fin: template file
+    :type t_fin: :class:`_io.TextIO`
+    :param dict t_args: dictionary with all the input from the terminal
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :param dict t_placeholders_index: placeholder name -> file path dictionary
+                                      (the "placeholders_index" of :func:`check_input_placeholders()`),
+                                      by default it is built from t_args["<placeholder=file>"]
+    :param t_fragment_cache: cache of the files to inject, by default the module's ``fragment_cache``
+    :type t_fragment_cache: :class:`FragmentCache`
+    :return: None
+    """
+
+    if t_fragment_cache is None:
+        t_fragment_cache = fragment_cache
+
+    # parse the input placeholders only once, each match is then a single dictionary lookup
+    if t_placeholders_index is None:
+        t_placeholders_index = index_input_placeholders(t_args["<placeholder=file>"])
+
+    # the pattern can also be passed as a string
+    t_regex_pattern = compile_pattern(t_regex_pattern)
+
+    with write_if_changed(t_args["<output>"]) as fout:
+        # read the first line of the file
+        line = t_fin.readline()
+
+        # loop through the file
+        while line != "":
+
+            # position of the line from which the text still to write starts
+            position = 0
+
+            # loop for each placeholder of the line, found in a single pass
+            for placeholder in t_regex_pattern.finditer(line):
+
+                # write the part of the template line between the previous placeholder and this one
+                fout.write(line[position:placeholder.start()])
+
+                # get the path of the file to inject with a single lookup
+                # examples use the default pattern: {{ ty.<?> }}, group(1) is '<?>'
+                # > the placeholder should always be found, we made sure that it exists during the script exec
+                file_path = t_placeholders_index.get(placeholder.group(1))
+
+                if file_path is not None:
+                    # write the content of the file to inject inside the output file
+                    # > the file is read from the disk only if it isn't cached (or if it changed)
+                    fout.write(t_fragment_cache.get(file_path))
+
+                # the next part of the line starts after the placeholder
+                position = placeholder.end()
+
+            # write the part of the template line after the last placeholder
+            # > if no matches/placeholders were found, the whole line gets written to the output
+            fout.write(line[position:])
+
+            # read the next line
+            line = t_fin.readline()
+
+
+class Template:
+
+    """Template file compiled once into literal and placeholder segments, that can be rendered many times.
+
+    The template file <t_fin> is read one line at a time (like :func:`get_placeholders()` does)
+    and the regex pattern is used to split each line into:
+    - literal segments, the text that gets copied as it is to the output
+    - placeholder segments, the name of the placeholder that gets substituted by a file content
+
+    Consecutive literal text (even across lines) is joined into a single segment.
+    The segments are saved inside an immutable tuple, this way the template can be rendered
+    any number of times (with different placeholder files) without using the regex again.
+
+    A template file opened in binary mode, scanned with a bytes pattern (see :func:`make_scanner()`),
+    gives bytes literal segments: they are written as they are, whatever their encoding.
+    > The placeholder names are always str, decoded from UTF-8 ("surrogateescape" keeps the other bytes)
+
+    Example:
+
+    cat template.txt
+    this is
+    {{ ty.placeholder1 }} a {{ ty.placeholder2 }}
+    test {{ ty.placeholder3 }}
+    EOF
+
+    >>> template = Template(t_fin, re_builder("{{", "ty.", "}}"))
+    >>> template.placeholders
+    ('placeholder1', 'placeholder2', 'placeholder3')
+    >>> template.segments
+    ((0, 'this is\\n'), (1, 'placeholder1'), (0, ' a '), (1, 'placeholder2'), (0, '\\ntest '), (1, 'placeholder3'))
+    >>> template.spans
+    ((8, 29, 'placeholder1'), (32, 53, 'placeholder2'), (59, 80, 'placeholder3'))
+
+    The spans are the (start, end, name) tuples of the placeholders inside the template text:
+    with the text they are enough to build the template again (see :meth:`from_spans()`).
+
+    :param t_fin: template file
+    :type t_fin: :class:`_io.TextIO` or :class:`_io.BufferedReader`
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    """
+
+    def __init__(self, t_fin, t_regex_pattern):
+
+        # the pattern can also be passed as a string
+        t_regex_pattern = compile_pattern(t_regex_pattern)
+
+        segments = []      # list of (kind, value) tuples
+        placeholders = []  # list of the template placeholders, in order of appearance
+        spans = []         # list of (start, end, name) tuples of the placeholders
+        literal = []       # literal text waiting to be saved as a single segment
+
+        # read the first line of the file
+        line = t_fin.readline()
+
+        # "" or b"": the text of a binary file is bytes
+        empty = line[:0]
+        binary = isinstance(empty, bytes)
+
+        # position of the line inside the template text
+        offset = 0
+
+        # loop through the file
+        while line:
+
+            # position of the line from which the literal text starts
+            position = 0
+
+            for match in t_regex_pattern.finditer(line):
+
+                # the part of the line before the placeholder is literal text
+                literal.append(line[position:match.start()])
+
+                # save the literal text collected until now (if there is some)
+                text = empty.join(literal)
+                if text:
+                    segments.append((SEGMENT_LITERAL, text))
+                literal = []
+
+                # save the placeholder
+                name = placeholder_name(match, binary)
+                segments.append((SEGMENT_PLACEHOLDER, name))
+                placeholders.append(name)
+                spans.append((offset + match.start(), offset + match.end(), name))
+
+                # the next literal text starts after the placeholder
+                position = match.end()
+
+            # the part of the line after the last placeholder (or the whole line) is literal text
+            literal.append(line[position:])
+
+            # read the next line
+            offset += len(line)
+            line = t_fin.readline()
+
+        # save the remaining literal text
+        text = empty.join(literal)
+        if text:
+            segments.append((SEGMENT_LITERAL, text))
+
+        self.segments = tuple(segments)
+        self.placeholders = tuple(placeholders)
+        self.spans = tuple(spans)
+        self.binary = binary
+
+    @classmethod
+    def from_spans(cls, t_text, t_spans):
+
+        """Returns the template <t_text> built from the spans of its placeholders, without scanning it.
+
+        The literal segments are the text between the spans, this way the result is the same
+        as the template compiled from <t_text> (see :attr:`spans`).
+
+        Example:
+
+        >>> Template.from_spans("a {{ ty.b }} c", ((2, 12, "b"),)).segments
+        ((0, 'a '), (1, 'b'), (0, ' c'))
+
+        :param t_text: template text
+        :type t_text: str or bytes
+        :param tuple t_spans: (start, end, name) tuples of the placeholders, in order of appearance
+        :return template: compiled template
+        :rtype template: :class:`Template`
+        """
+
+        template = cls.__new__(cls)
+
+        segments = []
+        position = 0
+
+        for start, end, name in t_spans:
+            if start > position:
+                segments.append((SEGMENT_LITERAL, t_text[position:start]))
+            segments.append((SEGMENT_PLACEHOLDER, name))
+            position = end
+
+        if position < len(t_text):
+            segments.append((SEGMENT_LITERAL, t_text[position:]))
+
+        template.segments = tuple(segments)
+        template.placeholders = tuple(name for _, _, name in t_spans)
+        template.spans = tuple(t_spans)
+        template.binary = isinstance(t_text, bytes)
+
+        return template
+
+    def render(self, t_fout, t_placeholders_files, t_fragment_cache=None):
+
+        """Writes the template to <t_fout> substituting the placeholders with the content of their files.
+
+        The segments are written in order: literal segments are written as they are,
+        placeholder segments are substituted with the content of the file
+        that <t_placeholders_files> associates to the placeholder name.
+        > The files content is taken from the fragment cache, a file used many times
+        > (in the same render or in different renders) is read from the disk only once,
+        > and it is taken from the cache (and stat'ed) once per render
+
+        A binary template (compiled from bytes) is written to a binary file with the content of a binary cache.
+
+        Example:
+
+        >>> template.render(fout, {"placeholder1": "file1.txt",
+        ...                        "placeholder2": "file2.txt",
+        ...                        "placeholder3": "file3.txt"})
+
+        :param t_fout: output file
+        :type t_fout: :class:`_io.TextIO` or :class:`_io.BufferedWriter`
+        :param dict t_placeholders_files: dictionary with placeholder names as keys and file paths as values
+        :param t_fragment_cache: cache of the files to inject, by default the module's ``fragment_cache``
+                                 (``binary_fragment_cache`` for a binary template)
+        :type t_fragment_cache: :class:`FragmentCache`
+        :return: None
+        """
+
+        if t_fragment_cache is None:
+            t_fragment_cache = binary_fragment_cache if self.binary else fragment_cache
+
+        # file path -> content, the repeated placeholders are taken from the cache once
+        contents = {}
+
+        for kind, value in self.segments:
+
+            if kind == SEGMENT_LITERAL:
+                # literal text goes directly to the output
+                t_fout.write(value)
+
+            else:
+                # write the content of the file to inject inside the output
+                path = t_placeholders_files[value]
+                if path not in contents:
+                    contents[path] = t_fragment_cache.get(path)
+                t_fout.write(contents[path])
+
+
+class MappedTemplate:
+
+    """Template file memory mapped and rendered as bytes, without decoding it or copying its text.
+
+    The template file <t_path> is mapped in memory with :mod:`mmap` and the bytes regex pattern
+    (see :func:`re_builder_bytes()`) is run directly over the whole map.
+    Only the positions of the placeholders are saved: the literal text between them
+    is written to the output as :class:`memoryview` slices of the map, this way the template text
+    is never copied inside Python objects and the pages of the file are read only when they are written.
+
+    The output is the same of the :class:`Template` class for UTF-8 templates with "\\n" line endings
+    > The bytes are written as they are: "\\r\\n" line endings are kept
+
+    Example:
+
+    >>> with MappedTemplate("template.txt", re_builder_bytes("{{", "ty.", "}}")) as template:
+    ...     template.placeholders
+    ...     template.render(fout, {"placeholder1": "file1.txt",
+    ...                            "placeholder2": "file2.txt",
+    ...                            "placeholder3": "file3.txt"})
+    ('placeholder1', 'placeholder2', 'placeholder3')
+
+    :param str t_path: template file path
+    :param t_regex_pattern: bytes regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    """
+
+    def __init__(self, t_path, t_regex_pattern):
+
+        import mmap
+
+        self.path = t_path
+
+        with open(t_path, "rb") as fin:
+            self.size = os.fstat(fin.fileno()).st_size
+
+            # an empty file can't be mapped
+            self.buffer = b""
+            if self.size > 0:
+                # the map keeps its own reference to the file, it stays valid after the file is closed
+                self.buffer = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+
+        spans = []         # list of (start, end, name) tuples of the placeholders
+        placeholders = []  # list of the template placeholders, in order of appearance
+
+        for match in compile_pattern(t_regex_pattern).finditer(self.buffer):
+            name = match.group(1).decode("utf-8", "surrogateescape")
+            spans.append((match.start(), match.end(), name))
+            placeholders.append(name)
+
+        self.spans = tuple(spans)
+        self.placeholders = tuple(placeholders)
+
+    def render(self, t_fout, t_placeholders_files, t_fragment_cache=None):
+
+        """Writes the template to the binary file <t_fout> substituting the placeholders with their files content.
+
+        :param t_fout: output file, opened in binary mode
+        :type t_fout: :class:`_io.BufferedWriter`
+        :param dict t_placeholders_files: dictionary with placeholder names as keys and file paths as values
+        :param t_fragment_cache: binary cache of the files to inject, by default the module's
+                                 ``binary_fragment_cache``
+        :type t_fragment_cache: :class:`FragmentCache`
+        :return: None
+        """
+
+        if t_fragment_cache is None:
+            t_fragment_cache = binary_fragment_cache
+
+        # file path -> content, the repeated placeholders are taken from the cache once
+        contents = {}
+
+        # the view must be released before the map can be closed
+        with memoryview(self.buffer) as view:
+            position = 0
+
+            for start, end, name in self.spans:
+
+                # the literal text before the placeholder is a slice of the map
+                if start > position:
+                    t_fout.write(view[position:start])
+
+                path = t_placeholders_files[name]
+                if path not in contents:
+                    contents[path] = t_fragment_cache.get(path)
+                t_fout.write(contents[path])
+                position = end
+
+            if position < len(view):
+                t_fout.write(view[position:])
+
+    def render_plan(self, t_placeholders_files, t_stat_cache=None):
+
+        """Returns the byte ranges of the files that make the output, in order (see :func:`copy_render()`).
+
+        The literal text is a range of the template file, each placeholder is the whole file to inject.
+
+        Example:
+
+        >>> template.render_plan({"placeholder1": "file1.txt", "placeholder2": "file2.txt",
+        ...                       "placeholder3": "file3.txt"})
+        [('template.txt', 0, 8), ('file1.txt', 0, 39), ('template.txt', 29, 3), ...]
+
+        :param dict t_placeholders_files: dictionary with placeholder names as keys and file paths as values
+        :param StatCache t_stat_cache: stat results of the run, the sizes of the files are taken from them
+        :return plan: list of (file path, offset, length) tuples
+        :rtype plan: list
+        """
+
+        if t_stat_cache is None:
+            t_stat_cache = StatCache()
+
+        plan = []
+        position = 0
+
+        for start, end, name in self.spans:
+
+            if start > position:
+                plan.append((self.path, position, start - position))
+
+            file_path = t_placeholders_files[name]
+            st = t_stat_cache.stat(file_path)
+            if st is None:
+                # the file disappeared: the usual error
+                st = os.stat(file_path)
+            plan.append((file_path, 0, st.st_size))
+            position = end
+
+        if position < self.size:
+            plan.append((self.path, position, self.size - position))
+
+        return plan
+
+    def close(self):
+
+        """Unmaps the template file.
+
+        :return: None
+        """
+
+        if not isinstance(self.buffer, bytes):
+            self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, t_type, t_value, t_traceback):
+        self.close()
+
+
+class RangeCopier:
+
+    """Copies byte ranges between file descriptors inside the kernel, when the operating system allows it.
+
+    The copy methods are tried in order of preference:
+    - "copy_file_range": :func:`os.copy_file_range()` (Linux, between files; it can share the file blocks)
+    - "sendfile": :func:`os.sendfile()` (Linux, macOS; the destination can also be a pipe)
+    - "read": :meth:`readinto()` inside a reusable buffer of <t_buffer_size> bytes, then :func:`os.write()`
+
+    A method that isn't supported by the files (or by the system) is abandoned
+    and the same instance uses the next one for the following copies.
+    The data is written at the current position of the destination descriptor.
+
+    Example:
+
+    >>> copier = RangeCopier()
+    >>> copier.copy(fin.fileno(), fout.fileno(), 0, 1024)
+    1024
+    >>> copier.method
+    'copy_file_range'
+
+    :param tuple t_methods: names of the methods that can be used, by default all the available ones
+    :param int t_buffer_size: size of the buffer of the "read" method
+    """
+
+    def __init__(self, t_methods=None, t_buffer_size=1024 * 1024):
+
+        if t_methods is None:
+            t_methods = ("copy_file_range", "sendfile", "read")
+
+        # keep only the methods of this python version and operating system
+        self.methods = [method for method in t_methods if method == "read" or hasattr(os, method)]
+        if "read" not in self.methods:
+            self.methods.append("read")
+
+        self.buffer_size = t_buffer_size
+        self.buffer = None  # created the first time the "read" method is used
+
+    @property
+    def method(self):
+        """Name of the method used by the next copy."""
+        return self.methods[0]
+
+    def copy(self, t_src_fd, t_dst_fd, t_offset, t_length):
+
+        """Copies <t_length> bytes of <t_src_fd> (from <t_offset>) to <t_dst_fd>.
+
+        Less bytes are copied if the source file ends before.
+
+        :param int t_src_fd: source file descriptor
+        :param int t_dst_fd: destination file descriptor
+        :param int t_offset: position of the first byte to copy
+        :param int t_length: number of bytes to copy
+        :return copied: number of bytes copied
+        :rtype copied: int
+        """
+
+        copied = 0
+
+        while copied < t_length:
+            try:
+                if self.method == "copy_file_range":
+                    count = os.copy_file_range(t_src_fd, t_dst_fd, t_length - copied, t_offset + copied)
+                elif self.method == "sendfile":
+                    count = os.sendfile(t_dst_fd, t_src_fd, t_offset + copied, t_length - copied)
+                else:
+                    count = self._read_copy(t_src_fd, t_dst_fd, t_offset + copied, t_length - copied)
+
+            except OSError as e:
+                # the method doesn't work with these files: use the next one
+                if self.method != "read" and e.errno in (errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF,
+                                                         errno.ENOTSUP, errno.EOPNOTSUPP, errno.ENOTSOCK,
+                                                         errno.ESPIPE):
+                    if boold:
+                        print(self.method + " is not supported:", e)
+                    self.methods.pop(0)
+                    continue
+                raise
+
+            # the source file ended
+            if count == 0:
+                break
+
+            copied += count
+
+        return copied
+
+    def _read_copy(self, t_src_fd, t_dst_fd, t_offset, t_length):
+
+        """Copies up to a buffer of bytes of <t_src_fd> (from <t_offset>) to <t_dst_fd> through Python.
+
+        :param int t_src_fd: source file descriptor
+        :param int t_dst_fd: destination file descriptor
+        :param int t_offset: position of the first byte to copy
+        :param int t_length: maximum number of bytes to copy
+        :return count: number of bytes copied
+        :rtype count: int
+        """
+
+        if self.buffer is None:
+            self.buffer = memoryview(bytearray(self.buffer_size))
+
+        os.lseek(t_src_fd, t_offset, os.SEEK_SET)
+        with open(t_src_fd, "rb", buffering=0, closefd=False) as fin:
+            count = fin.readinto(self.buffer[:min(t_length, self.buffer_size)])
+
+        # os.write() can write less bytes than requested
+        written = 0
+        while written < count:
+            written += os.write(t_dst_fd, self.buffer[written:count])
+
+        return count
+
+
+def copy_render(t_plan, t_fout, t_copier=None, t_preallocate=True):
+
+    """Writes to the binary file <t_fout> the byte ranges of <t_plan> (see :meth:`MappedTemplate.render_plan()`).
+
+    The ranges are copied by a :class:`RangeCopier`: with copy_file_range and sendfile
+    the bytes of the template and of the files to inject never pass through Python objects.
+
+    The final size is known before copying: if <t_preallocate> and <t_fout> is a regular file,
+    its space is preallocated with :func:`os.posix_fallocate()` (where available).
+    If a file gets shorter while the plan is copied, the output is truncated at the last byte written.
+    > Don't preallocate files opened in append mode (like a redirected standard output):
+    > their current position isn't where the bytes are written
+
+    Example:
+
+    >>> with open("output.txt", "wb") as fout:
+    ...     copy_render(template.render_plan({"placeholder1": "file1.txt", ...}), fout)
+    134
+
+    :param list t_plan: list of (file path, offset, length) tuples
+    :param t_fout: output file, opened in binary mode
+    :type t_fout: :class:`_io.BufferedWriter`
+    :param t_copier: copier of the byte ranges, by default a new :class:`RangeCopier`
+    :type t_copier: :class:`RangeCopier`
+    :param bool t_preallocate: preallocate the space of the output
+    :return written: number of bytes written
+    :rtype written: int
+    """
+
+    if t_copier is None:
+        t_copier = RangeCopier()
+
+    # the bytes already written through the file object must come before the copied ones
+    t_fout.flush()
+    fd = t_fout.fileno()
+
+    start = None
+    if t_preallocate and stat.S_ISREG(os.fstat(fd).st_mode):
+        start = os.lseek(fd, 0, os.SEEK_CUR)
+
+        total = sum(length for path, offset, length in t_plan)
+        if total > 0 and hasattr(os, "posix_fallocate"):
+            try:
+                os.posix_fallocate(fd, start, total)
+            except OSError:
+                # the file system doesn't support it, the file grows while it is written
+                pass
+
+    written = 0
+
+    # each file is opened once, even if it has more ranges (like the template)
+    with contextlib.ExitStack() as stack:
+        files = {}
+
+        for path, offset, length in t_plan:
+            if path not in files:
+                files[path] = stack.enter_context(open(path, "rb", buffering=0))
+
+            written += t_copier.copy(files[path].fileno(), fd, offset, length)
+
+    # a file shorter than expected leaves preallocated bytes after the end
+    if start is not None and os.fstat(fd).st_size > start + written:
+        os.ftruncate(fd, start + written)
+
+    return written
+
+
+def find_pending_tag(t_text, t_start, t_tags):
+
+    """Returns the position of the first tag inside <t_text> (from <t_start>) that could be completed by more text.
+
+    The function is used by :func:`iter_template_segments()`: <t_text> is the last part of a line
+    that has been read only in part, and no placeholder was found after <t_start>.
+    A placeholder could still start:
+    - at an opening tag, followed by spaces and the pattern opening (or a part of it) until the end of the text
+    - at the end of the text, if the text ends with the first characters of an opening tag
+
+    The text before the returned position can't be part of a placeholder, whatever text is read next.
+
+    Example:
+
+    >>> find_pending_tag("text {{ ty.placehol", 0, [("{{", "ty.")])
+    5
+    >>> find_pending_tag("text {{ not a placeholder {", 0, [("{{", "ty.")])
+    26
+    >>> find_pending_tag("only text", 0, [("{{", "ty.")])
+    9
+
+    :param t_text: text
+    :type t_text: str or bytes
+    :param int t_start: position from which the tags are sought
+    :param list t_tags: list of (opening tag, pattern opening) tuples, bytes if <t_text> is bytes
+    :return position: position of the first tag that could be completed, len(t_text) if there is none
+    :rtype position: int
+    """
+
+    pending = len(t_text)
+
+    for t_opening_tag, t_pattern_opening in t_tags:
+
+        # an opening tag followed by the beginning of a placeholder
+        i = t_text.find(t_opening_tag, t_start)
+        while i != -1 and i < pending:
+
+            # skip the spaces after the opening tag
+            j = i + len(t_opening_tag)
+            while j < len(t_text) and t_text[j:j + 1].isspace():
+                j += 1
+
+            # the rest of the text is the pattern opening (or a part of it) followed by the placeholder name
+            rest = t_text[j:j + len(t_pattern_opening)]
+            if t_pattern_opening.startswith(rest):
+                pending = i
+                break
+
+            i = t_text.find(t_opening_tag, i + 1)
+
+        # the text ends with the first characters of an opening tag
+        for length in range(min(len(t_opening_tag) - 1, len(t_text) - t_start), 0, -1):
+            if t_text.endswith(t_opening_tag[:length]):
+                pending = min(pending, len(t_text) - length)
+                break
+
+    return pending
+
+
+def placeholder_name(t_match, t_binary=False):
+
+    """Returns the placeholder name of the regex match <t_match>.
+
+    :param t_match: match of the regex pattern
+    :type t_match: :class:`_sre.SRE_Match`
+    :param bool t_binary: if True, the match is bytes and the name is decoded from UTF-8 ("surrogateescape")
+    :return: placeholder name
+    :rtype: str
+    """
+
+    name = t_match.group(1)
+    if t_binary:
+        name = name.decode("utf-8", "surrogateescape")
+
+    return name
+
+
+def iter_template_segments(t_fin, t_regex_pattern, t_tags, t_chunk_size=65536):
+
+    """Reads the template file <t_fin> in chunks of <t_chunk_size> characters and yields its segments.
+
+    The segments are the same of the :class:`Template` class: (SEGMENT_LITERAL, text)
+    and (SEGMENT_PLACEHOLDER, name) tuples, but they are yielded while the template is read
+    and they are never kept in memory, this way templates of any size
+    (and templates that can't be read twice, like the standard input) can be rendered.
+
+    The placeholders are matched one line at a time, like :func:`get_placeholders()` does,
+    but a line doesn't have to fit in memory:
+    - the complete lines of the buffer are scanned and yielded
+    - the matches of the last (incomplete) line that can't change with more text are yielded, together with
+    the text that can't be part of a placeholder (see :func:`iter_partial_line_segments()`).
+    Only the rest of the line is kept in the buffer,
+    this way a placeholder split between two chunks is found when the next chunk is read
+
+    The memory used depends on the chunk size, not on the template size.
+    > A placeholder that isn't closed yet is kept in the buffer whatever its length (at most until its line ends),
+    > the next reads are as long as the buffer: the text kept is scanned again a bounded number of times
+
+    A template file opened in binary mode is read as bytes, with a bytes pattern and bytes tags:
+    the literal segments are bytes (see :class:`Template`).
+
+    :param t_fin: template file
+    :type t_fin: :class:`_io.TextIO` or :class:`_io.BufferedReader`
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :param list t_tags: list of (opening tag, pattern opening) tuples of the regex pattern
+    :param int t_chunk_size: number of characters (bytes) read at a time
+    :return: generator of the template segments
+    :rtype: generator
+    """
+
+    t_regex_pattern = compile_pattern(t_regex_pattern)
+
+    buffer = None
+    eof = False
+
+    while not eof:
+        chunk = t_fin.read(max(t_chunk_size, len(buffer or "")))
+        eof = not chunk
+
+        if buffer is None:
+            # "" or b"": the text of a binary file is bytes
+            buffer = chunk[:0]
+            newline = "\n" if isinstance(buffer, str) else b"\n"
+            binary = isinstance(buffer, bytes)
+
+        buffer += chunk
+
+        position = 0
+
+        while True:
+            # the end of the line is the end of the buffer if the file ended
+            line_end = buffer.find(newline, position) + 1
+            if line_end == 0:
+                if not eof:
+                    break
+                line_end = len(buffer)
+
+            position = yield from iter_match_segments(buffer, t_regex_pattern, position, line_end, binary)
+
+            if line_end > position:
+                yield SEGMENT_LITERAL, buffer[position:line_end]
+            position = line_end
+
+            if position == len(buffer):
+                break
+
+        # the last line is incomplete: keep only the text that could be the beginning of a placeholder
+        pending = yield from iter_partial_line_segments(buffer, t_regex_pattern, t_tags, position, binary)
+
+        buffer = buffer[pending:]
+
+
+def iter_match_segments(t_buffer, t_regex_pattern, t_start, t_end, t_binary=False):
+
+    """Yields the segments of the placeholders found inside <t_buffer> from <t_start> to <t_end>.
+
+    Each placeholder is yielded after the text that comes before it, the text after the last placeholder isn't:
+    the generator returns its position (used with "yield from" by :func:`iter_template_segments()`).
+
+    :param t_buffer: text to scan
+    :type t_buffer: str or bytes
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :param int t_start: position where the scan starts
+    :param int t_end: position where the scan ends
+    :param bool t_binary: the buffer is bytes
+    :return position: position after the last placeholder, <t_start> if there is none
+    :rtype position: int
+    """
+
+    position = t_start
+
+    for match in t_regex_pattern.finditer(t_buffer, t_start, t_end):
+        if match.start() > position:
+            yield SEGMENT_LITERAL, t_buffer[position:match.start()]
+        yield SEGMENT_PLACEHOLDER, placeholder_name(match, t_binary)
+        position = match.end()
+
+    return position
+
+
+def iter_partial_line_segments(t_buffer, t_regex_pattern, t_tags, t_start, t_binary=False):
+
+    """Yields the segments of the last line of <t_buffer> (from <t_start>), that has been read only in part.
+
+    A match is yielded only if no placeholder that could be completed by more text
+    starts before it (see :func:`find_pending_tag()`): with more dialects, the tag of a dialect can match
+    inside the tag of another dialect that isn't complete yet (like "{ ty.a }" inside "{{ ty.a }").
+    For the same reason a match isn't yielded if the tags of two dialects start where it starts.
+
+    The text before the first placeholder that could be completed is yielded too,
+    the generator returns its position: the rest of the line must be kept until more text is read.
+
+    Example:
+
+    >>> pattern = re_builder_multi((("{{", "ty.", "}}"), ("{", "ty.", "}")))
+    >>> list(iter_partial_line_segments("a { ty.b } c {{ ty.d }", pattern, [("{{", "ty."), ("{", "ty.")], 0))
+    [(0, 'a '), (1, 'b'), (0, ' c ')]
+
+    :param t_buffer: text to scan
+    :type t_buffer: str or bytes
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :param list t_tags: list of (opening tag, pattern opening) tuples of the regex pattern
+    :param int t_start: position where the last line starts
+    :param bool t_binary: the buffer is bytes
+    :return position: position of the first placeholder that could be completed, len(t_buffer) if there is none
+    :rtype position: int
+    """
+
+    position = t_start
+
+    # the first tag that could be completed, for each dialect
+    pending = [find_pending_tag(t_buffer, position, [tags]) for tags in t_tags]
+
+    for match in t_regex_pattern.finditer(t_buffer, t_start, len(t_buffer)):
+        if min(pending, default=len(t_buffer)) < match.start() or pending.count(match.start()) > 1:
+            break
+
+        if match.start() > position:
+            yield SEGMENT_LITERAL, t_buffer[position:match.start()]
+        yield SEGMENT_PLACEHOLDER, placeholder_name(match, t_binary)
+        position = match.end()
+
+        # the tags inside the match can't start a placeholder anymore
+        pending = [tag_position if tag_position >= position else find_pending_tag(t_buffer, position, [tags])
+                   for tag_position, tags in zip(pending, t_tags)]
+
+    first = min(pending, default=len(t_buffer))
+    if first > position:
+        yield SEGMENT_LITERAL, t_buffer[position:first]
+
+    return first
+
+
+def stream_render(t_fin, t_fout, t_placeholders_index, t_regex_pattern, t_tags, t_chunk_size=65536,
+                  t_fragment_cache=None):
+
+    """Renders the template file <t_fin> to <t_fout> while it is read, with bounded memory.
+
+    The template segments are produced by :func:`iter_template_segments()`:
+    literal segments are written as they are, placeholders are substituted by the content of their file
+    (read through the fragment cache). The placeholders that aren't inside <t_placeholders_index> are skipped.
+
+    The template isn't checked before rendering (it could be read only once):
+    the function returns the placeholders it found, they can be checked after the render.
+
+    Example:
+
+    >>> stream_render(sys.stdin, sys.stdout, {"placeholder1": "file1.txt"}, re_builder("{{", "ty.", "}}"),
+    ...               [("{{", "ty.")])
+    ['placeholder1']
+
+    :param t_fin: template file
+    :type t_fin: :class:`_io.TextIO`
+    :param t_fout: output file
+    :type t_fout: :class:`_io.TextIO`
+    :param dict t_placeholders_index: placeholder name -> file path dictionary
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :param list t_tags: list of (opening tag, pattern opening) tuples of the regex pattern
+    :param int t_chunk_size: number of characters read at a time
+    :param t_fragment_cache: cache of the files to inject, by default the module's ``fragment_cache``
+    :type t_fragment_cache: :class:`FragmentCache`
+    :return placeholders: list of the template placeholders, in order of appearance
+    :rtype placeholders: list
+    """
+
+    if t_fragment_cache is None:
+        t_fragment_cache = fragment_cache
+
+    placeholders = []
+
+    # file path -> content, the repeated placeholders are taken from the cache once
+    contents = {}
+
+    for kind, value in iter_template_segments(t_fin, t_regex_pattern, t_tags, t_chunk_size):
+
+        if kind == SEGMENT_LITERAL:
+            t_fout.write(value)
+
+        else:
+            placeholders.append(value)
+
+            file_path = t_placeholders_index.get(value)
+            if file_path is not None:
+                if file_path not in contents:
+                    contents[file_path] = t_fragment_cache.get(file_path)
+                t_fout.write(contents[file_path])
+
+    return placeholders
+
+
+@contextlib.contextmanager
+def open_output(t_path, t_binary=False):
+
+    """Opens the output file <t_path> for writing, "-" is the standard output.
+
+    A file is written atomically and only if its content changes (see :func:`write_if_changed()`).
+
+    Example:
+
+    >>> with open_output("-") as fout:
+    ...     fout.write("written to the standard output")
+
+    :param str t_path: output file path, or "-"
+    :param bool t_binary: open the file in binary mode (the standard output is its binary buffer)
+    :return: context manager that returns the open file
+    """
+
+    if t_path == "-":
+        fout = sys.stdout
+        if t_binary:
+            # the text written until now must come before the bytes
+            sys.stdout.flush()
+            fout = sys.stdout.buffer
+
+        yield fout
+        fout.flush()
+
+    else:
+        with write_if_changed(t_path, t_binary) as fout:
+            yield fout
+
+
+@contextlib.contextmanager
+def write_if_changed(t_path, t_binary=False):
+
+    """Opens the output file <t_path> for writing: the file is replaced atomically, and only if its content changes.
+
+    The output is written to a temporary file of the same folder, which is compared with the current file
+    when the with block ends: the sizes first, then the bytes, a chunk at a time (a byte comparison, not a hash).
+    - if they are the same the temporary file is removed: the output keeps its modification time,
+    this way the builds that depend on it (make targets, Docker layers, ...) aren't triggered again
+    - otherwise the temporary file is flushed to the disk (:func:`os.fsync()`) and replaces the output
+    with a single rename (keeping the permissions of the output): a crash never leaves a half-written output
+    If the with block raises an exception the output is left as it was.
+    > The outputs that aren't regular files (like /dev/null or a FIFO) are written directly;
+    > a symbolic link keeps pointing to the output, the file it points to is replaced
+
+    Example:
+
+    >>> with write_if_changed("output.txt") as fout:
+    ...     fout.write("same content")  # the second time output.txt isn't touched
+
+    :param str t_path: output file path
+    :param bool t_binary: open the file in binary mode
+    :return: context manager that returns the open (temporary) file
+    """
+
+    mode = "wb" if t_binary else "w"
+    target = os.path.realpath(t_path)
+
+    try:
+        st = os.stat(target)
+    except FileNotFoundError:
+        st = None
+
+    if st is not None and not stat.S_ISREG(st.st_mode):
+        with open(t_path, mode) as fout:
+            yield fout
+        return
+
+    tmp_path, fd = create_temporary_file(target)
+
+    try:
+        with open(fd, mode) as fout:
+            yield fout
+
+            # the content is on the disk before the rename makes it the output
+            fout.flush()
+            os.fsync(fout.fileno())
+
+        replace_if_changed(tmp_path, target, st)
+
+    except BaseException:
+        # the output is left as it was
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def create_temporary_file(t_path):
+
+    """Creates a new temporary file in the folder of <t_path>, named after it.
+
+    The file is created by this process only (O_EXCL), with the permissions of a new file:
+    the name is drawn again if a file with the same name exists.
+
+    :param str t_path: path of the file that the temporary file will replace
+    :return: path and file descriptor (open for writing) of the temporary file
+    :rtype: tuple
+    """
+
+    folder, name = os.path.split(t_path)
+
+    while True:
+        tmp_path = os.path.join(folder, "." + name + "." + os.urandom(4).hex() + ".tmp")
+        try:
+            return tmp_path, os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        except FileExistsError:
+            continue
+
+
+def replace_if_changed(t_tmp_path, t_path, t_stat=None):
+
+    """Replaces the file <t_path> with the temporary file <t_tmp_path>, unless they have the same content.
+
+    If the contents are the same the temporary file is removed, otherwise it's renamed to <t_path>
+    with the permissions of the file it replaces.
+
+    :param str t_tmp_path: path of the temporary file
+    :param str t_path: path of the file to replace
+    :param t_stat: stat result of <t_path>, None if it doesn't exist
+    :type t_stat: :class:`os.stat_result`
+    :return: True if the file was replaced
+    :rtype: bool
+    """
+
+    if t_stat is not None and same_content(t_tmp_path, t_path, t_stat.st_size):
+        os.unlink(t_tmp_path)
+        return False
+
+    if t_stat is not None:
+        os.chmod(t_tmp_path, stat.S_IMODE(t_stat.st_mode))
+    os.replace(t_tmp_path, t_path)
+
+    return True
+
+
+def same_content(t_path1, t_path2, t_size2=None):
+
+    """Returns True if the files <t_path1> and <t_path2> have the same content.
+
+    The sizes are compared first, then the contents a chunk at a time, stopping at the first difference.
+    > Comparing the chunks costs less than hashing both files: the same bytes are read and no digest is computed
+
+    :param str t_path1: path of the first file
+    :param str t_path2: path of the second file
+    :param int t_size2: size of the second file if already known, None to stat it
+    :return: True if the contents are the same
+    :rtype: bool
+    """
+
+    if t_size2 is None:
+        t_size2 = os.path.getsize(t_path2)
+
+    if os.path.getsize(t_path1) != t_size2:
+        return False
+
+    with open(t_path1, "rb") as fin1, open(t_path2, "rb") as fin2:
+        while True:
+            chunk = fin1.read(1024 * 1024)
+            if chunk != fin2.read(1024 * 1024):
+                return False
+            if not chunk:
+                return True
+
+
+def read_sized(t_path, t_size):
+
+    """Reads the file <t_path> until its end, expecting <t_size> bytes, the size given by a previous stat of the file.
+
+    The bytes are read with an unbuffered file into a single buffer of the right size:
+    there are no intermediate copies and no stat of the open file.
+    > The file can have changed after the stat: the caller compares the length of the content with <t_size>
+
+    :param str t_path: path of the file
+    :param int t_size: size of the file in bytes
+    :return content: content of the file
+    :rtype content: bytes
+    """
+
+    with open(t_path, "rb", buffering=0) as fpo:
+        content = fpo.read(t_size)
+
+        # a read can return less bytes than requested (for example if interrupted by a signal)
+        # and the file can have grown after the stat: the file is read until a read returns nothing
+        while True:
+            chunk = fpo.read(max(t_size - len(content), io.DEFAULT_BUFFER_SIZE))
+            if not chunk:
+                break
+            content += chunk
+
+    return content
+
+
+class FragmentCache:
+
+    """Cache of the content of the files to inject, with a byte budget and LRU eviction.
+
+    The content of a file is saved the first time it is requested with :meth:`get()`,
+    the next requests are served from memory as long as the file doesn't change.
+
+    A cached file is considered unchanged if its (modification time in ns, size, inode)
+    signature, read with :func:`os.stat()`, is the same it had when it was read.
+
+    The sum of the sizes of the cached files never exceeds <t_max_bytes>:
+    when a new file doesn't fit the least recently used files are evicted.
+    > A file bigger than the whole budget is read every time and never cached
+
+    The cache is thread safe: the same instance can be shared by the threads of a pool.
+
+    Example:
+
+    >>> cache = FragmentCache(1024 * 1024)
+    >>> cache.get("file1.txt")  # read from the disk
+    '----\nthis\nis placeholder1\ncontent\n----'
+    >>> cache.get("file1.txt")  # served from memory
+    '----\nthis\nis placeholder1\ncontent\n----'
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    With <t_binary> the files are read in binary mode and their content is returned as bytes
+    (used by the engines that render bytes, like :class:`MappedTemplate`).
+
+    :param int t_max_bytes: maximum number of bytes kept in memory, by default ``fragment_cache_max_bytes``
+    :param bool t_binary: read the files as bytes instead of text
+    """
+
+    def __init__(self, t_max_bytes=None, t_binary=False):
+
+        if t_max_bytes is None:
+            t_max_bytes = fragment_cache_max_bytes
+
+        self.max_bytes = t_max_bytes  # byte budget
+        self.binary = t_binary        # the content is bytes
+        self.size = 0                 # bytes currently cached
+        self.hits = 0                 # requests served from memory
+        self.misses = 0               # requests that read the file
+
+        # absolute path -> (signature, size, content), ordered from the least to the most recently used
+        self.entries = collections.OrderedDict()
+
+        # the cache can be shared by more threads
+        self.lock = threading.Lock()
+
+    def get(self, t_path, t_stat=None):
+
+        """Returns the content of the file <t_path>, reading it only if it isn't cached or if it changed.
+
+        <t_stat> is a stat result of the file taken earlier in the run (see :class:`StatCache`):
+        it replaces the :func:`os.stat()` that validates a cached file,
+        and the size of a file that isn't cached, which is read with a single buffer of that size.
+        > A file whose size changed after <t_stat> was taken is read whole, and it isn't cached
+
+        :param str t_path: path of the file
+        :param os.stat_result t_stat: stat result of the file, None to stat it
+        :return content: content of the file
+        :rtype content: str (bytes if the cache is binary)
+        """
+
+        # the same file can be referenced by different relative paths
+        key = os.path.abspath(t_path)
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is not None:
+            st = os.stat(key) if t_stat is None else t_stat
+
+            with self.lock:
+                # make sure that another thread didn't replace the entry in the meantime
+                if self.entries.get(key) is entry:
+
+                    if entry[0] == (st.st_mtime_ns, st.st_size, st.st_ino):
+                        # the file didn't change: it becomes the most recently used
+                        self.entries.move_to_end(key)
+                        self.hits += 1
+                        return entry[2]
+
+                    # the file changed, forget the old content
+                    self._evict(key)
+
+        # the file is read without holding the lock, this way more threads can read different files
+        changed = False
+        if t_stat is None:
+            with open(key, "rb" if self.binary else "r") as fpo:
+                # the signature is taken from the open file, this way it describes the content that gets read
+                st = os.fstat(fpo.fileno())
+                content = fpo.read()
+        else:
+            # the size is known: the bytes are read at once in a buffer of that size, without a stat of the open file
+            st = t_stat
+            content = read_sized(key, st.st_size)
+
+            # the file changed after the stat: its content is returned, but not cached with a stale signature
+            changed = len(content) != st.st_size
+            if not self.binary:
+                # decoded like a file opened in text mode
+                content = io.TextIOWrapper(io.BytesIO(content)).read()
+
+        with self.lock:
+            self.misses += 1
+
+            # cache the content only if it fits inside the budget
+            if not changed and st.st_size <= self.max_bytes:
+
+                # another thread could have cached the same file in the meantime
+                if key in self.entries:
+                    self._evict(key)
+
+                # evict the least recently used files until the new one fits
+                while self.size + st.st_size > self.max_bytes:
+                    self._evict(next(iter(self.entries)))
+
+                self.entries[key] = ((st.st_mtime_ns, st.st_size, st.st_ino), st.st_size, content)
+                self.size += st.st_size
+
+        return content
+
+    def clear(self):
+
+        """Removes all the files from the cache.
+
+        :return: None
+        """
+
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def _evict(self, t_key):
+
+        """Removes the file with absolute path <t_key> from the cache.
+
+        :param str t_key: absolute path of the file
+        :return: None
+        """
+
+        entry = self.entries.pop(t_key)
+        self.size -= entry[1]
+
+
+# default cache of the files to inject, shared by all the renders of the process
+fragment_cache = FragmentCache()
+
+# default cache of the files to inject as bytes (see the MappedTemplate class)
+binary_fragment_cache = FragmentCache(t_binary=True)
+
+
+class StatCache:
+
+    """Stat results of the files of a run: each file is stat'ed at most once, by the checks and the renderers together.
+
+    On a network file system every :func:`os.stat()` is a round trip to the server:
+    :meth:`prefetch()` stats many files at the same time with a bounded number of threads,
+    then :meth:`stat()` and :meth:`isfile()` answer from memory.
+
+    The instance can be given to the renderers as their fragment cache, it has the :meth:`get()` of a
+    :class:`FragmentCache`: the saved stat result validates the cached content, or sizes the buffer
+    that reads the file, without another stat.
+
+    > The results describe the files at the beginning of a run:
+    > a process that renders more times (like the daemon) creates a new instance for each run
+
+    Example:
+
+    >>> stats = StatCache()
+    >>> stats.prefetch(["file1.txt", "file2.txt", "missing.txt"])  # stat'ed at the same time
+    >>> stats.isfile("file1.txt"), stats.isfile("missing.txt")
+    (True, False)
+    >>> stats.get("file1.txt")  # read by the fragment cache with the saved stat
+    '----\nthis\nis placeholder1\ncontent\n----'
+    >>> stats.calls
+    3
+
+    :param t_fragment_cache: cache of the contents of the files, by default ``fragment_cache``
+    :param int t_jobs: maximum number of threads of :meth:`prefetch()`, by default ``stat_jobs``
+    """
+
+    def __init__(self, t_fragment_cache=None, t_jobs=None):
+
+        if t_fragment_cache is None:
+            t_fragment_cache = fragment_cache
+        if t_jobs is None:
+            t_jobs = stat_jobs
+
+        self.fragment_cache = t_fragment_cache  # cache of the contents
+        self.jobs = max(1, t_jobs)              # threads of prefetch()
+        self.calls = 0                          # os.stat() calls
+
+        # absolute path -> stat result, None if the file can't be stat'ed
+        self.results = {}
+
+        # the results can be shared by more threads
+        self.lock = threading.Lock()
+
+    def stat(self, t_path):
+
+        """Returns the stat result of the file <t_path>, calling :func:`os.stat()` only the first time.
+
+        :param str t_path: path of the file
+        :return: stat result, None if the file doesn't exist or can't be stat'ed
+        :rtype: os.stat_result
+        """
+
+        # the same file can be referenced by different relative paths
+        key = os.path.abspath(t_path)
+
+        with self.lock:
+            if key in self.results:
+                return self.results[key]
+
+        result = self._stat(key)
+
+        with self.lock:
+            # another thread could have stat'ed the same file in the meantime: the first result wins
+            return self.results.setdefault(key, result)
+
+    def isfile(self, t_path):
+
+        """Like :func:`os.path.isfile()`, with the saved stat result.
+
+        :param str t_path: path of the file
+        :return: True if <t_path> is a regular file
+        :rtype: bool
+        """
+
+        st = self.stat(t_path)
+        return st is not None and stat.S_ISREG(st.st_mode)
+
+    def prefetch(self, t_paths):
+
+        """Stats the files <t_paths> that weren't stat'ed yet, at most ``jobs`` at the same time.
+
+        > The threads are plain threads pulling paths from a shared iterator:
+        > concurrent.futures would be imported for nothing by the runs with few files
+
+        :param t_paths: paths of the files
+        :return: None
+        """
+
+        keys = {}
+        with self.lock:
+            for path in t_paths:
+                key = os.path.abspath(path)
+                if key not in self.results:
+                    keys[key] = None
+
+        # a thread isn't worth it for a single file
+        if len(keys) < 2 or self.jobs == 1:
+            for key in keys:
+                self.stat(key)
+            return
+
+        pending = iter(keys)
+        pending_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with pending_lock:
+                    key = next(pending, None)
+                if key is None:
+                    return
+                self.stat(key)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(min(self.jobs, len(keys)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def get(self, t_path):
+
+        """Returns the content of the file <t_path> from the fragment cache, validated with the saved stat result.
+
+        :param str t_path: path of the file
+        :return content: content of the file
+        :rtype content: str (bytes if the fragment cache is binary)
+        """
+
+        st = self.stat(t_path)
+        if st is None:
+            # the file disappeared: the fragment cache raises the usual error
+            return self.fragment_cache.get(t_path)
+
+        return self.fragment_cache.get(t_path, st)
+
+    def with_fragment_cache(self, t_fragment_cache):
+
+        """Returns a StatCache that shares the stat results of this one, with another fragment cache.
+
+        Used by the engines that read the same files as bytes (see :data:`binary_fragment_cache`).
+
+        :param t_fragment_cache: cache of the contents of the files
+        :return: StatCache with the same results
+        :rtype: StatCache
+        """
+
+        view = StatCache(t_fragment_cache, self.jobs)
+        view.results = self.results
+        view.lock = self.lock
+
+        return view
+
+    def _stat(self, t_key):
+
+        """Calls :func:`os.stat()` on the absolute path <t_key>.
+
+        :param str t_key: absolute path of the file
+        :return: stat result, None if the file doesn't exist or can't be stat'ed
+        :rtype: os.stat_result
+        """
+
+        try:
+            result = os.stat(t_key)
+        except (OSError, ValueError):
+            # ValueError: the path contains a null byte, like for os.path.isfile()
+            result = None
+
+        with self.lock:
+            self.calls += 1
+
+        return result
+
+
+class RenderStats:
+
+    """Wall time of the phases of a run and its I/O counters (see the --stats option and :func:`render()`).
+
+    The phases are timed with :meth:`phase()`: the command line times the parsing of the arguments ("arguments"),
+    the placeholder sources ("sources"), the pattern ("re_builder"), the scan of the template ("scan"),
+    the checks of the placeholders ("validation"), the render ("render") and the flush of the output ("flush").
+    A phase that runs more times adds up.
+
+    The instance wraps a fragment cache and it has its :meth:`get()`:
+    given to the renderers, it counts and times the injections of each file (or placeholder value),
+    this way a slow file stands out.
+    > The bytes of a file are its size, taken from the stat results if the wrapped cache is a :class:`StatCache`
+
+    Example:
+
+    >>> run_stats = RenderStats()
+    >>> render("Hello {{ ty.name }}!", {"name": "World"}, t_stats=run_stats)
+    'Hello World!'
+    >>> run_stats.as_dict()
+    {'phases': {'re_builder': 2.1e-05, 'scan': 1.8e-05, 'validation': 6e-06, 'read': 2e-06, 'render': 4e-06},
+     'total': 5.1e-05, 'sources': {'name': {'injections': 1, 'bytes': 5, 'seconds': 2e-06}}, 'bytes_read': 5,
+     'bytes_written': 12, 'matches': 1, 'peak_rss': 21946368}
+
+    :param t_fragment_cache: cache of the files to inject that gets wrapped, by default the module's ``fragment_cache``
+    """
+
+    def __init__(self, t_fragment_cache=None):
+
+        if t_fragment_cache is None:
+            t_fragment_cache = fragment_cache
+
+        self.fragment_cache = t_fragment_cache  # wrapped cache
+        self.bytes_written = 0                  # bytes of the output, None if unknown
+        self.matches = 0                        # placeholders found inside the template
+
+        # phase name -> seconds, in order of execution
+        self.phases = collections.OrderedDict()
+
+        # file path (or placeholder name) -> [injections, bytes, seconds]
+        self.sources = collections.OrderedDict()
+
+        # the renderers can inject from more threads
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, t_name):
+
+        """Context manager that adds the time spent inside it to the phase <t_name>.
+
+        Example:
+
+        >>> with run_stats.phase("render"):
+        ...     template.render(fout, placeholders_files)
+
+        :param str t_name: name of the phase
+        :return: context manager
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(t_name, time.perf_counter() - start)
+
+    def add_phase(self, t_name, t_seconds):
+
+        """Adds <t_seconds> to the phase <t_name>.
+
+        :param str t_name: name of the phase
+        :param float t_seconds: seconds
+        :return: None
+        """
+
+        with self.lock:
+            self.phases[t_name] = self.phases.get(t_name, 0.0) + t_seconds
+
+    def add_source(self, t_source, t_bytes, t_seconds):
+
+        """Counts an injection of <t_source> (a file path or a placeholder name), of <t_bytes> bytes.
+
+        :param str t_source: file path or placeholder name
+        :param int t_bytes: bytes injected
+        :param float t_seconds: seconds spent reading the source
+        :return: None
+        """
+
+        with self.lock:
+            entry = self.sources.setdefault(t_source, [0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += t_bytes
+            entry[2] += t_seconds
+
+    def get(self, t_path):
+
+        """Returns the content of the file <t_path> from the wrapped cache, counting and timing the injection.
+
+        :param str t_path: path of the file
+        :return content: content of the file
+        :rtype content: str (bytes if the wrapped cache is binary)
+        """
+
+        start = time.perf_counter()
+        content = self.fragment_cache.get(t_path)
+        elapsed = time.perf_counter() - start
+
+        st = self.fragment_cache.stat(t_path) if isinstance(self.fragment_cache, StatCache) else None
+        self.add_source(os.path.abspath(t_path), st.st_size if st is not None else content_size(content), elapsed)
+
+        return content
+
+    def wrap_output(self, t_path, t_fout):
+
+        """Returns the output file to render to: the standard output is wrapped to count the bytes written.
+
+        :param str t_path: output file path, or "-"
+        :param t_fout: open output file (see :func:`open_output()`)
+        :return: <t_fout>, or a :class:`CountingWriter` that wraps it
+        """
+
+        if t_path == "-":
+            return CountingWriter(t_fout)
+
+        return t_fout
+
+    def count_output(self, t_path, t_fout):
+
+        """Saves the bytes written, once the output is closed.
+
+        :param str t_path: output file path, or "-"
+        :param t_fout: output file returned by :meth:`wrap_output()`
+        :return: None
+        """
+
+        if isinstance(t_fout, CountingWriter):
+            self.bytes_written = t_fout.bytes_written
+        elif t_path != "-":
+            self.bytes_written = os.path.getsize(t_path)
+
+    def with_fragment_cache(self, t_fragment_cache):
+
+        """Returns a RenderStats that records inside this one, wrapping another fragment cache.
+
+        :param t_fragment_cache: cache of the files to inject
+        :return: RenderStats with the same phases and sources
+        :rtype: RenderStats
+        """
+
+        view = RenderStats(t_fragment_cache)
+        view.phases = self.phases
+        view.sources = self.sources
+        view.lock = self.lock
+
+        return view
+
+    def as_dict(self):
+
+        """Returns the statistics as a dictionary (the --stats=json output).
+
+        :return stats: dictionary with the phases (seconds), their total, the sources, the bytes read and written,
+                       the matches and the peak RSS of the process in bytes (None if unknown)
+        :rtype stats: dict
+        """
+
+        with self.lock:
+            phases = dict(self.phases)
+            sources = {source: {"injections": entry[0], "bytes": entry[1], "seconds": entry[2]}
+                       for source, entry in self.sources.items()}
+
+        return {"phases": phases,
+                "total": sum(phases.values()),
+                "sources": sources,
+                "bytes_read": sum(entry["bytes"] for entry in sources.values()),
+                "bytes_written": self.bytes_written,
+                "matches": self.matches,
+                "peak_rss": peak_rss()}
+
+    def format(self):
+
+        """Returns the statistics as text, one line for each phase and for each source (the --stats output).
+
+        :return: text
+        :rtype: str
+        """
+
+        stats = self.as_dict()
+        lines = ["Stats:"]
+
+        for name, seconds in stats["phases"].items():
+            lines.append("  {:<14}{:>12.3f} ms".format(name, seconds * 1000))
+        lines.append("  {:<14}{:>12.3f} ms".format("total", stats["total"] * 1000))
+
+        for source, entry in stats["sources"].items():
+            lines.append("  {:.3f} ms, {} bytes, {} injections: {}".format(entry["seconds"] * 1000, entry["bytes"],
+                                                                           entry["injections"], source))
+
+        lines.append("  bytes read {}, bytes written {}, matches {}, peak RSS {}".format(
+            stats["bytes_read"], "unknown" if stats["bytes_written"] is None else stats["bytes_written"],
+            stats["matches"], "unknown" if stats["peak_rss"] is None else "{} bytes".format(stats["peak_rss"])))
+
+        return "\n".join(lines) + "\n"
+
+
+class CountingWriter:
+
+    """Writes to the file-like object <t_fout> and counts the bytes written (see :class:`RenderStats`).
+
+    Text is counted with the encoding of <t_fout>.
+    The other attributes are the ones of <t_fout>.
+
+    :param t_fout: file-like object
+    """
+
+    def __init__(self, t_fout):
+
+        self.fout = t_fout
+        self.bytes_written = 0
+
+    def write(self, t_data):
+
+        """Writes <t_data> to the wrapped file and counts its bytes.
+
+        :param t_data: text or bytes
+        :return: what the wrapped write() returns
+        """
+
+        self.bytes_written += content_size(t_data, getattr(self.fout, "encoding", None))
+        return self.fout.write(t_data)
+
+    def __getattr__(self, t_name):
+        return getattr(self.fout, t_name)
+
+
+def content_size(t_content, t_encoding=None):
+
+    """Returns the size in bytes of <t_content>: text is encoded with <t_encoding> (UTF-8 by default).
+
+    :param t_content: text or bytes-like object
+    :param str t_encoding: encoding of the text
+    :return: number of bytes
+    :rtype: int
+    """
+
+    if isinstance(t_content, str):
+        return len(t_content.encode(t_encoding or "utf-8", "surrogateescape"))
+
+    return memoryview(t_content).nbytes
+
+
+def peak_rss():
+
+    """Returns the peak resident set size of the process, in bytes.
+
+    :return: bytes, None if the system doesn't report it
+    :rtype: int
+    """
+
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # the size is in bytes on macOS, in kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class IncludeExpander:
+
+    """Expands the placeholders inside the files to inject, recursively, expanding each file only once.
+
+    The injected files are compiled like templates (see :class:`Template`):
+    their placeholders are resolved to files by <t_resolver> and substituted by the expanded content of those files.
+
+    :meth:`check()` walks the whole include graph before rendering:
+    include cycles and chains longer than <t_max_depth> raise :class:`IncludeError`, with the full include chain.
+    The deepest chain below each file is remembered, this way a file included by many others is walked once.
+
+    :meth:`get()` returns the expanded content of a file, it has the same signature of :meth:`FragmentCache.get()`:
+    the expander can be passed to the renderers in place of the fragment cache.
+    The expanded content of each file is computed once and remembered, even if the file is included many times.
+    > The expander remembers the files for its whole life: create a new one when the files can change
+
+    Example:
+
+    cat header.txt
+    {{ ty.title }} - {{ ty.version }}
+    EOF
+
+    >>> expander = IncludeExpander(re_builder("{{", "ty.", "}}"), {"header": "header.txt",
+    ...                                                            "title": "title.txt",
+    ...                                                            "version": "version.txt"}.get)
+    >>> expander.check(["header"])
+    ['title', 'version']
+    >>> template.render(fout, {"header": "header.txt"}, expander)
+
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :param t_resolver: function that returns the file path of a placeholder name, or None if it has no file
+    :param int t_max_depth: maximum number of nested includes, by default ``include_max_depth``
+    :param t_fragment_cache: cache of the files to read, by default the module's ``fragment_cache``
+                             (with a :class:`StatCache` the files aren't stat'ed again)
+    :type t_fragment_cache: :class:`FragmentCache`
+    """
+
+    def __init__(self, t_regex_pattern, t_resolver, t_max_depth=None, t_fragment_cache=None):
+
+        if t_max_depth is None:
+            t_max_depth = include_max_depth
+
+        if t_fragment_cache is None:
+            t_fragment_cache = fragment_cache
+
+        self.regex_pattern = compile_pattern(t_regex_pattern)
+        self.resolver = t_resolver
+        self.max_depth = t_max_depth
+        self.fragment_cache = t_fragment_cache
+
+        # with the stat results of the run the files aren't stat'ed again to know if they exist
+        self.isfile = t_fragment_cache.isfile if isinstance(t_fragment_cache, StatCache) else os.path.isfile
+
+        self.templates = {}  # absolute path -> compiled file
+        self.deepest = {}    # absolute path -> names of the deepest include chain below the file
+        self.names = {}      # absolute path -> names of all the placeholders below the file
+        self.expanded = {}   # absolute path -> expanded content
+
+    def check(self, t_names):
+
+        """Walks the includes of the placeholders <t_names> and returns the names found inside the files.
+
+        The names are returned in order of appearance, without duplicates and without the names of <t_names>.
+        The names without a file (or whose file doesn't exist) are returned but not walked:
+        the caller decides if they are an error.
+
+        :param list t_names: names of the placeholders of the template
+        :return nested_names: names of the placeholders inside the injected files
+        :rtype nested_names: list
+        :raises IncludeError: if there is an include cycle or too many nested includes
+        """
+
+        found = collections.OrderedDict()
+
+        for name in collections.OrderedDict.fromkeys(t_names):
+            path = self.resolver(name)
+            if path is not None:
+                self._walk(name, path, [], found)
+
+        return [name for name in found if name not in t_names]
+
+    def get(self, t_path):
+
+        """Returns the content of the file <t_path> with its placeholders expanded.
+
+        :param str t_path: path of the file
+        :return content: expanded content of the file
+        :rtype content: str
+        :raises IncludeError: if there is an include cycle, too many nested includes
+                              or a placeholder without file
+        """
+
+        key = os.path.abspath(t_path)
+
+        if key not in self.expanded:
+
+            # the includes are checked before expanding, if the caller didn't do it
+            if key not in self.deepest:
+                self._walk(t_path, t_path, [], collections.OrderedDict())
+
+            template = self._compile(key)
+
+            placeholders_files = {}
+            for name in template.placeholders:
+                placeholders_files[name] = self.resolver(name)
+                if placeholders_files[name] is None:
+                    raise IncludeError("placeholder without file", [t_path, name])
+
+            # the included files are expanded by this same object
+            fout = io.StringIO()
+            template.render(fout, placeholders_files, self)
+            self.expanded[key] = fout.getvalue()
+
+        return self.expanded[key]
+
+    def _compile(self, t_key):
+
+        """Returns the compiled version of the file with absolute path <t_key>, compiling it only once.
+
+        :param str t_key: absolute path of the file
+        :return template: compiled file
+        :rtype template: :class:`Template`
+        """
+
+        if t_key not in self.templates:
+            self.templates[t_key] = Template(io.StringIO(self.fragment_cache.get(t_key)), self.regex_pattern)
+
+        return self.templates[t_key]
+
+    def _walk(self, t_name, t_path, t_chain, t_found):
+
+        """Walks the includes of the file <t_path> (placeholder <t_name>) and returns the deepest chain from it.
+
+        :param str t_name: name of the placeholder
+        :param str t_path: path of the file of the placeholder
+        :param list t_chain: (name, absolute path) tuples of the files that include this one, from the outermost
+        :param t_found: names of the placeholders found inside the files, used as an ordered set
+        :type t_found: :class:`collections.OrderedDict`
+        :return chain: names of the deepest include chain, starting from <t_name>
+        :rtype chain: list
+        :raises IncludeError: if there is an include cycle or too many nested includes
+        """
+
+        names = [name for name, key in t_chain] + [t_name]
+
+        if len(names) > self.max_depth:
+            raise IncludeError("more than " + str(self.max_depth) + " nested includes", names)
+
+        # files that don't exist are left to the checks of the caller
+        if not self.isfile(t_path):
+            return [t_name]
+
+        key = os.path.abspath(t_path)
+
+        # the file includes itself through the chain
+        for i, (name, chain_key) in enumerate(t_chain):
+            if chain_key == key:
+                raise IncludeError("include cycle", names[i:])
+
+        # a file already walked isn't walked again, its depth is checked with its deepest chain
+        if key not in self.deepest:
+            deepest = []
+            below = collections.OrderedDict()
+
+            for name in collections.OrderedDict.fromkeys(self._compile(key).placeholders):
+                below[name] = True
+                t_found[name] = True
+
+                path = self.resolver(name)
+                if path is not None:
+                    chain = self._walk(name, path, t_chain + [(t_name, key)], t_found)
+                    if len(chain) > len(deepest):
+                        deepest = chain
+
+                    below.update((below_name, True) for below_name in self.names.get(os.path.abspath(path), ()))
+
+            self.deepest[key] = deepest
+            self.names[key] = list(below)
+
+        else:
+            t_found.update((name, True) for name in self.names[key])
+
+        if len(names) + len(self.deepest[key]) > self.max_depth:
+            raise IncludeError("more than " + str(self.max_depth) + " nested includes", names + self.deepest[key])
+
+        return [t_name] + self.deepest[key]
+
+
+def file_signatures(t_inputs, t_stat_cache=None):
+
+    """Returns the absolute path and the (modification time in ns, size) signature of each input file.
+
+    The inputs are a dictionary that associates a role (for example "<template>" or a placeholder name)
+    to a file path: the role is kept, this way two files that swap roles are noticed.
+    The signature of a file that doesn't exist is None.
+
+    Example:
+
+    >>> file_signatures({"<template>": "template.txt", "placeholder1": "missing.txt"})
+    {'<template>': ['/abs/path/template.txt', [1577098800000000000, 80]],
+     'placeholder1': ['/abs/path/missing.txt', None]}
+
+    With <t_stat_cache> the signatures come from the stat results of the run (see :class:`StatCache`),
+    the files that weren't stat'ed yet are stat'ed all at the same time.
+
+    :param dict t_inputs: dictionary with roles as keys and file paths as values
+    :param StatCache t_stat_cache: stat results of the run, None to stat the files now
+    :return signatures: dictionary with roles as keys and [absolute path, signature] lists as values
+    :rtype signatures: dict
+    """
+
+    signatures = {}
+
+    if t_stat_cache is not None:
+        t_stat_cache.prefetch(t_inputs.values())
+
+    for role in t_inputs:
+        abs_path = os.path.abspath(t_inputs[role])
+
+        if t_stat_cache is not None:
+            st = t_stat_cache.stat(abs_path)
+            signatures[role] = [abs_path, None if st is None else [st.st_mtime_ns, st.st_size]]
+            continue
+
+        try:
+            st = os.stat(abs_path)
+            signatures[role] = [abs_path, [st.st_mtime_ns, st.st_size]]
+        except OSError:
+            signatures[role] = [abs_path, None]
+
+    return signatures
+
+
+class StampDatabase:
+
+    """Stamp file that remembers the inputs of each output, to skip the renders that wouldn't change it.
+
+    For each output the stamp file saves:
+    - the configuration the output was rendered with (the tags of the pattern, ...)
+    - the signature of the output itself, to notice outputs that were deleted or modified by someone else
+    - the path and the signature (see :func:`file_signatures()`) of each input:
+    the template and the injected files
+
+    An output is up to date if the configuration, the output signature
+    and all the input signatures are the same: rendering it again would write the same content.
+
+    The stamps are loaded from <t_path> (if it exists) and saved with :meth:`save()`.
+    The file is written to a new temporary file which then replaces the old one (see :func:`write_if_changed()`),
+    this way an interrupted run, or more runs saving the same stamp file, never leave a broken stamp file.
+    > A broken or unreadable stamp file is ignored: everything gets rendered again
+
+    Example:
+
+    >>> stamps = StampDatabase(".templately-stamps.json", ["{{", "ty.", "}}"])
+    >>> inputs = {"<template>": "template.txt", "placeholder1": "file1.txt"}
+    >>> stamps.is_up_to_date("output.txt", inputs)
+    False
+    >>> signatures = file_signatures(inputs)
+    >>> # ... render output.txt ...
+    >>> stamps.record("output.txt", signatures)
+    >>> stamps.is_up_to_date("output.txt", inputs)
+    True
+
+    :param str t_path: stamp file path
+    :param list t_config: configuration of the run, it has to be JSON serializable
+    """
+
+    def __init__(self, t_path, t_config):
+
+        self.path = t_path
+        self.config = list(t_config)
+
+        # absolute output path -> {"config": ..., "output": signature, "inputs": signatures}
+        self.stamps = {}
+
+        # the stamps can be recorded by more threads
+        self.lock = threading.Lock()
+
+        import json
+
+        try:
+            with open(t_path, "r") as fstamps:
+                stamps = json.load(fstamps)
+
+            if isinstance(stamps, dict):
+                self.stamps = stamps
+
+        except (IOError, OSError, ValueError):
+            pass
+
+    def is_up_to_date(self, t_output, t_inputs=None, t_stat_cache=None):
+
+        """Checks if the output <t_output> is up to date.
+
+        If <t_inputs> is given, the output is up to date only if it was rendered
+        from the same files with the same roles.
+        If <t_inputs> is None, the input files recorded the last time are checked:
+        this is useful when the inputs are known only after parsing the template,
+        if the template didn't change its placeholders didn't change either.
+
+        :param str t_output: output file path
+        :param dict t_inputs: dictionary with roles as keys and file paths as values
+        :param StatCache t_stat_cache: stat results of the run, used for the inputs (see :func:`file_signatures()`)
+        :return up_to_date: True if the output doesn't need to be rendered again
+        :rtype up_to_date: bool
+        """
+
+        with self.lock:
+            stamp = self.stamps.get(os.path.abspath(t_output))
+
+        if not isinstance(stamp, dict) or stamp.get("config") != self.config:
+            return False
+
+        # the output was deleted or modified after the last render
+        if file_signatures({"<output>": t_output})["<output>"][1] != stamp.get("output"):
+            return False
+
+        recorded = stamp.get("inputs")
+        if not isinstance(recorded, dict):
+            return False
+
+        try:
+            recorded_paths = dict((role, recorded[role][0]) for role in recorded)
+        except (TypeError, IndexError, KeyError):
+            return False
+
+        # the output has to be rendered from the same files
+        if t_inputs is not None:
+            if recorded_paths != dict((role, os.path.abspath(t_inputs[role])) for role in t_inputs):
+                return False
+
+        # the signature of a file that doesn't exist is None, it never matches a recorded one
+        current = file_signatures(recorded_paths, t_stat_cache)
+        return current == recorded and all(current[role][1] is not None for role in current)
+
+    def record(self, t_output, t_signatures):
+
+        """Records that the output <t_output> was rendered from the inputs with <t_signatures> signatures.
+
+        The signatures have to be taken (with :func:`file_signatures()`) before rendering the output:
+        if an input changes during the render, the next run renders the output again.
+
+        :param str t_output: output file path
+        :param dict t_signatures: signatures of the inputs, as returned by :func:`file_signatures()`
+        :return: None
+        """
+
+        stamp = {"config": self.config,
+                 "output": file_signatures({"<output>": t_output})["<output>"][1],
+                 "inputs": t_signatures}
+
+        with self.lock:
+            self.stamps[os.path.abspath(t_output)] = stamp
+
+    def save(self):
+
+        """Writes the stamps to the stamp file.
+
+        :return: None
+        """
+
+        import json
+
+        # each run writes its own temporary file (see write_if_changed()): runs that share the stamp file
+        # never write to the same temporary file
+        with self.lock:
+            with write_if_changed(self.path) as fstamps:
+                json.dump(self.stamps, fstamps)
+
+
+# compiled template rendered by the batch worker processes (see the init_batch_worker() function)
+batch_template = None
+
+# stat results of the files injected by the batch worker process (see the init_batch_worker() function)
+batch_stat_cache = None
+
+
+def check_template_placeholders(t_template, t_input_placeholders, t_stat_cache=None):
+
+    """Checks the input placeholders <t_input_placeholders> against the compiled template <t_template>.
+
+    The checks are the ones made on the terminal input:
+    :func:`check_input_placeholders()` and :func:`check_placeholder_arguments()`.
+    The errors are printed to the standard error.
+
+    Example:
+
+    >>> check_template_placeholders(template, ["placeholder1=file1.txt", "placeholder2=file2.txt",
+    ...                                        "placeholder3=file3.txt"])
+    {"placeholder1": "file1.txt", "placeholder2": "file2.txt", "placeholder3": "file3.txt"}
+
+    :param t_template: compiled template
+    :type t_template: :class:`Template`
+    :param list t_input_placeholders: list of input placeholders ("<placeholder>=<file>")
+    :param StatCache t_stat_cache: stat results of the run, None to use a new one
+    :return placeholders_index: placeholder name -> file path dictionary, None if the placeholders aren't valid
+    :rtype placeholders_index: dict
+    """
+
+    check_ip_res = check_input_placeholders(t_input_placeholders, t_stat_cache)
+
+    if not check_placeholder_arguments({"<placeholder=file>": t_input_placeholders},
+                                       list(t_template.placeholders), check_ip_res):
+        return None
+
+    return check_ip_res["placeholders_index"]
+
+
+def read_manifest(t_fmanifest, t_csv=False):
+
+    """Reads the rows of the batch manifest <t_fmanifest> one at a time.
+
+    The function is a generator: only one row at a time is kept in memory,
+    this way manifests of any size can be rendered.
+
+    The manifest can be:
+    - a JSON lines file (the default): each non empty line is an object with
+    the "output" path and the "placeholders", a {"<placeholder>": "<file>"} object
+    or a ["<placeholder>=<file>"] list
+    - a CSV file (<t_csv> is True): the header has the "output" column and one column for each placeholder,
+    the other rows have the output path and the files to inject
+
+    Each row is returned as a dictionary with:
+    - "row": the number of the row (the first row is 1, the CSV header isn't counted)
+    - "output": the output file path
+    - "placeholders": the list of input placeholders, written like the terminal ones ("<placeholder>=<file>")
+    - "error": None, or a string that describes why the row is malformed
+
+    Example:
+
+    cat manifest.jsonl
+    {"output": "out1.txt", "placeholders": {"placeholder1": "file1.txt"}}
+    {"output": "out2.txt", "placeholders": ["placeholder1=file2.txt"]}
+    EOF
+
+    >>> list(read_manifest(t_fmanifest))
+    [{"row": 1, "output": "out1.txt", "placeholders": ["placeholder1=file1.txt"], "error": None},
+     {"row": 2, "output": "out2.txt", "placeholders": ["placeholder1=file2.txt"], "error": None}]
+
+    :param t_fmanifest: manifest file
+    :type t_fmanifest: :class:`_io.TextIO`
+    :param bool t_csv: True if the manifest is a CSV file, False if it is a JSON lines file
+    :return: generator of the rows of the manifest
+    :rtype: generator
+    """
+
+    if t_csv:
+        return read_csv_manifest(t_fmanifest)
+
+    return read_json_manifest(t_fmanifest)
+
+
+def read_csv_manifest(t_fmanifest):
+
+    """Reads the rows of the CSV batch manifest <t_fmanifest> one at a time (see :func:`read_manifest()`).
+
+    :param t_fmanifest: manifest file
+    :type t_fmanifest: :class:`_io.TextIO`
+    :return: generator of the rows of the manifest
+    :rtype: generator
+    """
+
+    import csv
+
+    for row_number, csv_row in enumerate(csv.DictReader(t_fmanifest), 1):
+
+        row = {"row": row_number, "output": csv_row.pop("output", None), "placeholders": [], "error": None}
+
+        # the csv module uses None for the missing values and as the key of the extra values
+        if not row["output"]:
+            row["error"] = "the row has no output"
+        elif None in csv_row:
+            row["error"] = "the row has more values than the header"
+        elif None in csv_row.values():
+            row["error"] = "the row has less values than the header"
+        else:
+            # every column except "output" is a placeholder
+            row["placeholders"] = [name + "=" + csv_row[name] for name in csv_row]
+
+        yield row
+
+
+def read_json_manifest(t_fmanifest):
+
+    """Reads the rows of the JSON lines batch manifest <t_fmanifest> one at a time (see :func:`read_manifest()`).
+
+    :param t_fmanifest: manifest file
+    :type t_fmanifest: :class:`_io.TextIO`
+    :return: generator of the rows of the manifest
+    :rtype: generator
+    """
+
+    import json
+
+    row_number = 0
+    for line in t_fmanifest:
+
+        # blank lines are ignored
+        if line.strip() == "":
+            continue
+
+        row_number += 1
+        row = {"row": row_number, "output": None, "placeholders": [], "error": None}
+
+        try:
+            json_row = json.loads(line)
+        except ValueError:
+            row["error"] = "the row isn't valid JSON"
+            yield row
+            continue
+
+        if not isinstance(json_row, dict) or not isinstance(json_row.get("output"), str):
+            row["error"] = "the row has no output"
+            yield row
+            continue
+
+        row["output"] = json_row["output"]
+        row["placeholders"], row["error"] = json_row_placeholders(json_row.get("placeholders"))
+
+        yield row
+
+
+def json_row_placeholders(t_placeholders):
+
+    """Returns the input placeholders of the "placeholders" value of a JSON manifest row.
+
+    Example:
+
+    >>> json_row_placeholders({"placeholder1": "file1.txt"})
+    (['placeholder1=file1.txt'], None)
+    >>> json_row_placeholders(["placeholder1=file1.txt"])
+    (['placeholder1=file1.txt'], None)
+
+    :param t_placeholders: {"<placeholder>": "<file>"} object or ["<placeholder>=<file>"] list
+    :return placeholders: list of input placeholders ("<placeholder>=<file>") and the error, None if it is valid
+    :rtype placeholders: tuple
+    """
+
+    if isinstance(t_placeholders, dict):
+        return [str(name) + "=" + str(t_placeholders[name]) for name in t_placeholders], None
+
+    if isinstance(t_placeholders, list):
+        return [str(placeholder) for placeholder in t_placeholders], None
+
+    return [], "the row has no placeholders object or list"
+
+
+def init_batch_worker(t_template, t_stat_cache=None):
+
+    """Saves the compiled template inside the batch worker process.
+
+    The function is the initializer of the batch process pool:
+    the template is sent to each worker only once, not once for each row.
+    The worker keeps the stat results of the files it injects (see :class:`StatCache`):
+    a file injected by many rows is stat'ed once by the checks and by the renders.
+
+    :param t_template: compiled template
+    :type t_template: :class:`Template`
+    :param StatCache t_stat_cache: stat results to share with the caller, None to use a new one
+    :return: None
+    """
+
+    global batch_template, batch_stat_cache
+    batch_template = t_template
+    batch_stat_cache = t_stat_cache if t_stat_cache is not None else StatCache()
+
+
+def failed_batch_row(t_row, t_message=None):
+
+    """Prints the error message <t_message> of the manifest row <t_row> and returns its failed result.
+
+    :param dict t_row: manifest row, as returned by :func:`read_manifest()`
+    :param str t_message: error message, None if it has already been printed
+    :return result: tuple with the row number, the output path and False (see :func:`render_batch_row()`)
+    :rtype result: tuple
+    """
+
+    if t_message is not None:
+        print_error(t_message)
+
+    return t_row["row"], t_row["output"], False
+
+
+def render_batch_row(t_row):
+
+    """Checks the placeholders of a manifest row and renders the batch template to the row output.
+
+    The checks are the same made for the terminal input:
+    the output folder has to exist and the placeholders have to be valid (:func:`check_placeholder_arguments()`).
+    The errors are printed to the standard error, like the terminal ones:
+    an error while the row is rendered (like a file to inject that can't be decoded) fails only the row.
+
+    :param dict t_row: manifest row, as returned by :func:`read_manifest()`
+    :return result: tuple with the row number, the output path and True if the row was rendered
+    :rtype result: tuple
+    """
+
+    if t_row["error"] is not None:
+        return failed_batch_row(t_row, "Bad manifest row " + str(t_row["row"]) + ": " + t_row["error"])
+
+    # check if the output dir doesn't exist
+    if not os.path.isdir(os.path.dirname(os.path.abspath(t_row["output"]))):
+        return failed_batch_row(t_row, "The output folder doesn't exist: '" + t_row["output"] + "'")
+
+    # check that all the placeholders of the row are correct
+    placeholders_index = check_template_placeholders(batch_template, t_row["placeholders"], batch_stat_cache)
+    if placeholders_index is None:
+        return failed_batch_row(t_row)
+
+    try:
+        with write_if_changed(t_row["output"]) as fout:
+            batch_template.render(fout, placeholders_index, batch_stat_cache)
+
+    except (IOError, OSError) as e:
+        return failed_batch_row(t_row, "Can't write the output '" + t_row["output"] + "': " + str(e))
+
+    except ValueError as e:
+        # like a file to inject that isn't UTF-8 (UnicodeDecodeError): only this row fails
+        return failed_batch_row(t_row, "Can't render the output '" + t_row["output"] + "': " + str(e))
+
+    return t_row["row"], t_row["output"], True
+
+
+def run_batch(t_template, t_fmanifest, t_jobs=None, t_csv=False, t_stamps=None, t_template_path=None):
+
+    """Renders the compiled template once for each row of the manifest <t_fmanifest>.
+
+    The rows are rendered by a pool of <t_jobs> processes:
+    the template is compiled once by the caller and sent once to each process.
+
+    The manifest is read one row at a time and at most a few rows per process
+    are waiting to be rendered, this way the memory usage doesn't depend on the manifest size.
+    > With <t_jobs> equal to 1 the rows are rendered by the calling process, without a pool
+
+    If the stamp database <t_stamps> is given, the rows whose output is up to date
+    (same template <t_template_path>, same injected files, see :class:`StampDatabase`) are skipped
+    and the rendered rows are recorded.
+
+    The rows that fail are printed to the standard error and counted.
+
+    :param t_template: compiled template
+    :type t_template: :class:`Template`
+    :param t_fmanifest: manifest file
+    :type t_fmanifest: :class:`_io.TextIO`
+    :param int t_jobs: number of processes, by default the number of CPUs
+    :param bool t_csv: True if the manifest is a CSV file, False if it is a JSON lines file
+    :param t_stamps: stamp database of the incremental mode, None to render every row
+    :type t_stamps: :class:`StampDatabase`
+    :param str t_template_path: template file path, needed by the incremental mode
+    :return failed_rows: number of rows that couldn't be rendered
+    :rtype failed_rows: int
+    """
+
+    if t_jobs is None:
+        t_jobs = os.cpu_count() or 1
+
+    # row number -> signatures of the inputs of the rows that are being rendered
+    signatures = {}
+
+    # stat results of the incremental checks, shared with the renders when there is no pool
+    stats = StatCache()
+
+    rows = batch_rows(read_manifest(t_fmanifest, t_csv), t_stamps, t_template_path, stats, signatures)
+    report = functools.partial(report_batch_row, t_signatures=signatures, t_stamps=t_stamps)
+
+    if t_jobs == 1:
+        init_batch_worker(t_template, stats)
+        return sum(report(render_batch_row(row)) for row in rows)
+
+    return render_batch_pool(t_template, rows, t_jobs, report)
+
+
+def batch_rows(t_rows, t_stamps, t_template_path, t_stat_cache, t_signatures):
+
+    """Yields the manifest rows <t_rows> that have to be rendered.
+
+    If the stamp database <t_stamps> is given, the rows whose output is up to date are skipped
+    and the signatures of the inputs of the other rows are saved inside <t_signatures>, before rendering them.
+
+    :param t_rows: rows of the manifest, as returned by :func:`read_manifest()`
+    :param t_stamps: stamp database of the incremental mode, None to render every row
+    :type t_stamps: :class:`StampDatabase`
+    :param str t_template_path: template file path, needed by the incremental mode
+    :param StatCache t_stat_cache: stat results of the incremental checks
+    :param dict t_signatures: row number -> signatures of the inputs dictionary that gets filled
+    :return: generator of the rows
+    :rtype: generator
+    """
+
+    for row in t_rows:
+
+        if t_stamps is not None and row["error"] is None:
+            inputs = index_input_placeholders(row["placeholders"])
+            inputs["<template>"] = t_template_path
+
+            # skip the outputs that are up to date
+            if t_stamps.is_up_to_date(row["output"], inputs, t_stat_cache):
+                continue
+
+            # the signatures are taken before rendering the row
+            t_signatures[row["row"]] = file_signatures(inputs, t_stat_cache)
+
+        yield row
+
+
+def report_batch_row(t_result, t_signatures, t_stamps):
+
+    """Prints the failed row of the result <t_result> of :func:`render_batch_row()`, records the rendered row.
+
+    :param tuple t_result: row number, output path and True if the row was rendered
+    :param dict t_signatures: row number -> signatures of the inputs, the row is removed
+    :param t_stamps: stamp database of the incremental mode, None to skip the record
+    :type t_stamps: :class:`StampDatabase`
+    :return failed: 1 if the row failed, 0 otherwise
+    :rtype failed: int
+    """
+
+    row_number, output, rendered = t_result
+    row_signatures = t_signatures.pop(row_number, None)
+
+    if not rendered:
+        message = "Batch row " + str(row_number) + " failed"
+        if output:
+            message += ": '" + output + "'"
+        print_error(message)
+        return 1
+
+    if row_signatures is not None:
+        t_stamps.record(output, row_signatures)
+
+    return 0
+
+
+def render_batch_pool(t_template, t_rows, t_jobs, t_report):
+
+    """Renders the rows <t_rows> with the template <t_template> by a pool of <t_jobs> processes.
+
+    At most a few rows per process are waiting to be rendered: the manifest isn't read faster than the pool renders it.
+    The results are reported in the order of the rows.
+
+    :param t_template: compiled template, sent once to each process
+    :type t_template: :class:`Template`
+    :param t_rows: rows to render
+    :param int t_jobs: number of processes
+    :param t_report: function called with the result of each row, it returns 1 if the row failed
+    :return failed_rows: number of rows that couldn't be rendered
+    :rtype failed_rows: int
+    """
+
+    import multiprocessing
+
+    failed_rows = 0
+
+    # the pool initializer of the executors needs Python 3.7
+    pool = multiprocessing.Pool(t_jobs, init_batch_worker, (t_template,))
+
+    try:
+        # rows sent to the pool but not rendered yet, in the manifest order
+        pending = collections.deque()
+
+        for row in t_rows:
+            pending.append(pool.apply_async(render_batch_row, (row,)))
+
+            # don't read the manifest faster than the pool renders it
+            if len(pending) >= t_jobs * 4:
+                failed_rows += t_report(pending.popleft().get())
+
+        while pending:
+            failed_rows += t_report(pending.popleft().get())
+
+    finally:
+        pool.close()
+        pool.join()
+
+    return failed_rows
+
+
+def find_templates(t_src_dir, t_glob, t_exclude_dirs=()):
+
+    """Returns the paths (relative to <t_src_dir>) of the template files inside <t_src_dir> that match <t_glob>.
+
+    The glob pattern is relative to <t_src_dir> and "**" matches any number of folders.
+    The files inside the <t_exclude_dirs> folders (for example the fragments and the output folders) are ignored.
+
+    Example:
+
+    >>> find_templates("src", "**/*.ty", ["src/fragments"])
+    ['Dockerfile.ty', 'nginx/site.conf.ty']
+
+    :param str t_src_dir: folder with the templates
+    :param str t_glob: glob pattern of the templates
+    :param list t_exclude_dirs: folders to ignore
+    :return templates: sorted list of the template paths, relative to <t_src_dir>
+    :rtype templates: list
+    """
+
+    import glob
+
+    exclude_dirs = [os.path.join(os.path.abspath(exclude_dir), "") for exclude_dir in t_exclude_dirs]
+
+    templates = []
+    for path in glob.glob(os.path.join(glob.escape(t_src_dir), t_glob), recursive=True):
+
+        if not os.path.isfile(path):
+            continue
+
+        abs_path = os.path.abspath(path)
+        if any(abs_path.startswith(exclude_dir) for exclude_dir in exclude_dirs):
+            continue
+
+        templates.append(os.path.relpath(path, t_src_dir))
+
+    templates.sort()
+
+    return templates
+
+
+def compile_template_file(t_path, t_regex_pattern):
+
+    """Opens the template file <t_path> and returns its compiled version.
+
+    :param str t_path: template file path
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :return template: compiled template
+    :rtype template: :class:`Template`
+    """
+
+    with open(t_path, "r") as fin:
+        return Template(fin, t_regex_pattern)
+
+
+def fragment_path(t_fragments_dir, t_name):
+
+    """Returns the path of the file to inject for the placeholder <t_name>, the file is inside <t_fragments_dir>.
+
+    The placeholder name is the path of the file relative to the fragments folder
+    (it can contain subfolders). Names that point outside the folder are not valid.
+
+    Example:
+
+    >>> fragment_path("fragments", "ssl/dev")
+    'fragments/ssl/dev'
+    >>> fragment_path(".", "ssl/dev")
+    'ssl/dev'
+    >>> fragment_path("fragments", "../secret") is None
+    True
+
+    :param str t_fragments_dir: folder with the files to inject
+    :param str t_name: placeholder name
+    :return path: path of the file to inject, None if the name isn't valid
+    :rtype path: str
+    """
+
+    path = os.path.normpath(os.path.join(t_fragments_dir, t_name))
+    if os.path.isabs(t_name):
+        return None
+
+    # the folder contains the file (and isn't the file): "." and "/" are folders like the others
+    fragments_dir = os.path.abspath(t_fragments_dir)
+    abs_path = os.path.abspath(path)
+    try:
+        if abs_path == fragments_dir or os.path.commonpath([fragments_dir, abs_path]) != fragments_dir:
+            return None
+    except ValueError:
+        # paths on different drives
+        return None
+
+    return path
+
+
+def resolve_fragment_placeholders(t_template, t_fragments_dir, t_stat_cache=None):
+
+    """Resolves the placeholders of the compiled template <t_template> to files of <t_fragments_dir> and checks them.
+
+    Each placeholder name is resolved with :func:`fragment_path()`,
+    the placeholders are then checked with :func:`check_template_placeholders()`.
+    The errors are printed to the standard error.
+
+    :param t_template: compiled template
+    :type t_template: :class:`Template`
+    :param str t_fragments_dir: folder with the files to inject
+    :param StatCache t_stat_cache: stat results of the run, None to use a new one
+    :return placeholders_index: placeholder name -> file path dictionary, None if the placeholders aren't valid
+    :rtype placeholders_index: dict
+    """
+
+    input_placeholders = []
+    bad_names = []
+    for name in set(t_template.placeholders):
+        path = fragment_path(t_fragments_dir, name)
+        if path is None:
+            bad_names.append(name)
+        else:
+            input_placeholders.append(name + "=" + path)
+
+    if bad_names:
+        if not testmode:
+            print("Bad placeholders: outside the fragments folder: '" + "', '".join(sorted(bad_names)) + "'",
+                  file=sys.stderr)
+        return None
+
+    return check_template_placeholders(t_template, input_placeholders, t_stat_cache)
+
+
+def map_jobs(t_function, t_items, t_jobs):
+
+    """Returns the results of <t_function> called on each item of <t_items>, by a pool of <t_jobs> threads.
+
+    > With <t_jobs> equal to 1 the calling thread does everything, without a pool
+
+    :param t_function: function called with each item
+    :param t_items: items
+    :param int t_jobs: number of threads
+    :return results: results, in the order of the items
+    :rtype results: list
+    """
+
+    if t_jobs == 1:
+        return [t_function(item) for item in t_items]
+
+    import concurrent.futures
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=t_jobs) as executor:
+        return list(executor.map(t_function, t_items))
+
+
+def compile_build_templates(t_src_dir, t_templates_paths, t_regex_pattern, t_jobs):
+
+    """Compiles the templates <t_templates_paths> (relative to <t_src_dir>) with a pool of <t_jobs> processes.
+
+    Parsing is CPU bound: the templates are compiled by processes, not threads.
+    The templates that can't be compiled are printed to the standard error.
+    > With <t_jobs> equal to 1 the calling process does everything, without a pool
+
+    :param str t_src_dir: folder with the templates
+    :param list t_templates_paths: paths of the templates, relative to <t_src_dir>
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :param int t_jobs: number of processes
+    :return compiled: template path -> compiled template (in the order of the paths),
+                      and the number of templates that couldn't be compiled
+    :rtype compiled: tuple
+    """
+
+    compiled = collections.OrderedDict()  # template path -> compiled template
+    failed_templates = 0
+
+    if t_jobs == 1:
+        results = ((template_path, functools.partial(compile_template_file, os.path.join(t_src_dir, template_path),
+                                                     t_regex_pattern))
+                   for template_path in t_templates_paths)
+        failed_templates = collect_build_results(results, compiled)
+    else:
+        import concurrent.futures
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=t_jobs) as executor:
+            results = [(template_path, executor.submit(compile_template_file, os.path.join(t_src_dir, template_path),
+                                                       t_regex_pattern).result)
+                       for template_path in t_templates_paths]
+            failed_templates = collect_build_results(results, compiled)
+
+    return compiled, failed_templates
+
+
+def collect_build_results(t_results, t_compiled):
+
+    """Saves the compiled templates of <t_results> inside <t_compiled>, the failed ones are printed.
+
+    :param t_results: (template path, function that returns the compiled template) tuples
+    :param t_compiled: template path -> compiled template dictionary that gets filled
+    :type t_compiled: :class:`collections.OrderedDict`
+    :return failed_templates: number of templates that couldn't be compiled
+    :rtype failed_templates: int
+    """
+
+    failed_templates = 0
+
+    for template_path, result in t_results:
+        try:
+            t_compiled[template_path] = result()
+        except (IOError, OSError, ValueError) as e:
+            print_error("Build of '" + template_path + "' failed: " + str(e))
+            failed_templates += 1
+
+    return failed_templates
+
+
+def resolve_build_inputs(t_template, t_fragments_dir, t_expander, t_stat_cache):
+
+    """Resolves the placeholders of the compiled template <t_template> of a build and checks them.
+
+    The placeholders are files of <t_fragments_dir> (see :func:`resolve_fragment_placeholders()`).
+    If the include expander <t_expander> is given, the placeholders inside the injected files
+    must be files of the fragments folder too: they are inputs of the template.
+
+    :param t_template: compiled template
+    :type t_template: :class:`Template`
+    :param str t_fragments_dir: folder with the files to inject
+    :param t_expander: expander of the placeholders inside the files to inject, None to inject them as they are
+    :type t_expander: :class:`IncludeExpander`
+    :param StatCache t_stat_cache: stat results of the build
+    :return placeholders_index: placeholder name -> file path dictionary of the template,
+                                and the same dictionary with the placeholders of the injected files too
+    :rtype placeholders_index: tuple
+    :raises ValueError: if the placeholders aren't valid
+    :raises IncludeError: if the includes have a cycle or are too deep
+    """
+
+    placeholders_index = resolve_fragment_placeholders(t_template, t_fragments_dir, t_stat_cache)
+    if placeholders_index is None:
+        raise ValueError("bad placeholders")
+
+    if t_expander is None:
+        return placeholders_index, placeholders_index
+
+    nested_names = t_expander.check(t_template.placeholders)
+
+    inputs = dict(placeholders_index)
+    for name in nested_names:
+        inputs[name] = t_expander.resolver(name)
+
+    bad_names = sorted(name for name in nested_names
+                       if inputs[name] is None or not t_stat_cache.isfile(inputs[name]))
+    if bad_names:
+        raise ValueError("placeholders of the injected files without file: '" + "', '".join(bad_names) + "'")
+
+    return placeholders_index, inputs
+
+
+def read_build_fragments(t_placeholders_indexes, t_stat_cache, t_expander, t_jobs):
+
+    """Reads the files to inject of all the templates of a build once, with a pool of <t_jobs> threads.
+
+    Reading is I/O bound: the files are read by threads and kept inside the cache of <t_stat_cache>,
+    which is shared by all the templates.
+    If the include expander <t_expander> is given, each file is expanded once too,
+    before the threads of the renders share the expanded content.
+
+    :param t_placeholders_indexes: placeholder name -> file path dictionaries of the templates
+    :param StatCache t_stat_cache: stat results of the build, with the cache of the files to inject
+    :param t_expander: expander of the placeholders inside the files to inject, None to inject them as they are
+    :type t_expander: :class:`IncludeExpander`
+    :param int t_jobs: number of threads
+    :return: cache the templates are rendered with (the expander if it is given)
+             and the file path -> error dictionary of the files that couldn't be read (like a file that isn't UTF-8)
+    :rtype: tuple
+    """
+
+    fragments = set()
+    for placeholders_index in t_placeholders_indexes:
+        fragments.update(placeholders_index.values())
+
+    def read(t_path):
+        try:
+            t_stat_cache.get(t_path)
+        except (IOError, OSError, ValueError) as e:
+            return t_path, e
+        return t_path, None
+
+    errors = {path: e for path, e in map_jobs(read, fragments, t_jobs) if e is not None}
+
+    if t_expander is None:
+        return t_stat_cache, errors
+
+    for path in fragments - set(errors):
+        try:
+            t_expander.get(path)
+        except (IOError, OSError, ValueError, IncludeError) as e:
+            errors[path] = e
+
+    return t_expander, errors
+
+
+def skip_failed_fragments(t_indexes, t_errors):
+
+    """Removes from <t_indexes> the templates that inject a file that couldn't be read.
+
+    The failed templates are printed to the standard error.
+
+    :param collections.OrderedDict t_indexes: template path -> placeholders index dictionary of a build
+    :param dict t_errors: file path -> error dictionary, as returned by :func:`read_build_fragments()`
+    :return failed_templates: number of templates removed
+    :rtype failed_templates: int
+    """
+
+    failed_templates = 0
+
+    for template_path in list(t_indexes):
+        bad_paths = sorted(set(t_indexes[template_path].values()) & set(t_errors))
+        if bad_paths:
+            print_error("Build of '" + template_path + "' failed: can't read '" + bad_paths[0] + "': "
+                        + str(t_errors[bad_paths[0]]))
+            del t_indexes[template_path]
+            failed_templates += 1
+
+    return failed_templates
+
+
+def skip_built_templates(t_src_dir, t_out_dir, t_templates_paths, t_stamps, t_stat_cache):
+
+    """Returns the templates of a build whose output isn't up to date (see :class:`StampDatabase`).
+
+    The injected files recorded the last time are checked.
+    The signatures of the template files are taken before compiling the templates.
+
+    :param str t_src_dir: folder with the templates
+    :param str t_out_dir: output folder
+    :param list t_templates_paths: paths of the templates, relative to <t_src_dir>
+    :param t_stamps: stamp database of the incremental mode
+    :type t_stamps: :class:`StampDatabase`
+    :param StatCache t_stat_cache: stat results of the build
+    :return templates_paths: paths of the templates to render,
+                             and the template path -> signatures of the template file dictionary
+    :rtype templates_paths: tuple
+    """
+
+    templates_paths = [template_path for template_path in t_templates_paths
+                       if not t_stamps.is_up_to_date(os.path.join(t_out_dir, template_path), None, t_stat_cache)]
+
+    signatures = {template_path: file_signatures({"<template>": os.path.join(t_src_dir, template_path)},
+                                                 t_stat_cache)
+                  for template_path in templates_paths}
+
+    return templates_paths, signatures
+
+
+def render_build_output(t_template_path, t_template, t_output, t_placeholders_index, t_fragment_cache, t_stamps=None,
+                        t_signatures=None):
+
+    """Renders the compiled template <t_template> of a build to <t_output>, the missing subfolders are created.
+
+    If the stamp database <t_stamps> is given, the rendered output is recorded with the signatures of its inputs.
+    The error of an output that can't be written is printed to the standard error.
+
+    :param str t_template_path: template path, relative to the templates folder (shown by the error message)
+    :param t_template: compiled template
+    :type t_template: :class:`Template`
+    :param str t_output: output file path
+    :param dict t_placeholders_index: placeholder name -> file path dictionary
+    :param t_fragment_cache: cache of the files to inject
+    :type t_fragment_cache: :class:`FragmentCache`
+    :param t_stamps: stamp database of the incremental mode, None to skip the record
+    :type t_stamps: :class:`StampDatabase`
+    :param dict t_signatures: signatures of the inputs, taken before rendering
+    :return failed: 1 if the output couldn't be rendered, 0 otherwise
+    :rtype failed: int
+    """
+
+    try:
+        if not os.path.isdir(os.path.dirname(t_output)):
+            os.makedirs(os.path.dirname(t_output), exist_ok=True)
+
+        with write_if_changed(t_output) as fout:
+            t_template.render(fout, t_placeholders_index, t_fragment_cache)
+
+    except (IOError, OSError, ValueError) as e:
+        print_error("Build of '" + t_template_path + "' failed: " + str(e))
+        return 1
+
+    if t_stamps is not None:
+        t_stamps.record(t_output, t_signatures)
+    return 0
+
+
+def run_build(t_src_dir, t_out_dir, t_fragments_dir, t_glob, t_regex_pattern, t_jobs=None, t_stamps=None,
+              t_expander=None):
+
+    """Renders all the templates of <t_src_dir> to <t_out_dir>, the placeholders are files of <t_fragments_dir>.
+
+    The build has four phases:
+    1. the templates are found with :func:`find_templates()`
+    (the fragments and the output folders are ignored)
+    2. the templates are compiled by a pool of processes (parsing is CPU bound)
+    3. the placeholders of each template are resolved with :func:`fragment_path()` and checked,
+    then all the files to inject are read by a pool of threads (reading is I/O bound).
+    Each file is read once and kept inside the module's ``fragment_cache``,
+    which is shared by all the templates.
+    The files are stat'ed once too: the checks, the stamps and the reads share a :class:`StatCache`
+    4. the templates are rendered by a pool of threads: each output has the path of its template,
+    relative to <t_out_dir>, the missing subfolders are created
+    > With <t_jobs> equal to 1 everything is done by the calling thread, without pools
+
+    If the stamp database <t_stamps> is given, the templates whose output is up to date
+    (see :class:`StampDatabase`) are skipped before being compiled and the rendered templates are recorded.
+    > The configuration of the stamp database should contain the fragments folder:
+    > the same placeholders point to different files if the folder changes
+
+    If the include expander <t_expander> is given (see :class:`IncludeExpander`), the placeholders inside
+    the files to inject are expanded too: the includes of each template are checked in phase 3
+    and each file is expanded once before rendering, all the templates share the expanded files.
+
+    The templates that fail are printed to the standard error and counted.
+
+    :param str t_src_dir: folder with the templates
+    :param str t_out_dir: output folder
+    :param str t_fragments_dir: folder with the files to inject
+    :param str t_glob: glob pattern of the templates, relative to <t_src_dir>
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :param int t_jobs: number of processes and threads, by default the number of CPUs
+    :param t_stamps: stamp database of the incremental mode, None to render every template
+    :type t_stamps: :class:`StampDatabase`
+    :param t_expander: expander of the placeholders inside the files to inject, None to inject them as they are
+    :type t_expander: :class:`IncludeExpander`
+    :return failed_templates: number of templates that couldn't be rendered
+    :rtype failed_templates: int
+    """
+
+    if t_jobs is None:
+        t_jobs = os.cpu_count() or 1
+
+    templates_paths = find_templates(t_src_dir, t_glob, [t_fragments_dir, t_out_dir])
+
+    # stat results of the build: a fragment injected by many templates is stat'ed once
+    stats = StatCache()
+
+    # template path -> signatures of the inputs of the template (the template file and the injected files)
+    signatures = {}
+    if t_stamps is not None:
+        templates_paths, signatures = skip_built_templates(t_src_dir, t_out_dir, templates_paths, t_stamps, stats)
+
+    # 1. compile the templates
+    compiled, failed_templates = compile_build_templates(t_src_dir, templates_paths, t_regex_pattern, t_jobs)
+
+    # 2. resolve and check the placeholders of each template
+    indexes = collections.OrderedDict()  # template path -> placeholders index
+    for template_path, template in compiled.items():
+
+        try:
+            indexes[template_path], inputs = resolve_build_inputs(template, t_fragments_dir, t_expander, stats)
+        except (ValueError, IncludeError) as e:
+            print_error("Build of '" + template_path + "' failed: " + str(e))
+            failed_templates += 1
+            continue
+
+        if t_stamps is not None:
+            # the files included by the injected files are inputs too
+            signatures[template_path].update(file_signatures(inputs, stats))
+
+    # 3. read each file to inject once, all the templates share the cache
+    # > a file that can't be read fails only the templates that inject it
+    fragment_cache, errors = read_build_fragments(indexes.values(), stats, t_expander, t_jobs)
+    failed_templates += skip_failed_fragments(indexes, errors)
+
+    # 4. render the templates
+    def render(t_template_path):
+        return render_build_output(t_template_path, compiled[t_template_path], os.path.join(t_out_dir, t_template_path),
+                                   indexes[t_template_path], fragment_cache, t_stamps, signatures.get(t_template_path))
+
+    failed_templates += sum(map_jobs(render, indexes, t_jobs))
+
+    return failed_templates
+
+
+class PollingMonitor:
+
+    """Notices the changes of a set of files by polling their :func:`os.stat()` signature.
+
+    This monitor works everywhere, :class:`InotifyMonitor` is used when available.
+
+    :param float t_interval: seconds between two polls
+    """
+
+    def __init__(self, t_interval=0.1):
+
+        self.interval = t_interval
+
+        # watched path -> (modification time in ns, size, inode), None if the file doesn't exist
+        self.signatures = {}
+
+    def watch(self, t_paths):
+
+        """Sets the files to watch, the new ones are added and the missing ones are removed.
+
+        :param t_paths: paths of the files to watch
+        :type t_paths: iterable
+        :return: None
+        """
+
+        paths = set(os.path.abspath(path) for path in t_paths)
+
+        for path in set(self.signatures) - paths:
+            del self.signatures[path]
+
+        for path in paths - set(self.signatures):
+            self.signatures[path] = self._signature(path)
+
+    def wait(self, t_timeout):
+
+        """Waits at most <t_timeout> seconds for at least one watched file to change.
+
+        :param float t_timeout: maximum number of seconds to wait
+        :return changed: absolute paths of the changed files (empty if nothing changed)
+        :rtype changed: set
+        """
+
+        deadline = time.monotonic() + t_timeout
+        changed = set()
+
+        while True:
+            for path in self.signatures:
+                signature = self._signature(path)
+                if signature != self.signatures[path]:
+                    self.signatures[path] = signature
+                    changed.add(path)
+
+            if changed or time.monotonic() >= deadline:
+                return changed
+
+            time.sleep(min(self.interval, max(deadline - time.monotonic(), 0)))
+
+    def close(self):
+
+        """Stops watching the files.
+
+        :return: None
+        """
+
+        self.signatures.clear()
+
+    @staticmethod
+    def _signature(t_path):
+
+        """Returns the (modification time in ns, size, inode) signature of <t_path>, None if it doesn't exist.
+
+        :param str t_path: file path
+        :return signature: signature of the file
+        :rtype signature: tuple
+        """
+
+        try:
+            st = os.stat(t_path)
+        except OSError:
+            return None
+
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class InotifyMonitor:
+
+    """Notices the changes of a set of files with the Linux inotify API (used through :mod:`ctypes`).
+
+    The folders of the files are watched instead of the files themselves:
+    this way the files that editors replace (write to a temporary file, then rename) are noticed too.
+
+    The constructor raises :class:`OSError` if inotify isn't available.
+    """
+
+    # inotify event masks (see "man 7 inotify")
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+
+    def __init__(self):
+
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is available only on Linux")
+
+        import ctypes
+        import ctypes.util
+        import struct
+
+        # header of each event: watch descriptor, mask, cookie, length of the name
+        self.event_header = struct.Struct("iIII")
+
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.paths = set()   # absolute paths of the watched files
+        self.folders = {}    # watched folder -> watch descriptor
+        self.descriptors = {}  # watch descriptor -> watched folder
+
+    def watch(self, t_paths):
+
+        """Sets the files to watch, the folders of the new files are added to the inotify instance.
+
+        :param t_paths: paths of the files to watch
+        :type t_paths: iterable
+        :return: None
+        """
+
+        self.paths = set(os.path.abspath(path) for path in t_paths)
+
+        mask = (self.IN_MODIFY | self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO
+                | self.IN_CREATE | self.IN_DELETE)
+
+        for folder in set(os.path.dirname(path) for path in self.paths) - set(self.folders):
+            descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), mask)
+
+            # a folder that doesn't exist can't be watched, its files are reported as changed when it is created
+            if descriptor >= 0:
+                self.folders[folder] = descriptor
+                self.descriptors[descriptor] = folder
+
+    def wait(self, t_timeout):
+
+        """Waits at most <t_timeout> seconds for at least one watched file to change.
+
+        :param float t_timeout: maximum number of seconds to wait
+        :return changed: absolute paths of the changed files (empty if nothing changed)
+        :rtype changed: set
+        """
+
+        changed = set()
+
+        import select
+
+        readable, _, _ = select.select([self.fd], [], [], t_timeout)
+        if not readable:
+            return changed
+
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        position = 0
+        while position + self.event_header.size <= len(data):
+            descriptor, _, _, name_length = self.event_header.unpack_from(data, position)
+            position += self.event_header.size
+
+            # the name is padded with null bytes
+            name = data[position:position + name_length].rstrip(b"\0")
+            position += name_length
+
+            folder = self.descriptors.get(descriptor)
+            if folder is not None:
+                path = os.path.join(folder, os.fsdecode(name))
+                if path in self.paths:
+                    changed.add(path)
+
+        return changed
+
+    def close(self):
+
+        """Closes the inotify instance.
+
+        :return: None
+        """
+
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def make_monitor():
+
+    """Returns an :class:`InotifyMonitor` if inotify is available, a :class:`PollingMonitor` otherwise.
+
+    :return monitor: file changes monitor
+    :rtype monitor: :class:`InotifyMonitor` or :class:`PollingMonitor`
+    """
+
+    try:
+        return InotifyMonitor()
+    except (OSError, AttributeError):
+        return PollingMonitor()
+
+
+class Watcher:
+
+    """Keeps the outputs up to date: when a file changes only the outputs that depend on it are rendered again.
+
+    Each output is added with :meth:`add()`, together with its template and a resolver:
+    a function that receives the compiled template and returns its placeholders index
+    (None if the placeholders aren't valid), for example :func:`check_template_placeholders()`
+    or :func:`resolve_fragment_placeholders()` with the other arguments already set.
+
+    The watcher keeps a reverse dependency map: each template and each injected file
+    is associated to the outputs that use it.
+    The compiled templates (and the module's ``fragment_cache``) stay in memory between renders:
+    only the changed templates are compiled again and only the changed files are read again.
+
+    The changes are noticed by a monitor (see :func:`make_monitor()`) and debounced:
+    the outputs are rendered when no file changes for <t_debounce> seconds,
+    this way a burst of changes (an editor saving many files) renders each output once.
+
+    Example:
+
+    >>> watcher = Watcher(re_builder("{{", "ty.", "}}"))
+    >>> watcher.add("template.txt", "output.txt",
+    ...             lambda template: check_template_placeholders(template, ["placeholder1=file1.txt"]))
+    >>> watcher.render_all()
+    >>> watcher.run()  # renders output.txt again every time template.txt or file1.txt changes
+
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :param t_monitor: file changes monitor, by default the one returned by :func:`make_monitor()`
+    :param float t_debounce: seconds without changes to wait before rendering
+    """
+
+    def __init__(self, t_regex_pattern, t_monitor=None, t_debounce=0.2):
+
+        if t_monitor is None:
+            t_monitor = make_monitor()
+
+        self.regex_pattern = t_regex_pattern
+        self.monitor = t_monitor
+        self.debounce = t_debounce
+
+        self.jobs = collections.OrderedDict()  # output -> (template path, resolver)
+        self.templates = {}                    # template path -> compiled template
+        self.dependencies = {}                 # watched path -> set of the outputs that use it
+        self.outputs_dependencies = {}         # output -> set of the paths it depends on
+
+    def add(self, t_template_path, t_output, t_resolver):
+
+        """Adds an output to keep up to date.
+
+        :param str t_template_path: template file path
+        :param str t_output: output file path
+        :param t_resolver: function that receives the compiled template and returns its placeholders index
+        :type t_resolver: callable
+        :return: None
+        """
+
+        output = os.path.abspath(t_output)
+        self.jobs[output] = (os.path.abspath(t_template_path), t_resolver)
+        self._set_dependencies(output, [self.jobs[output][0]])
+
+    def render(self, t_output):
+
+        """Renders the output <t_output>, the template is compiled only if it isn't already.
+
+        After the render the dependencies of the output are updated:
+        they are the template and the files that were injected.
+
+        :param str t_output: output file path (as passed to :meth:`add()`)
+        :return rendered: True if the output was rendered
+        :rtype rendered: bool
+        """
+
+        output = os.path.abspath(t_output)
+        template_path, resolver = self.jobs[output]
+
+        try:
+            template = self.templates.get(template_path)
+            if template is None:
+                template = compile_template_file(template_path, self.regex_pattern)
+                self.templates[template_path] = template
+
+            placeholders_index = resolver(template)
+
+            if placeholders_index is not None:
+                with write_if_changed(output) as fout:
+                    template.render(fout, placeholders_index)
+
+        except (IOError, OSError, ValueError) as e:
+            if not testmode:
+                print("Can't render '" + t_output + "': " + str(e), file=sys.stderr)
+            placeholders_index = None
+
+        if placeholders_index is None:
+            # the output depends at least on the template, when it is fixed the output is rendered again
+            self._set_dependencies(output, [template_path])
+            return False
+
+        self._set_dependencies(output, [template_path] + list(placeholders_index.values()))
+        return True
+
+    def render_all(self):
+
+        """Renders all the outputs.
+
+        :return failed_outputs: number of outputs that couldn't be rendered
+        :rtype failed_outputs: int
+        """
+
+        return sum(not self.render(output) for output in list(self.jobs))
+
+    def affected_outputs(self, t_paths):
+
+        """Returns the outputs that depend on at least one of the files <t_paths>.
+
+        :param t_paths: paths of the changed files
+        :type t_paths: iterable
+        :return outputs: outputs to render again
+        :rtype outputs: set
+        """
+
+        outputs = set()
+        for path in t_paths:
+            outputs.update(self.dependencies.get(os.path.abspath(path), ()))
+
+        return outputs
+
+    def rebuild(self, t_paths):
+
+        """Renders again the outputs that depend on the changed files <t_paths>.
+
+        The changed templates are compiled again, the changed injected files
+        are read again by the fragment cache (which notices the change by itself).
+
+        :param t_paths: paths of the changed files
+        :type t_paths: iterable
+        :return rendered: dictionary with the affected outputs as keys and True if they were rendered as values
+        :rtype rendered: dict
+        """
+
+        paths = set(os.path.abspath(path) for path in t_paths)
+
+        # forget the changed templates
+        for path in paths:
+            self.templates.pop(path, None)
+
+        # the dependencies are looked up once, before the renders change them
+        affected = self.affected_outputs(paths)
+
+        rendered = {}
+        for output in self.jobs:
+            if output in affected:
+                start = time.perf_counter()
+                rendered[output] = self.render(output)
+
+                if rendered[output] and not testmode:
+                    print("Rendered '" + output + "' in " + format((time.perf_counter() - start) * 1000, ".1f")
+                          + " ms", file=sys.stderr)
+
+        return rendered
+
+    def run(self, t_iterations=None):
+
+        """Watches the dependencies and renders again the affected outputs, until interrupted.
+
+        :param int t_iterations: number of changes to handle before returning, None to never return
+        :return: None
+        """
+
+        try:
+            while t_iterations is None or t_iterations > 0:
+                changed = self.monitor.wait(1.0)
+                if not changed:
+                    continue
+
+                # debounce: collect the changes until no file changes for a while
+                more = self.monitor.wait(self.debounce)
+                while more:
+                    changed.update(more)
+                    more = self.monitor.wait(self.debounce)
+
+                self.rebuild(changed)
+
+                if t_iterations is not None:
+                    t_iterations -= 1
+
+        except KeyboardInterrupt:
+            pass
+
+    def _set_dependencies(self, t_output, t_paths):
+
+        """Replaces the dependencies of the output <t_output> with the files <t_paths>.
+
+        :param str t_output: absolute output file path
+        :param list t_paths: paths the output depends on
+        :return: None
+        """
+
+        for path in self.outputs_dependencies.get(t_output, ()):
+            self.dependencies[path].discard(t_output)
+            if not self.dependencies[path]:
+                del self.dependencies[path]
+
+        paths = set(os.path.abspath(path) for path in t_paths)
+        self.outputs_dependencies[t_output] = paths
+        for path in paths:
+            self.dependencies.setdefault(path, set()).add(t_output)
+
+        self.monitor.watch(self.dependencies)
+
+
+@contextlib.contextmanager
+def null_context():
+
+    """Context manager that does nothing, like :func:`contextlib.nullcontext()` (Python 3.7+).
+
+    :return: None
+    """
+
+    yield
+
+
+def read_source(t_source):
+
+    """Returns the text of a template, or of a placeholder value, passed to :func:`render()`.
+
+    The source can be:
+    - a path-like object (like :class:`pathlib.Path`): the file is read through the module's ``fragment_cache``
+    - a str: the text itself
+    - bytes: the text is decoded as UTF-8, the bytes that aren't UTF-8 become surrogates ("surrogateescape"),
+    this way encoding the text back gives the same bytes
+    - a file-like object: its content is read (bytes are decoded like above)
+
+    Example:
+
+    >>> read_source(pathlib.Path("file1.txt"))
+    ('----\nthis\nis placeholder1\ncontent\n----', False)
+    >>> read_source(b"text")
+    ('text', True)
+
+    :param t_source: path-like object, str, bytes or file-like object
+    :return: (text, True if the source was bytes) tuple
+    :rtype: tuple
+    :raises TypeError: if the source isn't one of the supported types
+    """
+
+    # os.PathLike needs Python 3.6, the pathlib paths of Python 3.5 don't have __fspath__()
+    if hasattr(t_source, "__fspath__"):
+        return fragment_cache.get(t_source.__fspath__()), False
+    if "pathlib" in sys.modules and isinstance(t_source, sys.modules["pathlib"].PurePath):
+        return fragment_cache.get(str(t_source)), False
+
+    if not isinstance(t_source, (str, bytes)):
+        if not hasattr(t_source, "read"):
+            raise TypeError("expected a path-like object, str, bytes or a file-like object, not "
+                            + type(t_source).__name__)
+        t_source = t_source.read()
+
+    if isinstance(t_source, bytes):
+        return t_source.decode("utf-8", "surrogateescape"), True
+
+    return t_source, False
+
+
+def compile_template_text(t_text, t_regex_pattern):
+
+    """Returns the compiled version of the template text <t_text>.
+
+    The compiled templates are cached: rendering the same text many times compiles it once.
+    The cache is keyed by the SHA-1 hash of the text, not by the text:
+    it keeps only the segments of the last ``compiled_templates_max`` templates.
+    Bytes are compiled as they are with a bytes pattern (see :class:`Template`).
+
+    :param t_text: template text
+    :type t_text: str or bytes
+    :param t_regex_pattern: regex pattern
+    :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+    :return template: compiled template
+    :rtype template: :class:`Template`
+    """
+
+    import hashlib
+
+    binary = isinstance(t_text, bytes)
+    key = (hashlib.sha1(t_text if binary else t_text.encode("utf-8", "surrogatepass")).digest(),
+           binary, t_regex_pattern)
+
+    with compiled_templates_lock:
+        template = compiled_templates.get(key)
+        if template is not None:
+            compiled_templates.move_to_end(key)
+            return template
+
+    if binary:
+        template = Template(io.BytesIO(t_text), t_regex_pattern)
+    else:
+        # keep the line endings of the text as they are
+        template = Template(io.StringIO(t_text, newline=""), t_regex_pattern)
+
+    with compiled_templates_lock:
+        compiled_templates[key] = template
+        while len(compiled_templates) > compiled_templates_max:
+            compiled_templates.popitem(last=False)
+
+    return template
+
+
+class TemplateCache:
+
+    """Folder of compiled templates (".tyc" files) shared by the runs, like the ".pyc" files of Python.
+
+    A compiled template is saved as the spans of its placeholders (see :attr:`Template.spans`)
+    together with the configuration it was compiled with (the tags, the dialects, text or binary):
+    the next runs read the template, load the spans and build the segments without scanning it.
+
+    The file name is the hash of the template content and of the configuration,
+    this way a changed template or different tags never find a stale file: they have a new one.
+    Each file also holds its key and configuration, they are checked when it is loaded.
+    > A missing, broken or unreadable file is a miss: the template is compiled and the file is written again
+
+    The files are written to a temporary file which then replaces the old one (see :func:`write_if_changed()`):
+    concurrent runs can write the same file, the readers always see a whole file.
+    If the folder can't be written the templates are compiled as usual.
+
+    Example:
+
+    >>> cache = TemplateCache(".templately-cache", ["{{", "ty.", "}}"])
+    >>> template = cache.compile(text, re_builder("{{", "ty.", "}}"))  # writes <hash>.tyc
+    >>> template = cache.compile(text, re_builder("{{", "ty.", "}}"))  # loads <hash>.tyc
+
+    :param str t_dir: cache folder, created if it doesn't exist
+    :param list t_config: configuration of the templates (the tags of the pattern, ...)
+    """
+
+    def __init__(self, t_dir, t_config):
+
+        self.dir = t_dir
+        self.config = tuple(t_config)
+
+        # number of templates loaded from the folder and compiled from their text
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, t_text):
+
+        """Returns the key of the template text <t_text>: the hash of the text and of the configuration.
+
+        :param t_text: template text
+        :type t_text: str or bytes
+        :return: hexadecimal hash
+        :rtype: str
+        """
+
+        import hashlib
+
+        digest = hashlib.sha1(repr((self.config, isinstance(t_text, bytes))).encode("utf-8"))
+        if isinstance(t_text, str):
+            t_text = t_text.encode("utf-8", "surrogatepass")
+        digest.update(t_text)
+
+        return digest.hexdigest()
+
+    def path(self, t_key):
+
+        """Returns the path of the file of the key <t_key>.
+
+        :param str t_key: key of a template text (see :meth:`key()`)
+        :return: file path
+        :rtype: str
+        """
+
+        return os.path.join(self.dir, t_key + ".tyc")
+
+    def load(self, t_text, t_key):
+
+        """Returns the template <t_text> built from the spans saved inside its file, None if it can't be used.
+
+        :param t_text: template text
+        :type t_text: str or bytes
+        :param str t_key: key of the template text
+        :return template: compiled template, None if the file is missing or broken
+        :rtype template: :class:`Template`
+        """
+
+        import marshal
+
+        try:
+            with open(self.path(t_key), "rb") as fin:
+                content = fin.read()
+
+            if not content.startswith(TEMPLATE_CACHE_MAGIC):
+                return None
+
+            key, config, spans = marshal.loads(content[len(TEMPLATE_CACHE_MAGIC):])
+            if key != t_key or config != self.config:
+                return None
+
+            return Template.from_spans(t_text, spans)
+
+        except (OSError, EOFError, ValueError, TypeError):
+            # a broken file is a miss, it is written again
+            return None
+
+    def save(self, t_key, t_template):
+
+        """Writes the spans of the compiled template <t_template> to the file of the key <t_key>.
+
+        :param str t_key: key of the template text
+        :param t_template: compiled template
+        :type t_template: :class:`Template`
+        :return: None
+        """
+
+        import marshal
+
+        content = TEMPLATE_CACHE_MAGIC + marshal.dumps((t_key, self.config, t_template.spans))
+
+        try:
+            os.makedirs(self.dir, exist_ok=True)
+            with write_if_changed(self.path(t_key), True) as fout:
+                fout.write(content)
+        except OSError:
+            # the cache is only an optimization: the template has been compiled anyway
+            pass
+
+    def compile(self, t_text, t_regex_pattern):
+
+        """Returns the compiled version of the template text <t_text>, from its file if it exists.
+
+        :param t_text: template text
+        :type t_text: str or bytes
+        :param t_regex_pattern: regex pattern, used only if the template isn't inside the folder
+        :type t_regex_pattern: :class:`_sre.SRE_Pattern`
+        :return template: compiled template
+        :rtype template: :class:`Template`
+        """
+
+        key = self.key(t_text)
+
+        template = self.load(t_text, key)
+        if template is not None:
+            self.hits += 1
+            return template
+
+        self.misses += 1
+        template = compile_template_text(t_text, t_regex_pattern)
+        self.save(key, template)
+
+        return template
+
+
+def render(t_template, t_mapping, t_out=None, t_tags=None, t_dialects=(), t_stats=None):
+
+    """Renders the template <t_template> with the placeholder values of <t_mapping>, inside the calling process.
+
+    The template and the values of <t_mapping> can be path-like objects (files),
+    str and bytes (content) or file-like objects (see :func:`read_source()`).
+    Like in the command line, the placeholders of the template must be the keys of <t_mapping>:
+    missing, extra or repeated placeholders raise :class:`PlaceholderError`.
+    Nothing is printed, every error is an exception.
+
+    The rendered text is written to the file-like object <t_out> (bytes if it is a binary file),
+    or it is returned if <t_out> is None: bytes if the template was bytes, str otherwise.
+    > Bytes are passed through unchanged, whatever their encoding
+
+    Templates and files are cached, this way the function can be called many times from the same process:
+    the files are read again only if they change and the same template text is compiled only once.
+
+    If <t_stats> is given (see :class:`RenderStats`), it is filled like the --stats option of the command line:
+    the phases ("re_builder", "scan", "validation", "read", "render"), the bytes and the time of each
+    placeholder value (by placeholder name), the bytes written and the matches.
+
+    Example:
+
+    >>> render("Hello {{ ty.name }}!", {"name": "World"})
+    'Hello World!'
+    >>> render(pathlib.Path("template.txt"), {"placeholder1": pathlib.Path("file1.txt"), ...}, sys.stdout)
+    >>> render(b"%% template.a %%", {"a": b"\xff"}, t_tags=("%%", "template.", "%%"))
+    b'\xff'
+
+    :param t_template: template: path-like object, str, bytes or file-like object
+    :param dict t_mapping: placeholder name -> value (path-like object, str, bytes or file-like object)
+    :param t_out: file-like object the output is written to, None to return the output
+    :param tuple t_tags: (opening tag, pattern opening, closing tag), by default the module's tags
+    :param tuple t_dialects: more (opening tag, pattern opening, closing tag) tuples (see :func:`re_builder_multi()`)
+    :param t_stats: statistics to fill, None to skip them
+    :type t_stats: :class:`RenderStats`
+    :return: the rendered text if <t_out> is None, None otherwise
+    :rtype: str or bytes
+    :raises PlaceholderError: if the placeholders of the template and of <t_mapping> aren't the same
+    :raises OSError: if a file can't be read
+    """
+
+    # without statistics the phases aren't timed
+    def phase(t_name):
+        return t_stats.phase(t_name) if t_stats is not None else null_context()
+
+    if t_tags is None:
+        t_tags = (opening_tag, pattern_opening, closing_tag)
+
+    with phase("re_builder"):
+        regex_pattern = re_builder_multi((tuple(t_tags),) + tuple(t_dialects))
+
+    with phase("scan"):
+        text, binary = read_source(t_template)
+        template = compile_template_text(text, regex_pattern)
+    if t_stats is not None:
+        t_stats.matches = len(template.placeholders)
+
+    # the placeholders of the template and of the mapping must be the same
+    # > the keys of a mapping can't be repeated, a template without placeholders is rendered as it is
+    with phase("validation"):
+        report = validate_placeholders(template.placeholders, t_mapping)
+    if report.missing or report.extra or report.template_duplicates:
+        raise PlaceholderError(report.missing, report.extra, report.template_duplicates)
+
+    with phase("read"):
+        values = read_mapping_values(t_mapping, template.placeholders, t_stats)
+
+    fout, out_binary = render_output(t_out, t_stats)
+
+    with phase("render"):
+        write_segments(template.segments, values, fout, out_binary)
+
+    if t_out is None:
+        output = fout.getvalue()
+        if binary:
+            output = output.encode("utf-8", "surrogateescape")
+        if t_stats is not None:
+            t_stats.bytes_written = content_size(output)
+        return output
+
+    if t_stats is not None:
+        t_stats.bytes_written = fout.bytes_written
+
+    return None
+
+
+def render_output(t_out, t_stats=None):
+
+    """Returns the file the output of :func:`render()` is written to.
+
+    :param t_out: file-like object the output is written to, None to collect the output in memory
+    :param t_stats: statistics to fill, the bytes written to <t_out> are counted (see :class:`CountingWriter`)
+    :type t_stats: :class:`RenderStats`
+    :return: the output file and True if it is a binary file
+    :rtype: tuple
+    """
+
+    if t_out is None:
+        return io.StringIO(), False
+
+    out_binary = isinstance(t_out, (io.RawIOBase, io.BufferedIOBase))
+
+    if t_stats is not None:
+        return CountingWriter(t_out), out_binary
+
+    return t_out, out_binary
+
+
+def read_mapping_values(t_mapping, t_placeholders, t_stats=None):
+
+    """Returns the text of each placeholder value of <t_mapping> (see :func:`read_source()`).
+
+    If <t_stats> is given each value is timed, and its bytes are counted once for each injection
+    (the occurrences of the placeholder inside <t_placeholders>).
+
+    :param dict t_mapping: placeholder name -> value (path-like object, str, bytes or file-like object)
+    :param list t_placeholders: placeholders of the template, repeated ones included
+    :param t_stats: statistics to fill, None to skip them
+    :type t_stats: :class:`RenderStats`
+    :return values: placeholder name -> text
+    :rtype values: dict
+    """
+
+    if t_stats is None:
+        return {name: read_source(t_mapping[name])[0] for name in t_mapping}
+
+    injections = collections.Counter(t_placeholders)
+    values = {}
+
+    for name in t_mapping:
+        start = time.perf_counter()
+        values[name] = read_source(t_mapping[name])[0]
+        elapsed = time.perf_counter() - start
+
+        size = content_size(values[name])
+        for _ in range(injections[name]):
+            t_stats.add_source(name, size, elapsed / injections[name])
+
+    return values
+
+
+def write_segments(t_segments, t_values, t_fout, t_binary=False):
+
+    """Writes the template segments <t_segments> to <t_fout>, the placeholders are substituted by <t_values>.
+
+    :param list t_segments: (SEGMENT_LITERAL, text) and (SEGMENT_PLACEHOLDER, name) tuples (see :class:`Template`)
+    :param dict t_values: placeholder name -> text
+    :param t_fout: output file
+    :param bool t_binary: <t_fout> is a binary file: the text is encoded back to bytes ("surrogateescape")
+    :return: None
+    """
+
+    for kind, value in t_segments:
+        if kind == SEGMENT_PLACEHOLDER:
+            value = t_values[value]
+
+        if t_binary:
+            value = value.encode("utf-8", "surrogateescape")
+        t_fout.write(value)
+
+
+def render_to_file(t_template, t_mapping, t_path, t_tags=None, t_dialects=(), t_stats=None):
+
+    """Renders the template <t_template> (see :func:`render()`) to the file <t_path>.
+
+    The file is written in binary mode if the template is bytes, in text mode otherwise.
+
+    Example:
+
+    >>> render_to_file(pathlib.Path("template.txt"), {"placeholder1": pathlib.Path("file1.txt"), ...}, "output.txt")
+
+    :param t_template: template: path-like object, str, bytes or file-like object
+    :param dict t_mapping: placeholder name -> value (path-like object, str, bytes or file-like object)
+    :param t_path: output file path
+    :type t_path: str or path-like object
+    :param tuple t_tags: (opening tag, pattern opening, closing tag), by default the module's tags
+    :param tuple t_dialects: more (opening tag, pattern opening, closing tag) tuples
+    :param t_stats: statistics to fill (see :func:`render()`), the writing of the file is the "flush" phase
+    :type t_stats: :class:`RenderStats`
+    :return: None
+    :raises PlaceholderError: if the placeholders of the template and of <t_mapping> aren't the same
+    :raises OSError: if a file can't be read or written
+    """
+
+    # the output is rendered before opening the file, this way a bad template doesn't truncate it
+    output = render(t_template, t_mapping, None, t_tags, t_dialects, t_stats)
+
+    with t_stats.phase("flush") if t_stats is not None else null_context():
+        with write_if_changed(t_path, isinstance(output, bytes)) as fout:
+            fout.write(output)
+
+
+def default_socket_path():
+
+    """Returns the default path of the Unix socket of the daemon (see :class:`RenderServer`).
+
+    The socket is "templately-<uid>.sock" inside $XDG_RUNTIME_DIR, or inside the temporary folder:
+    each user has a different daemon.
+
+    :return: socket path
+    :rtype: str
+    """
+
+    import tempfile
+
+    folder = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(folder, "templately-" + str(os.getuid()) + ".sock")
+
+
+class ThreadStream:
+
+    """Replacement of sys.stdin, sys.stdout or sys.stderr that uses a different stream in each thread.
+
+    The threads of the daemon run the command line of different clients at the same time:
+    each of them redirects the standard streams to its own buffers with :meth:`redirect()`,
+    the other threads keep using the original stream.
+
+    :param t_default: stream of the threads that didn't redirect it
+    """
+
+    def __init__(self, t_default):
+
+        self.default = t_default        # original stream
+        self.local = threading.local()  # stream of each thread
+
+    def __getattr__(self, t_name):
+
+        # write(), read(), flush(), buffer, ... are the ones of the stream of the current thread
+        return getattr(getattr(self.local, "stream", self.default), t_name)
+
+    @contextlib.contextmanager
+    def redirect(self, t_stream):
+
+        """Uses <t_stream> in the current thread until the end of the with block.
+
+        :param t_stream: stream of the current thread
+        :return: context manager
+        """
+
+        self.local.stream = t_stream
+        try:
+            yield t_stream
+        finally:
+            del self.local.stream
+
+
+class DirectoryLock:
+
+    """Lets more threads work in the same current directory, the threads that need another one wait.
+
+    The current directory is the same for the whole process: the requests of the daemon with the same
+    directory (usually all the renders of a script) run together, the others wait their turn.
+    """
+
+    def __init__(self):
+
+        self.condition = threading.Condition()
+        self.cwd = None  # directory used by the running threads
+        self.users = 0   # number of running threads
+
+    @contextlib.contextmanager
+    def enter(self, t_cwd):
+
+        """Changes the current directory to <t_cwd> until the end of the with block.
+
+        > The thread waits until no thread uses another directory
+
+        :param str t_cwd: directory
+        :return: context manager
+        :raises OSError: if the directory can't be entered
+        """
+
+        with self.condition:
+            while self.users > 0 and self.cwd != t_cwd:
+                self.condition.wait()
+
+            if self.cwd != t_cwd:
+                os.chdir(t_cwd)
+                self.cwd = t_cwd
+
+            self.users += 1
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.users -= 1
+                self.condition.notify_all()
+
+
+class RenderServer:
+
+    """Daemon that runs the command line of its clients (see :func:`run_client()`) on a Unix socket.
+
+    The daemon is a single process: the templates compiled by a request and the injected files it read
+    stay cached (see ``fragment_cache`` and :func:`compile_template_text()`),
+    this way the next requests don't pay the start of python, the imports and the reads again.
+
+    The connections are handled by asyncio, the requests are run by a pool of <t_jobs> threads.
+    Each request is a JSON object, sent before closing the writing side of the connection:
+
+    >>> {"argv": ["template.txt", "output.txt", "placeholder1=file1.txt"], "cwd": "/home/user", "stdin": null}
+
+    and the answer is a JSON object with the exit status and what the command line wrote:
+
+    >>> {"status": 0, "stdout": "", "stderr": ""}
+
+    > "stdin" and "stdout" are bytes decoded as UTF-8 with "surrogateescape"
+
+    The socket can be used only by the user that started the daemon.
+
+    Example:
+
+    >>> server = RenderServer("/tmp/templately.sock")
+    >>> server.run()  # until stop() is called or SIGTERM is received
+
+    :param str t_path: path of the Unix socket, by default :func:`default_socket_path()`
+    :param int t_jobs: number of threads that run the requests, by default the one of ThreadPoolExecutor
+    """
+
+    def __init__(self, t_path=None, t_jobs=None):
+
+        if t_path is None:
+            t_path = default_socket_path()
+
+        self.path = t_path                   # socket path
+        self.jobs = t_jobs                   # number of threads
+        self.ready = threading.Event()       # set when the socket accepts connections
+        self.directory_lock = DirectoryLock()
+        self.requests = 0                    # number of requests served
+
+        self.loop = None      # event loop of the daemon
+        self.stopping = None  # event set to stop the daemon
+        self.executor = None  # pool of threads that run the requests
+
+    def run(self):
+
+        """Serves the requests until :meth:`stop()` is called (or SIGTERM is received in the main thread).
+
+        :return: None
+        :raises OSError: if the socket can't be created, or another daemon is listening on it
+        """
+
+        run_loop(self._serve())
+
+    def stop(self):
+
+        """Stops the daemon, it can be called by any thread.
+
+        :return: None
+        """
+
+        self.ready.wait()
+        self.loop.call_soon_threadsafe(self.stopping.set)
+
+    def run_request(self, t_request):
+
+        """Runs the command line of a request and returns the answer.
+
+        :param dict t_request: request, see the class description
+        :return: answer, see the class description
+        :rtype: dict
+        """
+
+        stdin = io.TextIOWrapper(io.BytesIO((t_request.get("stdin") or "").encode("utf-8", "surrogateescape")),
+                                 "utf-8", "surrogateescape")
+        stdout = io.TextIOWrapper(io.BytesIO(), "utf-8", "surrogateescape")
+        stderr = io.StringIO()
+
+        status = 0
+        with sys.stdin.redirect(stdin), sys.stdout.redirect(stdout), sys.stderr.redirect(stderr):
+            try:
+                with self.directory_lock.enter(t_request["cwd"]):
+                    main(t_request["argv"], False)
+
+            except SystemExit as e:
+                # docopt exits with the usage as a message
+                if isinstance(e.code, str):
+                    print(e.code, file=sys.stderr)
+                    status = 1
+                else:
+                    status = e.code or 0
+
+            except Exception:
+                # an unexpected error is a traceback, like in the command line
+                import traceback
+
+                traceback.print_exc(file=sys.stderr)
+                status = 1
+
+            stdout.flush()
+
+        self.requests += 1
+
+        return {"status": status,
+                "stdout": stdout.buffer.getvalue().decode("utf-8", "surrogateescape"),
+                "stderr": stderr.getvalue()}
+
+    async def _serve(self):
+
+        """Listens on the socket until the daemon is stopped.
+
+        :return: None
+        """
+
+        import asyncio
+        import concurrent.futures
+        import signal
+
+        # run_loop() makes the loop of the daemon the current loop of the thread
+        self.loop = asyncio.get_event_loop()
+        self.stopping = asyncio.Event()
+
+        self._remove_stale_socket()
+
+        # only the user that started the daemon can connect to the socket
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle, path=self.path)
+        finally:
+            os.umask(umask)
+
+        if threading.current_thread() is threading.main_thread():
+            self.loop.add_signal_handler(signal.SIGTERM, self.stopping.set)
+
+        # the standard streams of each request are its own
+        streams = sys.stdin, sys.stdout, sys.stderr
+        sys.stdin, sys.stdout, sys.stderr = [ThreadStream(stream) for stream in streams]
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.jobs)
+        try:
+            self.ready.set()
+            await self.stopping.wait()
+
+            # new connections aren't accepted, the ones already accepted are answered before closing the server
+            # > asyncio loses a connection that is still being set up when the server is closed
+            for sock in server.sockets:
+                self.loop.remove_reader(sock.fileno())
+
+            deadline = self.loop.time() + stop_timeout
+            while True:
+                tasks = pending_tasks(self.loop)
+                if not tasks or self.loop.time() >= deadline:
+                    break
+                await asyncio.wait(tasks, timeout=deadline - self.loop.time())
+        finally:
+            server.close()
+            await server.wait_closed()
+            self.executor.shutdown()
+            sys.stdin, sys.stdout, sys.stderr = streams
+
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.path)
+
+    async def _handle(self, t_reader, t_writer):
+
+        """Reads a request from a connection, runs it and writes the answer.
+
+        :param t_reader: reading side of the connection
+        :type t_reader: :class:`asyncio.StreamReader`
+        :param t_writer: writing side of the connection
+        :type t_writer: :class:`asyncio.StreamWriter`
+        :return: None
+        """
+
+        import json
+
+        try:
+            try:
+                # the request ends when the client closes its writing side
+                request = json.loads((await t_reader.read()).decode("utf-8"))
+                if not isinstance(request, dict) or not isinstance(request.get("argv"), list) \
+                        or not isinstance(request.get("cwd"), str) \
+                        or not isinstance(request.get("stdin") or "", str):
+                    raise ValueError("expected an object with \"argv\" and \"cwd\"")
+
+                answer = await self.loop.run_in_executor(self.executor, self.run_request, request)
+            except ValueError as e:
+                answer = {"status": 1, "stdout": "", "stderr": "Bad request: " + str(e) + "\n"}
+
+            t_writer.write(json.dumps(answer).encode("ascii"))
+        finally:
+            # the connection is closed even if the daemon stops while it's open
+            # > the client may have gone away
+            await close_writer(t_writer)
+
+    def _remove_stale_socket(self):
+
+        """Removes the socket left by a daemon that didn't stop cleanly.
+
+        :return: None
+        :raises OSError: if the path isn't a socket, or another daemon is listening on it
+        """
+
+        import socket
+
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+
+        if not stat.S_ISSOCK(st.st_mode):
+            raise FileExistsError(errno.EEXIST, "Not a socket", self.path)
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.path)
+            except ConnectionRefusedError:
+                os.remove(self.path)
+                return
+
+        raise OSError(errno.EADDRINUSE, "Another daemon is listening", self.path)
+
+
+def run_client(t_argv, t_socket_path=None, t_stdin=None):
+
+    """Sends a command line to the daemon (see :class:`RenderServer`) and returns its answer.
+
+    The command line runs inside the daemon as it would in this process,
+    with the current directory of this process.
+
+    Example:
+
+    >>> run_client(["template.txt", "output.txt", "placeholder1=file1.txt"])
+    {'status': 0, 'stdout': '', 'stderr': ''}
+
+    :param list t_argv: command line arguments
+    :param str t_socket_path: path of the Unix socket of the daemon, by default :func:`default_socket_path()`
+    :param bytes t_stdin: standard input of the command line (when the template is "-")
+    :return: answer with "status", "stdout" and "stderr" keys ("stdout" is decoded with "surrogateescape")
+    :rtype: dict
+    :raises OSError: if the daemon can't be reached
+    """
+
+    import json
+    import socket
+
+    if t_socket_path is None:
+        t_socket_path = default_socket_path()
+
+    request = {"argv": list(t_argv), "cwd": os.getcwd(),
+               "stdin": None if t_stdin is None else t_stdin.decode("utf-8", "surrogateescape")}
+
+    chunks = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(t_socket_path)
+        sock.sendall(json.dumps(request).encode("ascii"))
+        # the daemon reads the request until the end of the stream
+        sock.shutdown(socket.SHUT_WR)
+
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+
+    try:
+        return json.loads(b"".join(chunks).decode("utf-8"))
+    except ValueError:
+        # the daemon stopped before answering
+        raise ConnectionResetError(errno.ECONNRESET, "The daemon didn't answer", t_socket_path)
+
+
+def print_error(t_message):
+
+    """Prints the error message <t_message> to the standard error, unless the unit tests are running.
+
+    :param str t_message: error message
+    :return: None
+    """
+
+    if not testmode:
+        print(t_message, file=sys.stderr)
+
+
+def parse_number(t_value, t_type, t_minimum, t_name, t_exclusive=False):
+
+    """Returns the number of the option value <t_value>, exits with status 5 if it's too small or not a number.
+
+    Example:
+
+    >>> parse_number("4", int, 1, "number of jobs")
+    4
+    >>> parse_number("0", float, 0, "timeout", True)  # prints "Bad timeout: '0'" and exits with status 5
+
+    :param str t_value: option value
+    :param type t_type: type of the number, int or float
+    :param t_minimum: smallest valid number
+    :param str t_name: name of the value, shown by the error message
+    :param bool t_exclusive: True if <t_minimum> itself isn't valid
+    :return: the number
+    :rtype: int or float
+    """
+
+    try:
+        number = t_type(t_value)
+    except ValueError:
+        number = None
+
+    if number is None or number < t_minimum or (t_exclusive and number == t_minimum):
+        print_error("Bad " + t_name + ": '" + t_value + "'")
+        sys.exit(5)
+
+    return number
+
+
+def run_client_arguments(t_argv, t_arguments):
+
+    """Sends the command line <t_argv> to the daemon (--client) and exits with its answer.
+
+    The output and the errors of the daemon are printed as if the command line ran in this process.
+
+    :param list t_argv: arguments of the command line
+    :param dict t_arguments: arguments parsed by docopt
+    :return: None, the function exits with the status of the daemon
+    """
+
+    # the daemon renders the outputs once
+    if t_arguments['--watch']:
+        print_error("The client mode can't be used with --watch")
+        sys.exit(5)
+
+    # the standard input can't be read by the daemon, it is sent with the request
+    stdin = None
+    if t_arguments['<template>'] == "-":
+        stdin = sys.stdin.buffer.read()
+
+    try:
+        answer = run_client(t_argv, t_arguments['--socket'], stdin)
+    except OSError as e:
+        # if the daemon can't be reached, exit with status 7
+        print_error("Daemon not reachable: " + str(e))
+        sys.exit(7)
+
+    sys.stdout.flush()
+    sys.stdout.buffer.write(answer["stdout"].encode("utf-8", "surrogateescape"))
+    sys.stdout.flush()
+    sys.stderr.write(answer["stderr"])
+    sys.exit(answer["status"])
+
+
+def run_server(t_arguments, t_jobs):
+
+    """Runs the daemon (serve) until it's interrupted, then exits.
+
+    :param dict t_arguments: arguments parsed by docopt
+    :param int t_jobs: number of threads that run the requests, None for the number of CPUs
+    :return: None, the function exits with status 0 (7 if the socket can't be used)
+    """
+
+    server = RenderServer(t_arguments['--socket'], t_jobs)
+    try:
+        server.run()
+    except OSError as e:
+        # if the socket can't be created, exit with status 7
+        print_error("Can't listen on the socket: " + str(e))
+        sys.exit(7)
+    except KeyboardInterrupt:
+        pass
+
+    sys.exit(0)
+
+
+def resolve_source_arguments(t_arguments, t_cleanup, t_stats):
+
+    """Replaces the commands and the URLs of the input placeholders of <t_arguments> with files.
+
+    The sources are read at the same time (see :func:`resolve_sources()`), inside a temporary folder
+    removed by <t_cleanup> at the end of the run.
+
+    :param dict t_arguments: arguments parsed by docopt, the input placeholders are replaced
+    :param t_cleanup: callbacks run at the end of the run
+    :type t_cleanup: :class:`contextlib.ExitStack`
+    :param t_stats: statistics of the run, the reads are the "sources" phase
+    :type t_stats: :class:`RenderStats`
+    :return: None
+    """
+
+    # if the timeout isn't a positive number, exit with status 5
+    timeout = parse_number(t_arguments['--timeout'], float, 0, "timeout", True)
+
+    # the sources are read once, their changes can't be watched
+    if t_arguments['--watch']:
+        print_error("The commands and the URLs of the placeholders can't be used with --watch")
+        sys.exit(5)
+
+    import tempfile
+
+    directory = t_cleanup.enter_context(tempfile.TemporaryDirectory(prefix="templately-"))
+    try:
+        with t_stats.phase("sources"):
+            t_arguments['<placeholder=file>'] = resolve_sources(t_arguments['<placeholder=file>'], directory, timeout)
+    except SourceError as e:
+        # if a command or a URL failed, exit with status 8
+        print_error("Bad placeholder sources: " + str(e))
+        sys.exit(8)
+
+
+def main(t_argv=None, t_client=True):
+
+    """Command line entry point, parses the arguments and runs the requested mode.
+
+    > docopt (and the modules used only by some modes) is imported here, not at the top of the module:
+    > importing templately to use it as a library, or to show its help, doesn't pay for them
+
+    :param list t_argv: arguments, by default the ones of the command line
+    :param bool t_client: --client sends the arguments to the daemon,
+                          False runs them in this process (used by the daemon itself, see :class:`RenderServer`)
+    :return: None
+    """
+
+    # the "arguments" phase of --stats starts here
+    started = time.perf_counter()
+
+    from docopt import docopt
+
+    if boold:
+        print("Start")
+        print("-" * 50)
+
+    # docopt doesn't support options with an optional value: a bare --stats is the text format
+    argv = sys.argv[1:] if t_argv is None else t_argv
+    argv = ["--stats=text" if argument == "--stats" else argument for argument in argv]
+
+    # get from the scripts docstring the possible arguments and collect them from the user
+    arguments = docopt(__doc__, argv=argv, version=__version__)
+
+    if boold:
+        print("Arguments:")
+        print(arguments)
+
+    # the daemon runs the command line of the clients, it can't be a client or another daemon
+    if not t_client and (arguments['serve'] or arguments['--watch']):
+        print_error("The daemon can't run " + ("serve" if arguments['serve'] else "--watch"))
+        sys.exit(5)
+
+    # if the format of the statistics doesn't exist, exit with status 5
+    if arguments['--stats'] not in (None, "text", "json"):
+        print_error("Bad stats format: '" + arguments['--stats'] + "'")
+        sys.exit(5)
+
+    # in client mode the same arguments are run by the daemon, in the current directory
+    if t_client and arguments['--client']:
+        run_client_arguments(argv, arguments)
+
+    # number of processes/threads of the batch and build modes, by default the number of CPUs
+    # > if the number of jobs isn't a positive integer, exit with status 5
+    jobs = None
+    if arguments['--jobs'] is not None:
+        jobs = parse_number(arguments['--jobs'], int, 1, "number of jobs")
+
+    # the daemon keeps running until it's interrupted
+    if arguments['serve']:
+        run_server(arguments, jobs)
+
+    # phases and counters of the run, printed with --stats
+    run_stats = RenderStats()
+    run_stats.add_phase("arguments", time.perf_counter() - started)
+
+    # the files of the commands and of the URLs of the input placeholders are removed at the end
+    with contextlib.ExitStack() as cleanup:
+
+        # the statistics are printed even if the run fails, with the phases that ran
+        if arguments['--stats'] is not None:
+            cleanup.callback(print_stats, run_stats, arguments['--stats'])
+
+        # the commands and the URLs are read before rendering, at the same time
+        if any(is_source(placeholder.partition("=")[2]) for placeholder in arguments['<placeholder=file>']):
+            resolve_source_arguments(arguments, cleanup, run_stats)
+
+        run_arguments(arguments, jobs, run_stats)
+
+
+def print_stats(t_stats, t_format):
+
+    """Prints the statistics of the run <t_stats> (see :class:`RenderStats`) to the standard error.
+
+    :param t_stats: statistics of the run
+    :type t_stats: :class:`RenderStats`
+    :param str t_format: "text" or "json" (a single line)
+    :return: None
+    """
+
+    if t_format == "json":
+        import json
+        sys.stderr.write(json.dumps(t_stats.as_dict()) + "\n")
+    else:
+        sys.stderr.write(t_stats.format())
+
+
+class CommandRun:
+
+    """Mode of a parsed command line, together with the state that its checks build for the renderers.
+
+    The constructor checks the options shared by the modes (tags, dialects, scanner, --watch, --recursive)
+    and, like :func:`main()`, prints the error and exits if one of them is wrong.
+    Then :func:`run_arguments()` runs the mode with one of the methods:
+    :meth:`build()`, :meth:`batch()`, :meth:`stream()`, :meth:`watch()`, :meth:`mapped()` or :meth:`render()`.
+
+    Example:
+
+    >>> run = CommandRun(docopt(__doc__, argv=["template.txt", "output.txt", "placeholder1=file1.txt"]), None)
+    >>> run.prefetch()
+    >>> run.render(run.compile(), None)
+
+    :param dict t_arguments: arguments parsed by docopt, the input placeholders are files
+    :param int t_jobs: number of processes/threads of the batch and build modes, None for the number of CPUs
+    :param t_stats: statistics of the run, filled with the phases and, with --stats, with the injections
+    :type t_stats: :class:`RenderStats`
+    """
+
+    def __init__(self, t_arguments, t_jobs, t_stats=None):
+
+        self.arguments = t_arguments
+        self.jobs = t_jobs
+        self.run_stats = t_stats if t_stats is not None else RenderStats()
+
+        # with --stats the injections and the output are counted too
+        self.counted = t_arguments['--stats'] is not None
+
+        # check if some of the regex pattern arguments have been passed
+        self.c_re_args = check_repattern_arguments(t_arguments)
+        self.dialects = self._parse_dialects()
+        self.regex_pattern = self._make_scanner(t_arguments['--binary'])
+
+        # the outputs rendered with different tags are different
+        self.stamps_config = [self.c_re_args['--ot'], self.c_re_args['--po'], self.c_re_args['--ct']]
+        self.stamps_config += [tag for dialect in self.dialects for tag in dialect]
+
+        # the watcher and the include expander read the files as text
+        if t_arguments['--binary'] and (t_arguments['--watch'] or t_arguments['--recursive']):
+            print_error("The binary mode can't be used with --watch or --recursive")
+            sys.exit(5)
+
+        # in watch mode the outputs are rendered again when the files they depend on change
+        # > if the debounce time isn't a positive number, exit with status 5
+        self.watcher = None
+        if t_arguments['--watch']:
+            self.watcher = Watcher(self.regex_pattern,
+                                   t_debounce=parse_number(t_arguments['--debounce'], float, 0, "debounce time"))
+
+        # in recursive mode the placeholders inside the injected files are expanded
+        # > if the maximum depth isn't a positive integer, exit with status 5
+        self.max_depth = None
+        if t_arguments['--recursive']:
+            self.max_depth = parse_number(t_arguments['--max-depth'], int, 1, "maximum depth")
+
+            # the watcher doesn't know the files included by the injected files
+            if self.watcher is not None:
+                print_error("The recursive mode can't be used with --watch")
+                sys.exit(5)
+
+        # filled by prefetch(): stat results, cache of the template and of the files to inject, stamps
+        self.stat_cache = None
+        self.sources = None
+        self.stamps = None
+
+    def _parse_dialects(self):
+
+        """Returns the more dialects of tags (--dialect), written as "<opening_tag> <pattern_opening> <closing_tag>".
+
+        :return: tuple of (opening tag, pattern opening, closing tag) tuples, without the main and the repeated ones
+        :rtype: tuple
+        """
+
+        main_tags = (self.c_re_args['--ot'], self.c_re_args['--po'], self.c_re_args['--ct'])
+
+        dialects = []
+        for dialect in self.arguments['--dialect']:
+            try:
+                dialect = parse_dialect(dialect)
+            except ValueError:
+                # if the dialect isn't made of three tags, exit with status 5
+                print_error("Bad dialect: '" + dialect + "'")
+                sys.exit(5)
+
+            if dialect != main_tags and dialect not in dialects:
+                dialects.append(dialect)
+
+        return tuple(dialects)
+
+    def _make_scanner(self, t_binary):
+
+        """Returns the regex of the placeholders pattern (or the scanner that replaces it), see :func:`make_scanner()`.
+
+        > All the dialects are found by the same pattern
+
+        :param bool t_binary: find the placeholders inside bytes
+        :return: object with the finditer() method
+        """
+
+        try:
+            with self.run_stats.phase("re_builder"):
+                return make_scanner(self.c_re_args['--ot'], self.c_re_args['--po'], self.c_re_args['--ct'],
+                                    self.arguments['--scanner'], t_binary, self.dialects)
+        except ValueError as e:
+            # if the scanner doesn't exist or doesn't support the tags, exit with status 5
+            print_error("Bad scanner: " + str(e))
+            sys.exit(5)
+
+    def injector(self, t_fragment_cache):
+
+        """Returns the fragment cache of the renderers: with --stats each injection is counted and timed.
+
+        :param t_fragment_cache: cache of the files to inject
+        :return: <t_fragment_cache>, or the statistics that wrap it
+        """
+
+        if self.counted:
+            return self.run_stats.with_fragment_cache(t_fragment_cache)
+        return t_fragment_cache
+
+    def build(self):
+
+        """Renders each template of <src_dir> to the same path inside <out_dir> (build), then exits.
+
+        :return: None, the method exits with status 4 if at least one template failed
+        """
+
+        arguments = self.arguments
+
+        # if the templates folder doesn't exist, exit with status 1
+        if not os.path.isdir(arguments['<src_dir>']):
+            print_error("Templates folder not found! (or it wasn't a folder)")
+            sys.exit(1)
+
+        # check if the output dir doesn't exist, if so exit with status 3
+        if not os.path.isdir(arguments['<out_dir>']):
+            print_error("The output folder doesn't exist!")
+            sys.exit(3)
+
+        # by default the files to inject are inside the "fragments" folder of the templates folder
+        fragments_dir = arguments['--fragments']
+        if fragments_dir is None:
+            fragments_dir = os.path.join(arguments['<src_dir>'], "fragments")
+
+        if self.watcher is not None:
+            self.watch_build(fragments_dir)
+
+        # in incremental mode the outputs that are up to date are skipped
+        # > the same placeholders point to different files if the fragments folder changes
+        stamps = None
+        if arguments['--incremental']:
+            stamps = StampDatabase(arguments['--stamps'], self.stamps_config + [os.path.abspath(fragments_dir)])
+
+        # in recursive mode the placeholders of the injected files are files of the fragments folder too
+        expander = None
+        if arguments['--recursive']:
+            expander = IncludeExpander(self.regex_pattern, functools.partial(fragment_path, fragments_dir),
+                                       self.max_depth)
+
+        # render all the templates
+        with self.run_stats.phase("render"):
+            failed_templates = run_build(arguments['<src_dir>'], arguments['<out_dir>'], fragments_dir,
+                                         arguments['--glob'], self.regex_pattern, self.jobs, stamps, expander)
+
+        if stamps is not None:
+            stamps.save()
+
+        # if at least one template failed, exit with status 4
+        if failed_templates > 0:
+            sys.exit(4)
+
+        sys.exit(0)
+
+    def watch_build(self, t_fragments_dir):
+
+        """Renders all the templates of the build, then keeps them up to date until interrupted.
+
+        :param str t_fragments_dir: folder with the files to inject
+        :return: None, the method exits with status 0
+        """
+
+        arguments = self.arguments
+
+        resolver = functools.partial(resolve_fragment_placeholders, t_fragments_dir=t_fragments_dir)
+        for template_path in find_templates(arguments['<src_dir>'], arguments['--glob'],
+                                            [t_fragments_dir, arguments['<out_dir>']]):
+            output = os.path.join(arguments['<out_dir>'], template_path)
+            if not os.path.isdir(os.path.dirname(output)):
+                os.makedirs(os.path.dirname(output), exist_ok=True)
+            self.watcher.add(os.path.join(arguments['<src_dir>'], template_path), output, resolver)
+
+        self.watcher.render_all()
+        self.watcher.run()
+        sys.exit(0)
+
+    def prefetch(self):
+
+        """Stats the template and the files to inject all at the same time, once for the whole run.
+
+        The checks, the stamps and the renderers share the results.
+        The stamps of the incremental mode are loaded too.
+
+        :return: None, the method exits with status 1 if the template file doesn't exist
+        """
+
+        arguments = self.arguments
+
+        self.stat_cache = StatCache()
+        self.stat_cache.prefetch(([arguments['<template>']] if arguments['<template>'] != "-" else [])
+                                 + list(index_input_placeholders(arguments['<placeholder=file>']).values()))
+
+        # if the template file doesn't exist, output as a standard error and exit with status 1
+        # > "-" is the standard input
+        if arguments['<template>'] != "-" and not self.stat_cache.isfile(arguments['<template>']):
+            print_error("Template file not found! (or it wasn't a file)")
+            sys.exit(1)
+
+        # in binary mode the template and the files to inject are read as bytes, with the same stat results
+        self.sources = self.stat_cache
+        if arguments['--binary']:
+            self.sources = self.stat_cache.with_fragment_cache(binary_fragment_cache)
+
+        # in incremental mode the outputs that are up to date are skipped
+        if arguments['--incremental']:
+            self.stamps = StampDatabase(arguments['--stamps'], self.stamps_config)
+
+    def check_output(self):
+
+        """Checks the output folder, the engine and the modes of a single output.
+
+        :return: None, the method exits with status 3 if the output folder doesn't exist,
+                 5 if the engine is wrong or the modes can't be used together
+        """
+
+        arguments = self.arguments
+
+        # save the output directory path
+        output_path = os.path.dirname(os.path.abspath(arguments['<output>']))
+
+        # check if the output dir doesn't exist, if so exit with status 3
+        # > "-" is the standard output
+        if arguments['<output>'] != "-" and not os.path.isdir(output_path):
+            print_error("The output folder doesn't exist!")
+            sys.exit(3)
+
+        # the mmap and copy engines render a template file as bytes
+        if arguments['--engine'] not in ("text", "mmap", "copy"):
+            print_error("Bad engine: '" + arguments['--engine'] + "'")
+            sys.exit(5)
+
+        # the standard input is always streamed
+        stream = arguments['--stream'] or arguments['<template>'] == "-"
+
+        if arguments['--engine'] != "text" and stream:
+            print_error("The " + arguments['--engine'] + " engine can't be used in stream mode")
+            sys.exit(5)
+
+        # the stream mode renders once, without stamps
+        for option in ("--incremental", "--watch"):
+            if arguments[option] and stream:
+                print_error("The " + option[2:] + " mode can't be used in stream mode")
+                sys.exit(5)
+
+        if arguments['--engine'] != "text" and arguments['--recursive']:
+            print_error("The " + arguments['--engine'] + " engine can't be used in recursive mode")
+            sys.exit(5)
+
+    def make_expander(self, t_check_ip_res):
+
+        """Returns the include expander of the recursive mode, None without --recursive.
+
+        In recursive mode the placeholders of the injected files are input placeholders too.
+
+        :param dict t_check_ip_res: input placeholders, as returned by :func:`check_input_placeholders()`
+        :return: include expander or None
+        :rtype: :class:`IncludeExpander`
+        """
+
+        if not self.arguments['--recursive']:
+            return None
+
+        return IncludeExpander(self.regex_pattern, t_check_ip_res["placeholders_index"].get, self.max_depth,
+                               self.stat_cache)
+
+    def stream(self):
+
+        """Renders the template while it is read (--stream, and the standard input), then exits.
+
+        A template file can be read twice: its placeholders are checked before rendering.
+        The placeholders of the standard input are checked after rendering, before the output file is replaced.
+
+        :return: None, the method exits with status 0 (2 if the placeholders are wrong, 6 if the includes are)
+        """
+
+        arguments = self.arguments
+
+        # if the chunk size isn't a positive integer, exit with status 5
+        chunk_size = parse_number(arguments['--chunk-size'], int, 1, "chunk size")
+
+        # parse the input placeholders once: the result is used by the checks and by the renderer
+        with self.run_stats.phase("validation"):
+            check_ip_res = check_input_placeholders(self.c_re_args['<placeholder=file>'], self.stat_cache)
+        tags = [(self.c_re_args['--ot'], self.c_re_args['--po'])] + [dialect[:2] for dialect in self.dialects]
+        if arguments['--binary']:
+            tags = [(opening.encode("utf-8"), opening_pattern.encode("utf-8")) for opening, opening_pattern in tags]
+
+        expander = self.make_expander(check_ip_res)
+
+        try:
+            if arguments['<template>'] != "-":
+                self._check_stream(tags, chunk_size, check_ip_res, expander)
+
+            self._stream_render(tags, chunk_size, check_ip_res, expander)
+
+        except IncludeError as e:
+            # if the includes have a cycle or are too deep, exit with status 6
+            print_error("Bad includes: " + str(e))
+            sys.exit(6)
+
+        sys.exit(0)
+
+    def _check_stream(self, t_tags, t_chunk_size, t_check_ip_res, t_expander):
+
+        """Checks the placeholders of the template file before it is streamed.
+
+        :param list t_tags: list of (opening tag, pattern opening) tuples of the regex pattern
+        :param int t_chunk_size: number of characters read at a time
+        :param dict t_check_ip_res: input placeholders, as returned by :func:`check_input_placeholders()`
+        :param t_expander: include expander of the recursive mode, None without --recursive
+        :return: None, the method exits with status 2 if the placeholders are wrong
+        """
+
+        with self.run_stats.phase("scan"), open(self.arguments['<template>'],
+                                                'rb' if self.arguments['--binary'] else 'r') as fin:
+            placeholders = [value for kind, value in iter_template_segments(fin, self.regex_pattern, t_tags,
+                                                                            t_chunk_size)
+                            if kind == SEGMENT_PLACEHOLDER]
+        self.run_stats.matches = len(placeholders)
+
+        with self.run_stats.phase("validation"):
+            if t_expander is not None:
+                placeholders += t_expander.check(placeholders)
+
+            # if at least one of the placeholders are incorrect, exit with status 2
+            if not check_placeholder_arguments(self.c_re_args, placeholders, t_check_ip_res):
+                sys.exit(2)
+
+    def _stream_render(self, t_tags, t_chunk_size, t_check_ip_res, t_expander):
+
+        """Renders the template file (or the standard input) to the output while it is read.
+
+        :param list t_tags: list of (opening tag, pattern opening) tuples of the regex pattern
+        :param int t_chunk_size: number of characters read at a time
+        :param dict t_check_ip_res: input placeholders, as returned by :func:`check_input_placeholders()`
+        :param t_expander: include expander of the recursive mode, None without --recursive
+        :return: None, the method exits with status 2 if the placeholders are wrong
+        """
+
+        arguments = self.arguments
+
+        fin = sys.stdin.buffer if arguments['--binary'] else sys.stdin
+        if arguments['<template>'] != "-":
+            fin = open(arguments['<template>'], 'rb' if arguments['--binary'] else 'r')
+
+        try:
+            with open_output(arguments['<output>'], arguments['--binary']) as fout:
+                if self.counted:
+                    fout = self.run_stats.wrap_output(arguments['<output>'], fout)
+
+                with self.run_stats.phase("render"):
+                    placeholders = stream_render(fin, fout, t_check_ip_res["placeholders_index"],
+                                                 self.regex_pattern, t_tags, t_chunk_size,
+                                                 self.injector(t_expander if t_expander is not None else self.sources))
+                with self.run_stats.phase("flush"):
+                    fout.flush()
+
+                self.run_stats.matches = len(placeholders)
+                if t_expander is not None:
+                    placeholders += t_expander.check(placeholders)
+
+                # the placeholders of the standard input are checked after rendering,
+                # before the output file is replaced: if they are wrong the output is left as it was
+                # > if at least one of the placeholders are incorrect, exit with status 2
+                if not check_placeholder_arguments(self.c_re_args, placeholders, t_check_ip_res):
+                    sys.exit(2)
+        finally:
+            if arguments['<template>'] != "-":
+                fin.close()
+
+        if self.counted:
+            self.run_stats.count_output(arguments['<output>'], fout)
+
+    def watch(self):
+
+        """Renders the output, then keeps it up to date until interrupted (--watch).
+
+        :return: None, the method exits with status 0
+        """
+
+        self.watcher.add(self.arguments['<template>'], self.arguments['<output>'],
+                         functools.partial(check_template_placeholders,
+                                           t_input_placeholders=self.arguments['<placeholder=file>']))
+        self.watcher.render_all()
+        self.watcher.run()
+        sys.exit(0)
+
+    def check_stamps(self):
+
+        """Exits if the output is up to date (--incremental), otherwise returns the signatures of its inputs.
+
+        The inputs are the template and the files to inject:
+        their signatures are taken before rendering the output, they are recorded after.
+
+        :return signatures: signatures of the inputs, None without --incremental
+        :rtype signatures: dict
+        """
+
+        if self.stamps is None:
+            return None
+
+        inputs = index_input_placeholders(self.arguments['<placeholder=file>'])
+        inputs["<template>"] = self.arguments['<template>']
+
+        # if the output is up to date there is nothing to do, not even reading the template
+        if self.stamps.is_up_to_date(self.arguments['<output>'], inputs, self.stat_cache):
+            if boold:
+                print("The output is up to date")
+            sys.exit(0)
+
+        return file_signatures(inputs, self.stat_cache)
+
+    def mapped(self, t_signatures):
+
+        """Renders the output with the mmap or the copy engine (--engine), then exits.
+
+        :param dict t_signatures: signatures of the inputs to record, None without --incremental
+        :return: None, the method exits with status 0 (2 if the placeholders are wrong)
+        """
+
+        c_re_args = self.c_re_args
+
+        # map the template file and find its placeholders
+        with self.run_stats.phase("scan"):
+            template = MappedTemplate(self.arguments['<template>'],
+                                      make_scanner(c_re_args['--ot'], c_re_args['--po'], c_re_args['--ct'],
+                                                   self.arguments['--scanner'], True, self.dialects))
+        self.run_stats.matches = len(template.placeholders)
+
+        with template:
+
+            with self.run_stats.phase("validation"):
+                check_ip_res = check_input_placeholders(c_re_args['<placeholder=file>'], self.stat_cache)
+
+                # if at least one of the placeholders are incorrect, exit with status 2
+                if not check_placeholder_arguments(c_re_args, list(template.placeholders), check_ip_res):
+                    sys.exit(2)
+
+            with open_output(c_re_args['<output>'], True) as fout:
+                if self.counted:
+                    fout = self.run_stats.wrap_output(c_re_args['<output>'], fout)
+
+                with self.run_stats.phase("render"):
+                    plan = self._render_mapped(template, fout, check_ip_res)
+                with self.run_stats.phase("flush"):
+                    fout.flush()
+
+        if self.counted:
+            self.run_stats.count_output(c_re_args['<output>'], fout)
+
+            # the files are copied by the kernel: their ranges are the injections
+            if plan is not None:
+                for path, _, length in plan:
+                    if path != template.path:
+                        self.run_stats.add_source(os.path.abspath(path), length, 0.0)
+                self.run_stats.bytes_written = sum(length for _, _, length in plan)
+
+        if self.stamps is not None:
+            self.stamps.record(c_re_args['<output>'], t_signatures)
+            self.stamps.save()
+
+        sys.exit(0)
+
+    def _render_mapped(self, t_template, t_fout, t_check_ip_res):
+
+        """Renders the mapped template <t_template> to <t_fout> with the engine of the command line.
+
+        :param t_template: mapped template
+        :type t_template: :class:`MappedTemplate`
+        :param t_fout: output file, opened in binary mode
+        :param dict t_check_ip_res: input placeholders, as returned by :func:`check_input_placeholders()`
+        :return plan: byte ranges copied by the copy engine, None for the mmap engine
+        :rtype plan: list
+        """
+
+        if self.arguments['--engine'] == "copy":
+            # the output is made of byte ranges of the template and of the files to inject
+            # > the standard output could be a file opened in append mode
+            plan = t_template.render_plan(t_check_ip_res["placeholders_index"], self.stat_cache)
+            copy_render(plan, t_fout, None, self.c_re_args['<output>'] != "-")
+            return plan
+
+        # the same stat results, with the cache of the files read as bytes
+        t_template.render(t_fout, t_check_ip_res["placeholders_index"],
+                          self.injector(self.stat_cache.with_fragment_cache(binary_fragment_cache)))
+        return None
+
+    def compile(self):
+
+        """Compiles the template: the file is read only once.
+
+        > The file and the compiled template are cached, a daemon (see serve) compiles a template once
+        > With --cache-dir the positions of the placeholders found by a previous run are loaded from the cache folder
+
+        :return template: compiled template
+        :rtype template: :class:`Template`
+        """
+
+        with self.run_stats.phase("scan"):
+            text = self.sources.get(self.arguments['<template>'])
+            if self.arguments['--cache-dir'] is not None:
+                template = TemplateCache(self.arguments['--cache-dir'], self.stamps_config).compile(text,
+                                                                                                    self.regex_pattern)
+            else:
+                template = compile_template_text(text, self.regex_pattern)
+        self.run_stats.matches = len(template.placeholders)
+
+        if boold:
+            print("placeholders")
+            print(template.placeholders)
+
+        return template
+
+    def batch(self, t_template):
+
+        """Renders the template once for each row of the manifest (--batch).
+
+        :param t_template: compiled template
+        :type t_template: :class:`Template`
+        :return: None, the method exits with status 4 if at least one row failed
+        """
+
+        arguments = self.arguments
+
+        with self.run_stats.phase("render"), open(arguments['--batch'], 'r', newline='') as fmanifest:
+            failed_rows = run_batch(t_template, fmanifest, self.jobs, arguments['--batch'].lower().endswith(".csv"),
+                                    self.stamps, arguments['<template>'])
+
+        if self.stamps is not None:
+            self.stamps.save()
+
+        # if at least one row of the manifest failed, exit with status 4
+        if failed_rows > 0:
+            sys.exit(4)
+
+    def render(self, t_template, t_signatures):
+
+        """Renders the compiled template <t_template> to the output.
+
+        :param t_template: compiled template
+        :type t_template: :class:`Template`
+        :param dict t_signatures: signatures of the inputs to record, None without --incremental
+        :return: None, the method exits with status 2 if the placeholders are wrong, 6 if the includes are
+        """
+
+        c_re_args = self.c_re_args
+
+        # parse the input placeholders once: the result is used by the checks and by the renderer
+        with self.run_stats.phase("validation"):
+            check_ip_res = check_input_placeholders(c_re_args['<placeholder=file>'], self.stat_cache)
+        placeholders = list(t_template.placeholders)
+
+        expander = self.make_expander(check_ip_res)
+        if expander is not None:
+            try:
+                with self.run_stats.phase("validation"):
+                    placeholders += expander.check(placeholders)
+            except IncludeError as e:
+                # if the includes have a cycle or are too deep, exit with status 6
+                print_error("Bad includes: " + str(e))
+                sys.exit(6)
+
+        # check that all the arguments are correct
+        with self.run_stats.phase("validation"):
+            corr_placeholder = check_placeholder_arguments(c_re_args, placeholders, check_ip_res)
+
+        # if at least one of the placeholders are incorrect, exit with status 2
+        if not corr_placeholder:
+            sys.exit(2)
+
+        # build the output file
+        with open_output(c_re_args['<output>'], self.arguments['--binary']) as fout:
+            if self.counted:
+                fout = self.run_stats.wrap_output(c_re_args['<output>'], fout)
+
+            with self.run_stats.phase("render"):
+                t_template.render(fout, check_ip_res["placeholders_index"],
+                                  self.injector(expander if expander is not None else self.sources))
+            with self.run_stats.phase("flush"):
+                fout.flush()
+
+        if self.counted:
+            self.run_stats.count_output(c_re_args['<output>'], fout)
+
+        if self.stamps is not None:
+            self.stamps.record(c_re_args['<output>'], t_signatures)
+            self.stamps.save()
+
+
+def run_arguments(t_arguments, t_jobs, t_stats=None):
+
+    """Runs the mode of the parsed command line <t_arguments> (see :func:`main()`).
+
+    The checks and the modes are the methods of :class:`CommandRun`, the modes that end the run exit.
+
+    :param dict t_arguments: arguments parsed by docopt, the input placeholders are files
+    :param int t_jobs: number of processes/threads of the batch and build modes, None for the number of CPUs
+    :param t_stats: statistics of the run, filled with the phases and, with --stats, with the injections
+    :type t_stats: :class:`RenderStats`
+    :return: None
+    """
+
+    run = CommandRun(t_arguments, t_jobs, t_stats)
+
+    if t_arguments['build']:
+        run.build()
+
+    run.prefetch()
+
+    # in batch mode the checks of the output and of the placeholders are made for each row of the manifest
+    if t_arguments['--batch']:
+
+        if not os.path.isfile(t_arguments['--batch']):
+            print_error("Manifest file not found! (or it wasn't a file)")
+            sys.exit(1)
+
+        run.batch(run.compile())
+
+    else:
+        run.check_output()
+
+        # the standard input can only be read once: it is always streamed
+        if t_arguments['--stream'] or t_arguments['<template>'] == "-":
+            run.stream()
+
+        if run.watcher is not None:
+            run.watch()
+
+        signatures = run.check_stamps()
+
+        if t_arguments['--engine'] != "text":
+            run.mapped(signatures)
+
+        run.render(run.compile(), signatures)
+
+    if boold:
+        print("-" * 50)
+        print("Stop")
@@ -3,10 +3,19 @@
 
 """Templately test file"""
 
+import contextlib
+import io
+import json
 import os
+import pathlib
 import sys
 import re
+import shutil
+import subprocess
+import tempfile
+import threading
 import unittest
+import unittest.mock
 
 # add to the python path the folder with templately
 test_path = os.path.dirname(sys.argv[0])
@@ -59,6 +68,48 @@ class TestTemplately(unittest.TestCase):
         else:
             self.assertEqual(custom_re, re.compile('\\%\\%\\s*template\\.(.*?)\\s*\\$\\$'))
 
+    def test_re_builder_multi(self):
+        """
+        Tests re_builder_multi(t_dialects, t_binary) function and the DialectPattern class
+
+        Returns the pattern that finds the placeholders of all the tag dialects <t_dialects> in a single pass.
+        """
+
+        dialects = [("{{", "ty.", "}}"), ("%%", "template.", "%%"), ("${", "ty.", "}")]
+
+        # the patterns are built once
+        self.assertIs(templately.re_builder("{{", "ty.", "}}"), templately.re_builder("{{", "ty.", "}}"))
+        self.assertIs(templately.re_builder_multi(dialects), templately.re_builder_multi(list(dialects)))
+        self.assertIs(templately.re_builder_multi(dialects[:1]), templately.re_builder("{{", "ty.", "}}"))
+
+        self.assertEqual(templately.parse_dialect(" %%  template. %%"), ("%%", "template.", "%%"))
+        self.assertRaises(ValueError, templately.parse_dialect, "%% template.")
+
+        text = "a {{ ty.x }} b %% template.y %% c ${ty.z} d {{ ty.w }}${ ty.v}\n"
+
+        regex_pattern = templately.re_builder_multi(dialects)
+        self.assertEqual(regex_pattern.findall(text), ["x", "y", "z", "w", "v"])
+        self.assertEqual(templately.re_builder_multi(dialects, True).findall(text.encode("utf-8")),
+                         [b"x", b"y", b"z", b"w", b"v"])
+
+        # the match positions are the ones of the pattern of each dialect
+        self.assertEqual([(m.start(), m.end()) for m in regex_pattern.finditer(text)],
+                         sorted((m.start(), m.end()) for dialect in dialects
+                                for m in templately.re_builder(*dialect).finditer(text)))
+
+        # at the same position the first dialect wins
+        for dialects_order, end in (([("{{", "ty.", "}}}"), ("{{", "ty.", "}}")], 11),
+                                    ([("{{", "ty.", "}}"), ("{{", "ty.", "}}}")], 10)):
+            self.assertEqual([m.end() for m in templately.re_builder_multi(dialects_order).finditer("{{ ty.a }}}")],
+                             [end])
+
+        # the template is compiled in a single pass
+        template = templately.Template(io.StringIO(text), regex_pattern)
+        self.assertEqual(template.placeholders, ("x", "y", "z", "w", "v"))
+        self.assertEqual(template.segments[:3], ((templately.SEGMENT_LITERAL, "a "),
+                                                 (templately.SEGMENT_PLACEHOLDER, "x"),
+                                                 (templately.SEGMENT_LITERAL, " b ")))
+
     def test_get_placeholders(self):
         """
         Tests get_placeholders(t_fin, t_) function
@@ -137,6 +188,46 @@ class TestTemplately(unittest.TestCase):
         # test vector with different elements, should be False
         self.assertFalse(templately.has_duplicates(["1", 1]))
 
+    def test_validate_placeholders(self):
+        """
+        Tests validate_placeholders(t_template_placeholders, t_input_names) function
+
+        Validates the placeholders of a template against the input placeholder names, in linear time.
+        """
+
+        report = templately.validate_placeholders(["a", "b", "b", "d"], ["a", "c", "c", "e", "d"])
+        self.assertFalse(report.valid)
+        self.assertEqual(report.missing, ["b"])
+        self.assertEqual(report.extra, ["c", "e"])
+        self.assertEqual(report.template_duplicates, ["b"])
+        self.assertEqual(report.input_duplicates, ["c"])
+        self.assertFalse(report.empty_template)
+
+        # the names are reported in the order they are found
+        report = templately.validate_placeholders(["z", "y", "y", "x", "x"], ["w", "v", "u", "u", "v"])
+        self.assertEqual((report.missing, report.extra, report.template_duplicates, report.input_duplicates),
+                         (["z", "y", "x"], ["w", "v", "u"], ["y", "x"], ["v", "u"]))
+        self.assertEqual(list(report.as_dict()), ["valid", "missing", "extra", "template_duplicates",
+                                                  "input_duplicates", "empty_template"])
+
+        # the order doesn't matter
+        self.assertTrue(templately.validate_placeholders(["b", "a"], ["a", "b"]).valid)
+
+        # the keys of a dictionary are the names
+        self.assertTrue(templately.validate_placeholders(["a"], {"a": 2}).valid)
+
+        report = templately.validate_placeholders([], [])
+        self.assertFalse(report.valid)
+        self.assertTrue(report.as_dict()["empty_template"])
+
+        # many placeholders are validated quickly
+        names = ["placeholder" + str(i) for i in range(200000)]
+        report = templately.validate_placeholders(names + ["placeholder7"], list(reversed(names)) + ["extra"])
+        self.assertEqual((report.missing, report.extra, report.template_duplicates, report.input_duplicates),
+                         ([], ["extra"], ["placeholder7"], []))
+        self.assertTrue(templately.has_duplicates(names + ["placeholder0"]))
+        self.assertTrue(templately.equal_vectors(names, list(reversed(names))))
+
     def test_check_input_placeholders(self):
         """
         Tests check_input_placeholders(t_placeholders) function
@@ -146,27 +237,56 @@ class TestTemplately(unittest.TestCase):
 
         # test empty vector, return should be {"correct_placeholder": False, "placeholders_names": []}
         check_result = templately.check_input_placeholders([])
-        self.assertEqual(check_result, {"correct_placeholder": False, "placeholders_names": []})
+        self.assertEqual(check_result, {"correct_placeholder": False, "placeholders_names": [],
+                                        "placeholders_index": {}})
 
         # test vector with only the placeholder name, no "=", no file path to inject
         check_result = templately.check_input_placeholders(["a"])
-        self.assertEqual(check_result, {"correct_placeholder": False, "placeholders_names": []})
+        self.assertEqual(check_result, {"correct_placeholder": False, "placeholders_names": [],
+                                        "placeholders_index": {}})
 
         # test vector with "=", no placeholder name, no file path to inject
         check_result = templately.check_input_placeholders(["="])
-        self.assertEqual(check_result, {"correct_placeholder": False, "placeholders_names": [""]})
+        self.assertEqual(check_result, {"correct_placeholder": False, "placeholders_names": [""],
+                                        "placeholders_index": {}})
 
         # test vector with "." as path
         check_result = templately.check_input_placeholders(["a=."])
-        self.assertEqual(check_result, {"correct_placeholder": False, "placeholders_names": ["a"]})
+        self.assertEqual(check_result, {"correct_placeholder": False, "placeholders_names": ["a"],
+                                        "placeholders_index": {}})
 
         # test vector with file path that doesn't exist
         check_result = templately.check_input_placeholders(["a=totallynotexistent.file"])
-        self.assertEqual(check_result, {"correct_placeholder": False, "placeholders_names": ["a"]})
+        self.assertEqual(check_result, {"correct_placeholder": False, "placeholders_names": ["a"],
+                                        "placeholders_index": {}})
 
         # test to file that does exist
         check_result = templately.check_input_placeholders(["a=" + os.path.join(test_path, "file1.txt")])
-        self.assertEqual(check_result, {"correct_placeholder": True, "placeholders_names": ["a"]})
+        self.assertEqual(check_result, {"correct_placeholder": True, "placeholders_names": ["a"],
+                                        "placeholders_index": {"a": os.path.join(test_path, "file1.txt")}})
+
+        # test duplicated names, the index keeps the first file
+        check_result = templately.check_input_placeholders(["a=" + os.path.join(test_path, "file1.txt"),
+                                                            "a=" + os.path.join(test_path, "file2.txt")])
+        self.assertEqual(check_result["placeholders_names"], ["a", "a"])
+        self.assertEqual(check_result["placeholders_index"], {"a": os.path.join(test_path, "file1.txt")})
+
+    def test_index_input_placeholders(self):
+        """
+        Tests index_input_placeholders(t_placeholders) function
+
+        Parses the input placeholders into a dictionary with placeholder names as keys and file paths as values.
+        """
+
+        # test empty vector
+        self.assertEqual(templately.index_input_placeholders([]), {})
+
+        # test malformed placeholders, they are ignored
+        self.assertEqual(templately.index_input_placeholders(["a", "b=c=d"]), {})
+
+        # test duplicated names, the first file is kept
+        self.assertEqual(templately.index_input_placeholders(["a=file1.txt", "b=file2.txt", "a=file3.txt"]),
+                         {"a": "file1.txt", "b": "file2.txt"})
 
     def test_check_placeholder_arguments(self):
         """
@@ -306,6 +426,1264 @@ class TestTemplately(unittest.TestCase):
 
         self.assertTrue(are_equal)
 
+        # the same text and placeholder repeated on a line are substituted one at a time, in place
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        output = os.path.join(tmp_dir, "output.txt")
+
+        index = {"p": os.path.join(test_path, "file1.txt"), "q": os.path.join(test_path, "file2.txt")}
+        templately.output_builder(io.StringIO("a{{ ty.p }}a{{ ty.p }}a\n{{ty.q}}{{ ty.p }}"), {"<output>": output},
+                                  templately.re_builder("{{", "ty.", "}}"), index)
+
+        with open(os.path.join(test_path, "file1.txt"), "r") as fin:
+            content1 = fin.read()
+        with open(os.path.join(test_path, "file2.txt"), "r") as fin:
+            content2 = fin.read()
+        with open(output, "r") as fin:
+            self.assertEqual(fin.read(), "a" + content1 + "a" + content1 + "a\n" + content2 + content1)
+
+    def test_tag_scanner(self):
+        """
+        Tests the TagScanner class and the make_scanner() function
+
+        Finds the placeholders without regex: it can be used instead of the re_builder() pattern.
+        """
+
+        texts = ["this is\n", "{{ ty.placeholder1 }} a {{ ty.placeholder2 }}\n", "test {{ ty.placeholder3 }}",
+                 "{{ty.a}}{{  ty.b  }} {{ ty.c }} }}", "{{ {{ ty.a }} ty.b }}", "{{ ty.a\n}} {{\nty.b }}",
+                 "{{ ty. }} {{ ty.a b }} {{ ty.a", "{ { ty.a }} {{ ty .a }} {{ ty.{{ ty.a }} }}"]
+
+        for binary in (False, True):
+            if binary:
+                regex_pattern = templately.re_builder_bytes("{{", "ty.", "}}")
+            else:
+                regex_pattern = templately.re_builder("{{", "ty.", "}}")
+            scanner = templately.TagScanner("{{", "ty.", "}}", binary)
+
+            # the scanner finds the same placeholders, in the same positions
+            for text in texts:
+                if binary:
+                    text = text.encode("utf-8")
+                self.assertEqual([(m.start(), m.end(), m.group(1)) for m in scanner.finditer(text)],
+                                 [(m.start(), m.end(), m.group(1)) for m in regex_pattern.finditer(text)])
+                self.assertEqual(scanner.findall(text), regex_pattern.findall(text))
+
+        # the template compiled with the scanner is the same
+        with open(os.path.join(test_path, "template.txt"), "r") as t_fin:
+            template = templately.Template(t_fin, templately.make_scanner("{{", "ty.", "}}", "find"))
+        with open(os.path.join(test_path, "template.txt"), "r") as t_fin:
+            self.assertEqual(template.segments, templately.Template(t_fin, templately.re_builder("{{", "ty.", "}}"))
+                                                          .segments)
+
+        # tags that start with spaces are matched only by the regex
+        self.assertTrue(templately.TagScanner.supports("{{", "ty.", "}}"))
+        self.assertFalse(templately.TagScanner.supports("{{", " ty.", "}}"))
+        self.assertFalse(templately.TagScanner.supports("", "ty.", "}}"))
+
+        self.assertIsInstance(templately.make_scanner("{{", "ty.", "}}", "find"), templately.TagScanner)
+        self.assertEqual(templately.make_scanner("{{", "ty.", "}}", "regex"), templately.re_builder("{{", "ty.", "}}"))
+        self.assertEqual(templately.make_scanner("{{", " ty.", "}}", "auto"), templately.re_builder("{{", " ty.", "}}"))
+        self.assertRaises(ValueError, templately.make_scanner, "{{", " ty.", "}}", "find")
+        self.assertRaises(ValueError, templately.make_scanner, "{{", "ty.", "}}", "other")
+
+    def test_template(self):
+        """
+        Tests the Template class
+
+        Template file compiled once into literal and placeholder segments, that can be rendered many times.
+        """
+
+        expected_output = "this is\n----\nthis\nis placeholder1\ncontent\n---- a ----\nthis\nis placeholder2\n" \
+                          "content\n----\ntest ----\nthis\nis placeholder3\ncontent\n----"
+
+        with open(os.path.join(test_path, "template.txt"), "r") as t_fin:
+            template = templately.Template(t_fin, re.compile('\\{\\{\\s*ty\\.(.*?)\\s*\\}\\}'))
+
+        self.assertEqual(template.placeholders, ("placeholder1", "placeholder2", "placeholder3"))
+        self.assertEqual(template.segments, ((templately.SEGMENT_LITERAL, "this is\n"),
+                                             (templately.SEGMENT_PLACEHOLDER, "placeholder1"),
+                                             (templately.SEGMENT_LITERAL, " a "),
+                                             (templately.SEGMENT_PLACEHOLDER, "placeholder2"),
+                                             (templately.SEGMENT_LITERAL, "\ntest "),
+                                             (templately.SEGMENT_PLACEHOLDER, "placeholder3")))
+
+        # the same compiled template is rendered more than one time
+        for _ in range(2):
+            fout = io.StringIO()
+            template.render(fout, {"placeholder1": os.path.join(test_path, "file1.txt"),
+                                   "placeholder2": os.path.join(test_path, "file2.txt"),
+                                   "placeholder3": os.path.join(test_path, "file3.txt")})
+            self.assertEqual(fout.getvalue(), expected_output)
+
+        # rendering with a different mapping changes only the injected content
+        fout = io.StringIO()
+        template.render(fout, {"placeholder1": os.path.join(test_path, "file3.txt"),
+                               "placeholder2": os.path.join(test_path, "file3.txt"),
+                               "placeholder3": os.path.join(test_path, "file3.txt")})
+        self.assertEqual(fout.getvalue(), expected_output.replace("placeholder1", "placeholder3")
+                                                         .replace("placeholder2", "placeholder3"))
+
+    def test_mapped_template(self):
+        """
+        Tests the MappedTemplate class
+
+        Template file memory mapped and rendered as bytes, without decoding it or copying its text.
+        """
+
+        placeholders_files = {"placeholder1": os.path.join(test_path, "file1.txt"),
+                              "placeholder2": os.path.join(test_path, "file2.txt"),
+                              "placeholder3": os.path.join(test_path, "file3.txt")}
+
+        with open(os.path.join(test_path, "template.txt"), "r") as t_fin:
+            template = templately.Template(t_fin, templately.re_builder("{{", "ty.", "}}"))
+        fout = io.StringIO()
+        template.render(fout, placeholders_files)
+        expected_output = fout.getvalue().encode("utf-8")
+
+        # the output is the same of the text engine
+        with templately.MappedTemplate(os.path.join(test_path, "template.txt"),
+                                       templately.re_builder_bytes("{{", "ty.", "}}")) as mapped_template:
+            self.assertEqual(mapped_template.placeholders, ("placeholder1", "placeholder2", "placeholder3"))
+
+            fout = io.BytesIO()
+            mapped_template.render(fout, placeholders_files)
+            self.assertEqual(fout.getvalue(), expected_output)
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        # placeholders can't span more lines, like the ones found one line at a time
+        template_path = os.path.join(tmp_dir, "template.txt")
+        text = "{{ ty.a\n}} {{\nty.b }} {{ ty.c \u00e8 }}\n{{ty.d}}"
+        with open(template_path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+        regex_pattern = templately.re_builder_bytes("{{", "ty.", "}}")
+        with templately.MappedTemplate(template_path, regex_pattern) as mapped_template:
+            self.assertEqual(mapped_template.placeholders,
+                             templately.Template(io.StringIO(text), templately.re_builder("{{", "ty.", "}}"))
+                             .placeholders)
+
+        # an empty template can't be mapped, but it is rendered
+        with open(template_path, "w") as f:
+            pass
+
+        with templately.MappedTemplate(template_path, regex_pattern) as mapped_template:
+            fout = io.BytesIO()
+            mapped_template.render(fout, {})
+            self.assertEqual(fout.getvalue(), b"")
+
+    def test_copy_render(self):
+        """
+        Tests copy_render(t_plan, t_fout, t_copier) function
+
+        Writes to the binary file <t_fout> the byte ranges of <t_plan>.
+        """
+
+        placeholders_files = {"placeholder1": os.path.join(test_path, "file1.txt"),
+                              "placeholder2": os.path.join(test_path, "file2.txt"),
+                              "placeholder3": os.path.join(test_path, "file3.txt")}
+
+        with templately.MappedTemplate(os.path.join(test_path, "template.txt"),
+                                       templately.re_builder_bytes("{{", "ty.", "}}")) as mapped_template:
+            fout = io.BytesIO()
+            mapped_template.render(fout, placeholders_files)
+            expected_output = fout.getvalue()
+
+            plan = mapped_template.render_plan(placeholders_files)
+
+        self.assertEqual(plan[0], (os.path.join(test_path, "template.txt"), 0, len("this is\n")))
+        self.assertEqual(plan[1], (os.path.join(test_path, "file1.txt"), 0,
+                                   os.path.getsize(os.path.join(test_path, "file1.txt"))))
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        output = os.path.join(tmp_dir, "output.txt")
+
+        # each copy method (a small buffer makes the "read" method copy in more steps)
+        for methods in (None, ("sendfile",), ("read",)):
+            copier = templately.RangeCopier(methods, 7)
+            with open(output, "wb") as fout:
+                self.assertEqual(templately.copy_render(plan, fout, copier), len(expected_output))
+            with open(output, "rb") as fout:
+                self.assertEqual(fout.read(), expected_output)
+
+        # a file shorter than planned: the preallocated space after the last byte written is removed
+        with open(output, "wb") as fout:
+            written = templately.copy_render(plan[:1] + [(os.path.join(test_path, "file1.txt"), 0, 1000)], fout)
+        self.assertEqual(os.path.getsize(output), written)
+
+    def test_write_if_changed(self):
+        """
+        Tests write_if_changed(t_path, t_binary) function
+
+        Opens the output file for writing: the file is replaced atomically, and only if its content changes.
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        output = os.path.join(tmp_dir, "out.txt")
+
+        with templately.write_if_changed(output) as fout:
+            fout.write("first")
+        os.chmod(output, 0o640)
+        os.utime(output, ns=(10 ** 9, 10 ** 9))
+
+        # the same content doesn't touch the output
+        with templately.write_if_changed(output) as fout:
+            fout.write("first")
+        self.assertEqual(os.stat(output).st_mtime_ns, 10 ** 9)
+
+        # a different content replaces it, with the same permissions
+        with templately.write_if_changed(output, True) as fout:
+            fout.write(b"second")
+        with open(output, "r") as fin:
+            self.assertEqual(fin.read(), "second")
+        self.assertNotEqual(os.stat(output).st_mtime_ns, 10 ** 9)
+        self.assertEqual(os.stat(output).st_mode & 0o777, 0o640)
+
+        # a failed render leaves the output as it was
+        with self.assertRaises(ValueError):
+            with templately.write_if_changed(output) as fout:
+                fout.write("half")
+                raise ValueError("render failed")
+        with open(output, "r") as fin:
+            self.assertEqual(fin.read(), "second")
+
+        # a symbolic link keeps pointing to the output
+        link = os.path.join(tmp_dir, "link.txt")
+        os.symlink(output, link)
+        with templately.write_if_changed(link) as fout:
+            fout.write("third")
+        self.assertTrue(os.path.islink(link))
+        with open(output, "r") as fin:
+            self.assertEqual(fin.read(), "third")
+
+        # no temporary file is left behind, the files that aren't regular are written directly
+        self.assertEqual(sorted(os.listdir(tmp_dir)), ["link.txt", "out.txt"])
+        with templately.write_if_changed(os.devnull) as fout:
+            fout.write("discarded")
+
+    def test_binary_mode(self):
+        """
+        Tests the --binary option
+
+        The template and the files to inject are rendered as bytes: no decoding, encoding or newline translation.
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        template = os.path.join(tmp_dir, "template.txt")
+        fragment = os.path.join(tmp_dir, "fragment.bin")
+        with open(template, "wb") as fout:
+            fout.write(b"caf\xe9 {{ ty.a\xff }}\r\n\x00end {{ ty.b }}\r\n")
+        with open(fragment, "wb") as fout:
+            fout.write(b"\xfe\r\n\x80")
+        expected = b"caf\xe9 \xfe\r\n\x80\r\n\x00end \xfe\r\n\x80\r\n"
+
+        # the compiled template keeps bytes literals, the names are str
+        pattern = templately.make_scanner("{{", "ty.", "}}", "regex", True)
+        with open(template, "rb") as fin:
+            compiled = templately.Template(fin, pattern)
+        self.assertEqual(compiled.placeholders, ("a\udcff", "b"))
+        self.assertEqual(compiled.segments[0], (templately.SEGMENT_LITERAL, b"caf\xe9 "))
+
+        # the streamed segments are the same, in chunks longer than the placeholders
+        with open(template, "rb") as fin:
+            segments = list(templately.iter_template_segments(fin, pattern, [(b"{{", b"ty.")], 16))
+        self.assertEqual(b"".join(value for kind, value in segments if kind == templately.SEGMENT_LITERAL),
+                         b"caf\xe9 \r\n\x00end \r\n")
+
+        # the command line, with and without --stream
+        output = os.path.join(tmp_dir, "out.bin")
+        for options in ([], ["--stream", "--chunk-size=16"]):
+            try:
+                templately.main(["--binary"] + options + [template, output, "a\udcff=" + fragment, "b=" + fragment])
+            except SystemExit as e:
+                self.assertEqual(e.code, 0)
+
+            with open(output, "rb") as fin:
+                self.assertEqual(fin.read(), expected)
+            os.remove(output)
+
+        # the include expander reads the files as text
+        with self.assertRaises(SystemExit) as cm:
+            templately.main(["--binary", "--recursive", template, output, "a\udcff=" + fragment])
+        self.assertEqual(cm.exception.code, 5)
+
+    def test_template_cache(self):
+        """
+        Tests the TemplateCache class
+
+        Folder of compiled templates (".tyc" files) keyed by the template content and the tags.
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        cache_dir = os.path.join(tmp_dir, "cache")
+
+        text = "a {{ ty.b }}\n{{ ty.c }} d\n"
+        pattern = templately.re_builder("{{", "ty.", "}}")
+        compiled = templately.compile_template_text(text, pattern)
+
+        # the process compiles the same content once and keeps only the last templates
+        self.assertIs(templately.compile_template_text(text[:1] + text[1:], pattern), compiled)
+        for i in range(templately.compiled_templates_max):
+            templately.compile_template_text(text + str(i), pattern)
+        self.assertEqual(len(templately.compiled_templates), templately.compiled_templates_max)
+        self.assertIsNot(templately.compile_template_text(text, pattern), compiled)
+
+        # the first run writes the file, the next ones load it
+        cache = templately.TemplateCache(cache_dir, ["{{", "ty.", "}}"])
+        self.assertEqual(cache.compile(text, pattern).segments, compiled.segments)
+        self.assertEqual(os.listdir(cache_dir), [cache.key(text) + ".tyc"])
+
+        cache = templately.TemplateCache(cache_dir, ["{{", "ty.", "}}"])
+        template = cache.compile(text, pattern)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        self.assertEqual((template.segments, template.placeholders), (compiled.segments, compiled.placeholders))
+
+        # a different text or different tags have their own file
+        self.assertNotEqual(cache.key(text + " "), cache.key(text))
+        self.assertNotEqual(templately.TemplateCache(cache_dir, ["[[", "ty.", "]]"]).key(text), cache.key(text))
+        self.assertNotEqual(cache.key(text.encode("utf-8")), cache.key(text))
+
+        # a broken file is compiled and written again
+        with open(cache.path(cache.key(text)), "wb") as fout:
+            fout.write(templately.TEMPLATE_CACHE_MAGIC + b"\xff")
+        cache = templately.TemplateCache(cache_dir, ["{{", "ty.", "}}"])
+        self.assertEqual(cache.compile(text, pattern).segments, compiled.segments)
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertIsNotNone(cache.load(text, cache.key(text)))
+
+        # the command line renders the same output with and without the file
+        output = os.path.join(tmp_dir, "out.txt")
+        files = [os.path.join(test_path, "file{0}.txt".format(i)) for i in range(1, 4)]
+        args = [os.path.join(test_path, "template.txt"), output] + ["placeholder{0}={1}".format(i + 1, path)
+                                                                    for i, path in enumerate(files)]
+        outputs = []
+        for _ in range(2):
+            templately.main(["--cache-dir=" + cache_dir] + args)
+            with open(output, "r") as fin:
+                outputs.append(fin.read())
+        templately.main(args)
+        with open(output, "r") as fin:
+            self.assertEqual(outputs, [fin.read()] * 2)
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_fragment_cache(self):
+        """
+        Tests the FragmentCache class
+
+        Cache of the content of the files to inject, with a byte budget and LRU eviction.
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        paths = []
+        for i in range(3):
+            paths.append(os.path.join(tmp_dir, "fragment" + str(i) + ".txt"))
+            with open(paths[i], "w") as f:
+                f.write(str(i) * 10)
+
+        # the budget is enough for two of the three files
+        cache = templately.FragmentCache(25)
+
+        # the first request reads the file, the second is served from memory
+        self.assertEqual(cache.get(paths[0]), "0" * 10)
+        self.assertEqual(cache.get(paths[0]), "0" * 10)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # a changed file is read again
+        with open(paths[0], "w") as f:
+            f.write("changed")
+        self.assertEqual(cache.get(paths[0]), "changed")
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertEqual(cache.size, 7)
+
+        # the third file doesn't fit: the least recently used one (fragment0) is evicted
+        cache.get(paths[1])
+        cache.get(paths[2])
+        self.assertEqual(list(cache.entries), [os.path.abspath(paths[1]), os.path.abspath(paths[2])])
+        self.assertEqual(cache.size, 20)
+
+        # a file bigger than the budget is never cached
+        cache = templately.FragmentCache(5)
+        self.assertEqual(cache.get(paths[1]), "1" * 10)
+        self.assertEqual(len(cache.entries), 0)
+
+        # repeated placeholders are read only once, and taken from the cache once per render
+        cache = templately.FragmentCache()
+        template = templately.Template(io.StringIO("{{ ty.a }} {{ ty.b }}\n"), templately.re_builder("{{", "ty.", "}}"))
+        for _ in range(5):
+            fout = io.StringIO()
+            template.render(fout, {"a": paths[1], "b": paths[1]}, cache)
+            self.assertEqual(fout.getvalue(), "1" * 10 + " " + "1" * 10 + "\n")
+        self.assertEqual((cache.hits, cache.misses), (4, 1))
+
+    def test_stat_cache(self):
+        """
+        Tests the StatCache class
+
+        Stat results of the files of a run: each file is stat'ed at most once, by the checks and the renderers together.
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        paths = []
+        for i in range(40):
+            paths.append(os.path.join(tmp_dir, "fragment" + str(i) + ".txt"))
+            with open(paths[i], "w") as f:
+                f.write(str(i) * 10)
+
+        # the files are stat'ed once, at the same time, and the results are reused
+        stats = templately.StatCache(templately.FragmentCache(), 4)
+        stats.prefetch(paths + paths + [os.path.join(tmp_dir, "missing.txt")])
+        self.assertEqual(stats.calls, 41)
+        self.assertTrue(stats.isfile(paths[0]))
+        self.assertFalse(stats.isfile(os.path.join(tmp_dir, "missing.txt")))
+        self.assertFalse(stats.isfile(tmp_dir))
+        self.assertEqual(stats.get(paths[3]), "3" * 10)
+        self.assertEqual(stats.get(paths[3]), "3" * 10)
+        self.assertEqual(stats.calls, 42)
+        self.assertEqual((stats.fragment_cache.hits, stats.fragment_cache.misses), (1, 1))
+
+        # a file that changed after the stat is read whole, and it isn't cached with the old signature
+        with open(paths[4], "a") as f:
+            f.write("grown")
+        self.assertEqual(stats.get(paths[4]), "4" * 10 + "grown")
+        self.assertNotIn(os.path.abspath(paths[4]), stats.fragment_cache.entries)
+        self.assertEqual(templately.FragmentCache().get(paths[4], os.stat(paths[4])), "4" * 10 + "grown")
+
+        # the binary view shares the results
+        binary = stats.with_fragment_cache(templately.FragmentCache(t_binary=True))
+        self.assertEqual(binary.get(paths[3]), b"3" * 10)
+        self.assertIs(binary.results, stats.results)
+
+        # a run of the command line stats each input file once, for the checks, the stamps and the render
+        calls = []
+        os_stat = os.stat
+
+        def counted_stat(t_path, *args, **kwargs):
+            calls.append(os.path.abspath(t_path) if isinstance(t_path, str) else t_path)
+            return os_stat(t_path, *args, **kwargs)
+
+        inputs = [os.path.join(test_path, "template.txt")]
+        inputs += [os.path.join(test_path, "file{0}.txt".format(i)) for i in range(1, 4)]
+        os.stat = counted_stat
+        try:
+            templately.main([inputs[0], os.path.join(tmp_dir, "out.txt"), "--incremental",
+                             "--stamps=" + os.path.join(tmp_dir, "stamps.json")] +
+                            ["placeholder{0}={1}".format(i, inputs[i]) for i in range(1, 4)])
+        finally:
+            os.stat = os_stat
+        for path in inputs:
+            self.assertEqual(calls.count(os.path.abspath(path)), 1)
+
+    def test_include_expander(self):
+        """
+        Tests the IncludeExpander class
+
+        Expands the placeholders inside the files to inject, recursively, expanding each file only once.
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        # fifty parents include the same sub-fragment
+        files = {"title": "TITLE", "version": "1.0", "header": "[{{ ty.title }} {{ ty.version }}]"}
+        for i in range(50):
+            files["part" + str(i)] = "<{{ ty.header }}>"
+
+        for name in files:
+            with open(os.path.join(tmp_dir, name), "w") as f:
+                f.write(files[name])
+
+        def resolver(t_name):
+            return os.path.join(tmp_dir, t_name)
+
+        regex_pattern = templately.re_builder("{{", "ty.", "}}")
+        template = templately.Template(io.StringIO("".join("{{ ty.part" + str(i) + " }}" for i in range(50))),
+                                       regex_pattern)
+
+        expander = templately.IncludeExpander(regex_pattern, resolver)
+        self.assertEqual(expander.check(template.placeholders), ["header", "title", "version"])
+
+        fout = io.StringIO()
+        template.render(fout, {name: resolver(name) for name in template.placeholders}, expander)
+        self.assertEqual(fout.getvalue(), "<[TITLE 1.0]>" * 50)
+
+        # each file is compiled and expanded once
+        self.assertEqual(len(expander.templates), 53)
+        self.assertEqual(len(expander.expanded), 53)
+
+        # a new check of the same files finds the names of the files already walked
+        self.assertEqual(expander.check(["part0"]), ["header", "title", "version"])
+
+        # the chain of a cycle is reported
+        with open(os.path.join(tmp_dir, "title"), "w") as f:
+            f.write("{{ ty.part7 }}")
+
+        expander = templately.IncludeExpander(regex_pattern, resolver)
+        with self.assertRaises(templately.IncludeError) as cm:
+            expander.check(["part3"])
+        self.assertEqual(cm.exception.chain, ["header", "title", "part7", "header"])
+        self.assertIsInstance(cm.exception, templately.TemplatelyError)
+
+        # the depth limit is checked also through the files already walked
+        with open(os.path.join(tmp_dir, "title"), "w") as f:
+            f.write("TITLE")
+
+        expander = templately.IncludeExpander(regex_pattern, resolver, 2)
+        with self.assertRaises(templately.IncludeError) as cm:
+            expander.check(["header", "part0"])
+        self.assertEqual(cm.exception.chain, ["part0", "header", "title"])
+
+    def test_render(self):
+        """
+        Tests render(t_template, t_mapping, t_out, t_tags, t_dialects) and render_to_file() functions
+
+        Renders the template <t_template> with the placeholder values of <t_mapping>, inside the calling process.
+        """
+
+        expected_output = "this is\n----\nthis\nis placeholder1\ncontent\n---- a ----\nthis\nis placeholder2\n" \
+                          "content\n----\ntest ----\nthis\nis placeholder3\ncontent\n----"
+
+        mapping = {"placeholder1": pathlib.Path(test_path, "file1.txt"),
+                   "placeholder2": pathlib.Path(test_path, "file2.txt"),
+                   "placeholder3": pathlib.Path(test_path, "file3.txt")}
+
+        # path-like objects are files
+        self.assertEqual(templately.render(pathlib.Path(test_path, "template.txt"), mapping), expected_output)
+
+        # file-like objects are read, the output can be written to a file-like object
+        fout = io.BytesIO()
+        with open(os.path.join(test_path, "template.txt"), "r") as t_fin:
+            self.assertIsNone(templately.render(t_fin, mapping, fout))
+        self.assertEqual(fout.getvalue(), expected_output.encode("utf-8"))
+
+        # str and bytes are content, bytes are passed through unchanged
+        self.assertEqual(templately.render("Hello {{ ty.name }}!", {"name": "World"}), "Hello World!")
+        self.assertEqual(templately.render(b"\xff{{ ty.a }}\r\n", {"a": b"\xfe\x00"}), b"\xff\xfe\x00\r\n")
+        self.assertEqual(templately.render("%% template.a %% {{ ty.b }}", {"a": "A", "b": io.StringIO("B")},
+                                           t_tags=("%%", "template.", "%%"), t_dialects=[("{{", "ty.", "}}")]),
+                         "A B")
+
+        # the errors are exceptions
+        with self.assertRaises(templately.PlaceholderError) as cm:
+            templately.render("{{ ty.a }}{{ ty.a }}{{ ty.b }}", {"a": "A", "c": "C"})
+        self.assertEqual((cm.exception.missing, cm.exception.extra, cm.exception.duplicates), (["b"], ["c"], ["a"]))
+        self.assertIsInstance(cm.exception, templately.TemplatelyError)
+
+        self.assertRaises(TypeError, templately.render, "{{ ty.a }}", {"a": 1})
+        self.assertRaises(OSError, templately.render, pathlib.Path(test_path, "missing.txt"), {})
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        templately.render_to_file(pathlib.Path(test_path, "template.txt"), mapping, os.path.join(tmp_dir, "out.txt"))
+        with open(os.path.join(tmp_dir, "out.txt"), "r") as fout:
+            self.assertEqual(fout.read(), expected_output)
+
+        # a bad render doesn't touch the output file
+        with self.assertRaises(templately.PlaceholderError):
+            templately.render_to_file("{{ ty.a }}", {}, os.path.join(tmp_dir, "out.txt"))
+        self.assertEqual(os.path.getsize(os.path.join(tmp_dir, "out.txt")), len(expected_output))
+
+    def test_render_stats(self):
+        """
+        Tests the RenderStats class
+
+        Wall time of the phases of a run and its I/O counters (see the --stats option and render()).
+        """
+
+        # the Python API fills the statistics it is given
+        run_stats = templately.RenderStats()
+        self.assertEqual(templately.render("Hello {{ ty.name }}! {{ ty.raw }}", {"name": "World", "raw": b"\xff"},
+                                           t_stats=run_stats), "Hello World! \udcff")
+        stats = run_stats.as_dict()
+        self.assertEqual(list(stats["phases"]), ["re_builder", "scan", "validation", "read", "render"])
+        self.assertEqual({source: (entry["injections"], entry["bytes"]) for source, entry in stats["sources"].items()},
+                         {"name": (1, 5), "raw": (1, 1)})
+        self.assertEqual((stats["bytes_read"], stats["bytes_written"], stats["matches"]), (6, 14, 2))
+
+        # the command line prints them to the standard error, for each injected file
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        files = [os.path.join(test_path, "file{0}.txt".format(i)) for i in range(1, 4)]
+        for options, output in ((["--stats=json"], os.path.join(tmp_dir, "out.txt")),
+                                (["--stats=json", "--engine=copy"], os.path.join(tmp_dir, "out.txt")),
+                                (["--stats=json", "--stream"], "-")):
+            stderr = io.StringIO()
+            with contextlib.redirect_stderr(stderr), contextlib.redirect_stdout(io.StringIO()):
+                # the stream and the bytes engines end with sys.exit(0)
+                try:
+                    templately.main(options + [os.path.join(test_path, "template.txt"), output] +
+                                    ["placeholder{0}={1}".format(i + 1, path) for i, path in enumerate(files)])
+                except SystemExit as e:
+                    self.assertEqual(e.code, 0)
+
+            stats = json.loads(stderr.getvalue())
+            self.assertTrue({"arguments", "re_builder", "scan", "validation", "render"} <= set(stats["phases"]))
+            self.assertEqual(sorted(stats["sources"]), [os.path.abspath(path) for path in files])
+            self.assertEqual((stats["bytes_read"], stats["bytes_written"], stats["matches"]), (114, 131, 3))
+
+        # a bare --stats is the text format
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            templately.main(["--stats", os.path.join(test_path, "template.txt"), os.path.join(tmp_dir, "out.txt")] +
+                            ["placeholder{0}={1}".format(i + 1, path) for i, path in enumerate(files)])
+        self.assertTrue(stderr.getvalue().startswith("Stats:\n"))
+
+    def test_main(self):
+        """
+        Tests main(t_argv) function
+
+        Command line entry point, parses the arguments and runs the requested mode.
+        The modules used only by some modes are imported when they are needed, not by "import templately".
+        """
+
+        # a new interpreter, this one has already imported everything
+        code = "import sys; import templately; print(' '.join(sorted(sys.modules)))"
+        modules = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, universal_newlines=True,
+                                 env=dict(os.environ, PYTHONPATH=os.path.abspath(templately_path)),
+                                 check=True).stdout.split()
+        for module in ("docopt", "concurrent.futures", "ctypes", "csv", "json", "glob", "mmap", "select", "struct"):
+            self.assertNotIn(module, modules)
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        templately.main([os.path.join(test_path, "template.txt"), os.path.join(tmp_dir, "out.txt")] +
+                        ["placeholder{0}={1}".format(i, os.path.join(test_path, "file{0}.txt".format(i)))
+                         for i in range(1, 4)])
+        self.assertEqual(templately.render(pathlib.Path(tmp_dir, "out.txt"), {}),
+                         "this is\n----\nthis\nis placeholder1\ncontent\n---- a ----\nthis\nis placeholder2\n"
+                         "content\n----\ntest ----\nthis\nis placeholder3\ncontent\n----")
+
+        # the errors of the command line exit with their status
+        with self.assertRaises(SystemExit) as cm:
+            templately.main([os.path.join(test_path, "template.txt"), os.path.join(tmp_dir, "out.txt"), "a=b"])
+        self.assertEqual(cm.exception.code, 2)
+
+    def test_render_server(self):
+        """
+        Tests RenderServer(t_path, t_jobs) class and run_client(t_argv, t_socket_path, t_stdin) function
+
+        The daemon runs the command lines of its clients on a Unix socket, with warm caches.
+        """
+
+        expected_output = "this is\n----\nthis\nis placeholder1\ncontent\n---- a ----\nthis\nis placeholder2\n" \
+                          "content\n----\ntest ----\nthis\nis placeholder3\ncontent\n----"
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        socket_path = os.path.join(tmp_dir, "templately.sock")
+
+        server = templately.RenderServer(socket_path, 4)
+        thread = threading.Thread(target=server.run)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.stop)
+        self.assertTrue(server.ready.wait(10))
+
+        # the clients render at the same time, their paths are relative to their current directory
+        placeholders = ["placeholder{0}=file{0}.txt".format(i) for i in range(1, 4)]
+        answers = [None] * 8
+
+        def client(t_index):
+            answers[t_index] = templately.run_client(["template.txt", os.path.join(tmp_dir, str(t_index))]
+                                                     + placeholders, socket_path)
+
+        cwd = os.getcwd()
+        os.chdir(os.path.abspath(test_path))
+        self.addCleanup(os.chdir, cwd)
+
+        clients = [threading.Thread(target=client, args=(i,)) for i in range(len(answers))]
+        for c in clients:
+            c.start()
+        for c in clients:
+            c.join()
+
+        for i, answer in enumerate(answers):
+            self.assertEqual(answer["status"], 0)
+            with open(os.path.join(tmp_dir, str(i)), "r") as fout:
+                self.assertEqual(fout.read(), expected_output)
+
+        # the standard input and the standard output go through the socket
+        answer = templately.run_client(["-", "-"] + placeholders, socket_path,
+                                       b"\xff {{ ty.placeholder1 }}{{ ty.placeholder2 }}{{ ty.placeholder3 }}")
+        self.assertEqual(answer["status"], 0)
+        self.assertTrue(answer["stdout"].encode("utf-8", "surrogateescape").startswith(b"\xff ----\nthis"))
+
+        # the exit status is the one of the command line
+        self.assertEqual(templately.run_client(["template.txt", os.path.join(tmp_dir, "bad"), "a=b"],
+                                               socket_path)["status"], 2)
+        self.assertEqual(templately.run_client(["--bad-option"], socket_path)["status"], 1)
+        self.assertEqual(templately.run_client(["serve"], socket_path)["status"], 5)
+
+        # the command line sends the same arguments with --client
+        with self.assertRaises(SystemExit) as cm:
+            templately.main(["--client", "--socket=" + socket_path, "template.txt", os.path.join(tmp_dir, "main")]
+                            + placeholders)
+        self.assertEqual(cm.exception.code, 0)
+        with open(os.path.join(tmp_dir, "main"), "r") as fout:
+            self.assertEqual(fout.read(), expected_output)
+
+        # a second daemon can't steal the socket
+        self.assertRaises(OSError, templately.RenderServer(socket_path).run)
+
+        self.assertGreaterEqual(server.requests, len(answers) + 4)
+
+    def test_resolve_sources(self):
+        """
+        Tests resolve_sources(t_placeholders, t_directory, t_timeout) function
+
+        Replaces the commands and the URLs of the input placeholders with files that contain what they produced,
+        the sources are read at the same time.
+        """
+
+        import http.server
+        import socketserver
+        import time
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                # /slow answers late, /missing doesn't exist
+                if self.path.startswith("/slow"):
+                    time.sleep(0.4)
+                if self.path.startswith("/missing"):
+                    self.send_error(404)
+                    return
+                body = ("path " + self.path).encode("utf-8")
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except ConnectionError:
+                    pass  # the client timed out
+
+            def log_message(self, *args):
+                pass
+
+        # http.server.ThreadingHTTPServer needs Python 3.7
+        class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            daemon_threads = True
+
+        server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = "http://127.0.0.1:" + str(server.server_address[1])
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        # the files stay files, the sources become files
+        start = time.perf_counter()
+        placeholders = templately.resolve_sources(["a=file1.txt", "b=!sleep 0.4; printf 'x=1'",
+                                                   "c=" + url + "/slow?q=1&r=2"], tmp_dir, 5)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(placeholders[0], "a=file1.txt")
+        contents = []
+        for placeholder in placeholders[1:]:
+            with open(placeholder.partition("=")[2], "r") as fsource:
+                contents.append(fsource.read())
+        self.assertEqual(contents, ["x=1", "path /slow?q=1&r=2"])
+
+        # the two slow sources are read at the same time
+        self.assertLess(elapsed, 0.75)
+
+        # every failure is reported, a slow source is stopped by its timeout
+        with self.assertRaises(templately.SourceError) as cm:
+            templately.resolve_sources(["a=!exit 3", "b=" + url + "/missing", "c=" + url + "/slow", "d=!echo ok"],
+                                       tmp_dir, 0.2)
+        self.assertEqual([failure[0] for failure in cm.exception.failures], ["a", "b", "c"])
+        self.assertIn("exit status 3", str(cm.exception))
+        self.assertIn("404", str(cm.exception))
+        self.assertIn("timed out", str(cm.exception))
+
+        self.assertTrue(templately.is_source("HTTPS://example.com"))
+        self.assertFalse(templately.is_source("file1.txt"))
+
+        # an existing file is read, even if its path looks like a command
+        with open(os.path.join(tmp_dir, "!echo ran"), "w") as fsource:
+            fsource.write("not a command")
+        self.assertFalse(templately.is_source(os.path.join(tmp_dir, "!echo ran")))
+
+        cwd = os.getcwd()
+        os.chdir(tmp_dir)
+        try:
+            self.assertFalse(templately.is_source("!echo ran"))
+            self.assertEqual(templately.resolve_sources(["a=!echo ran"], tmp_dir), ["a=!echo ran"])
+        finally:
+            os.chdir(cwd)
+
+        # the command line injects what the sources produced
+        cwd = os.getcwd()
+        os.chdir(os.path.abspath(test_path))
+        self.addCleanup(os.chdir, cwd)
+
+        templately.main(["template.txt", os.path.join(tmp_dir, "out.txt"), "placeholder1=!cat file1.txt",
+                         "placeholder2=" + url + "/2", "placeholder3=file3.txt"])
+        with open(os.path.join(tmp_dir, "out.txt"), "r") as fout:
+            self.assertIn("---- a path /2\ntest ----", fout.read())
+
+        with self.assertRaises(SystemExit) as cm:
+            templately.main(["template.txt", os.path.join(tmp_dir, "out.txt"), "placeholder1=!false",
+                             "placeholder2=file2.txt", "placeholder3=file3.txt"])
+        self.assertEqual(cm.exception.code, 8)
+
+    def test_read_manifest(self):
+        """
+        Tests read_manifest(t_fmanifest, t_csv) function
+
+        Reads the rows of the batch manifest <t_fmanifest> one at a time.
+        """
+
+        # JSON lines manifest, blank lines are ignored
+        fmanifest = io.StringIO('{"output": "out1.txt", "placeholders": {"a": "file1.txt"}}\n'
+                                '\n'
+                                '{"output": "out2.txt", "placeholders": ["a=file2.txt"]}\n'
+                                'not json\n'
+                                '{"placeholders": ["a=file2.txt"]}\n'
+                                '{"output": "out3.txt"}\n')
+        rows = list(templately.read_manifest(fmanifest))
+
+        self.assertEqual(rows[0], {"row": 1, "output": "out1.txt", "placeholders": ["a=file1.txt"], "error": None})
+        self.assertEqual(rows[1], {"row": 2, "output": "out2.txt", "placeholders": ["a=file2.txt"], "error": None})
+        self.assertEqual([row["error"] is not None for row in rows], [False, False, True, True, True])
+
+        # CSV manifest
+        fmanifest = io.StringIO("output,a,b\nout1.txt,file1.txt,file2.txt\nout2.txt,file1.txt\n"
+                                "out3.txt,file1.txt,file2.txt,file3.txt\n")
+        rows = list(templately.read_manifest(fmanifest, True))
+
+        self.assertEqual(rows[0], {"row": 1, "output": "out1.txt", "placeholders": ["a=file1.txt", "b=file2.txt"],
+                                   "error": None})
+        self.assertEqual([row["error"] is not None for row in rows], [False, True, True])
+
+    def test_run_batch(self):
+        """
+        Tests run_batch(t_template, t_fmanifest, t_jobs, t_csv) function
+
+        Renders the compiled template once for each row of the manifest <t_fmanifest>.
+        """
+
+        expected_output = "this is\n----\nthis\nis placeholder1\ncontent\n---- a ----\nthis\nis placeholder2\n" \
+                          "content\n----\ntest ----\nthis\nis placeholder3\ncontent\n----"
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        with open(os.path.join(test_path, "template.txt"), "r") as t_fin:
+            template = templately.Template(t_fin, templately.re_builder("{{", "ty.", "}}"))
+
+        placeholders = {"placeholder1": os.path.join(test_path, "file1.txt"),
+                        "placeholder2": os.path.join(test_path, "file2.txt"),
+                        "placeholder3": os.path.join(test_path, "file3.txt")}
+
+        manifest = ""
+        for i in range(10):
+            manifest += json.dumps({"output": os.path.join(tmp_dir, str(i) + ".txt"),
+                                    "placeholders": placeholders}) + "\n"
+
+        # the row with a missing placeholder and the row with a missing output folder fail
+        manifest += json.dumps({"output": os.path.join(tmp_dir, "bad.txt"),
+                                "placeholders": {"placeholder1": placeholders["placeholder1"]}}) + "\n"
+        manifest += json.dumps({"output": os.path.join(tmp_dir, "missing", "bad.txt"),
+                                "placeholders": placeholders}) + "\n"
+
+        # the rows are rendered by the process and by a pool of processes
+        for jobs in (1, 2):
+            failed_rows = templately.run_batch(template, io.StringIO(manifest), jobs)
+            self.assertEqual(failed_rows, 2)
+
+            for i in range(10):
+                with open(os.path.join(tmp_dir, str(i) + ".txt"), "r") as fout:
+                    self.assertEqual(fout.read(), expected_output)
+                os.remove(os.path.join(tmp_dir, str(i) + ".txt"))
+
+            self.assertFalse(os.path.exists(os.path.join(tmp_dir, "bad.txt")))
+
+        # a file to inject that isn't UTF-8 fails only its row, the next rows are rendered
+        not_utf8 = os.path.join(tmp_dir, "not_utf8.txt")
+        with open(not_utf8, "wb") as f:
+            f.write(b"\xff\xfe")
+
+        manifest = json.dumps({"output": os.path.join(tmp_dir, "bad.txt"),
+                               "placeholders": dict(placeholders, placeholder1=not_utf8)}) + "\n"
+        manifest += json.dumps({"output": os.path.join(tmp_dir, "0.txt"), "placeholders": placeholders}) + "\n"
+
+        for jobs in (1, 2):
+            failed_rows = templately.run_batch(template, io.StringIO(manifest), jobs)
+            self.assertEqual(failed_rows, 1)
+
+            with open(os.path.join(tmp_dir, "0.txt"), "r") as fout:
+                self.assertEqual(fout.read(), expected_output)
+            os.remove(os.path.join(tmp_dir, "0.txt"))
+
+            self.assertFalse(os.path.exists(os.path.join(tmp_dir, "bad.txt")))
+
+    def test_fragment_path(self):
+        """
+        Tests fragment_path(t_fragments_dir, t_name) function
+
+        Returns the path of the file to inject for the placeholder <t_name>, the file is inside <t_fragments_dir>.
+        """
+
+        self.assertEqual(templately.fragment_path("fragments", "base"), os.path.join("fragments", "base"))
+        self.assertEqual(templately.fragment_path("fragments", "ssl/dev"), os.path.join("fragments", "ssl", "dev"))
+
+        # names outside the fragments folder are not valid
+        self.assertIsNone(templately.fragment_path("fragments", "../secret"))
+        self.assertIsNone(templately.fragment_path("fragments", "ssl/../../secret"))
+        self.assertIsNone(templately.fragment_path("fragments", os.path.abspath("secret")))
+        self.assertIsNone(templately.fragment_path("fragments", ""))
+
+        # the current folder and the root folder contain the fragments too
+        self.assertEqual(templately.fragment_path(".", "ssl/dev"), os.path.join("ssl", "dev"))
+        self.assertEqual(templately.fragment_path("./", "base"), "base")
+        self.assertEqual(templately.fragment_path(os.sep, "ssl/dev"), os.path.join(os.sep, "ssl", "dev"))
+        self.assertIsNone(templately.fragment_path(".", "../secret"))
+        self.assertIsNone(templately.fragment_path(".", "."))
+        self.assertIsNone(templately.fragment_path(os.sep, ""))
+
+    def test_run_build(self):
+        """
+        Tests run_build(t_src_dir, t_out_dir, t_fragments_dir, t_glob, t_regex_pattern, t_jobs) function
+
+        Renders all the templates of <t_src_dir> to <t_out_dir>, the placeholders are files of <t_fragments_dir>.
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        src_dir = os.path.join(tmp_dir, "src")
+        out_dir = os.path.join(tmp_dir, "out")
+        fragments_dir = os.path.join(src_dir, "fragments")
+        os.makedirs(os.path.join(fragments_dir, "ssl"))
+        os.makedirs(os.path.join(src_dir, "nginx"))
+        os.makedirs(out_dir)
+
+        files = {os.path.join(src_dir, "Dockerfile"): "FROM x\n{{ ty.base }}\nRUN {{ ty.ssl/dev }}\n",
+                 os.path.join(src_dir, "nginx", "site.conf"): "server {{ ty.base }}\n",
+                 os.path.join(fragments_dir, "base"): "BASE",
+                 os.path.join(fragments_dir, "ssl", "dev"): "DEV"}
+        for path in files:
+            with open(path, "w") as f:
+                f.write(files[path])
+
+        # the fragments folder is not a template folder
+        self.assertEqual(templately.find_templates(src_dir, "**/*", [fragments_dir, out_dir]),
+                         ["Dockerfile", os.path.join("nginx", "site.conf")])
+        self.assertEqual(templately.find_templates(src_dir, "**/*.conf", [fragments_dir, out_dir]),
+                         [os.path.join("nginx", "site.conf")])
+
+        for jobs in (1, 2):
+            failed_templates = templately.run_build(src_dir, out_dir, fragments_dir, "**/*",
+                                                    templately.re_builder("{{", "ty.", "}}"), jobs)
+            self.assertEqual(failed_templates, 0)
+
+            with open(os.path.join(out_dir, "Dockerfile"), "r") as fout:
+                self.assertEqual(fout.read(), "FROM x\nBASE\nRUN DEV\n")
+            with open(os.path.join(out_dir, "nginx", "site.conf"), "r") as fout:
+                self.assertEqual(fout.read(), "server BASE\n")
+
+        # a template with a placeholder without file fails, the others are rendered
+        with open(os.path.join(src_dir, "bad"), "w") as f:
+            f.write("{{ ty.missing }} {{ ty.../secret }}\n")
+
+        failed_templates = templately.run_build(src_dir, out_dir, fragments_dir, "**/*",
+                                                templately.re_builder("{{", "ty.", "}}"), 1)
+        self.assertEqual(failed_templates, 1)
+        self.assertFalse(os.path.exists(os.path.join(out_dir, "bad")))
+        os.remove(os.path.join(src_dir, "bad"))
+
+        # a file to inject that isn't UTF-8 fails only the templates that inject it
+        with open(os.path.join(fragments_dir, "not_utf8"), "wb") as f:
+            f.write(b"\xff\xfe")
+        for name in ("bad1", "bad2"):
+            with open(os.path.join(src_dir, name), "w") as f:
+                f.write("{{ ty.base }} {{ ty.not_utf8 }}\n")
+
+        for jobs in (1, 2):
+            failed_templates = templately.run_build(src_dir, out_dir, fragments_dir, "**/*",
+                                                    templately.re_builder("{{", "ty.", "}}"), jobs)
+            self.assertEqual(failed_templates, 2)
+            self.assertFalse(os.path.exists(os.path.join(out_dir, "bad1")))
+            self.assertFalse(os.path.exists(os.path.join(out_dir, "bad2")))
+            with open(os.path.join(out_dir, "Dockerfile"), "r") as fout:
+                self.assertEqual(fout.read(), "FROM x\nBASE\nRUN DEV\n")
+
+            with self.assertRaises(SystemExit) as cm:
+                templately.main(["build", "--jobs=" + str(jobs), "--fragments=" + fragments_dir, src_dir, out_dir])
+            self.assertEqual(cm.exception.code, 4)
+
+    def test_stamp_database(self):
+        """
+        Tests the StampDatabase class
+
+        Stamp file that remembers the inputs of each output, to skip the renders that wouldn't change it.
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        stamps_path = os.path.join(tmp_dir, "stamps.json")
+        output = os.path.join(tmp_dir, "output.txt")
+        fragment = os.path.join(tmp_dir, "fragment.txt")
+        with open(fragment, "w") as f:
+            f.write("fragment")
+
+        inputs = {"<template>": os.path.join(test_path, "template.txt"), "a": fragment}
+
+        # an output never rendered isn't up to date
+        stamps = templately.StampDatabase(stamps_path, ["{{", "ty.", "}}"])
+        self.assertFalse(stamps.is_up_to_date(output, inputs))
+
+        signatures = templately.file_signatures(inputs)
+        with open(output, "w") as f:
+            f.write("output")
+        stamps.record(output, signatures)
+        stamps.save()
+
+        # the temporary file of the stamp file doesn't outlive the save
+        self.assertEqual(sorted(os.listdir(tmp_dir)), ["fragment.txt", "output.txt", "stamps.json"])
+
+        # the stamps are loaded from the stamp file
+        stamps = templately.StampDatabase(stamps_path, ["{{", "ty.", "}}"])
+        self.assertTrue(stamps.is_up_to_date(output, inputs))
+        self.assertTrue(stamps.is_up_to_date(output))
+
+        # different configuration
+        self.assertFalse(templately.StampDatabase(stamps_path, ["%%", "ty.", "%%"]).is_up_to_date(output, inputs))
+
+        # different files, or the same files with different roles
+        self.assertFalse(stamps.is_up_to_date(output, {"<template>": inputs["<template>"]}))
+        self.assertFalse(stamps.is_up_to_date(output, {"<template>": fragment, "a": inputs["<template>"]}))
+
+        # changed input
+        with open(fragment, "w") as f:
+            f.write("changed fragment")
+        self.assertFalse(stamps.is_up_to_date(output, inputs))
+        self.assertFalse(stamps.is_up_to_date(output))
+
+        # changed output
+        stamps.record(output, templately.file_signatures(inputs))
+        self.assertTrue(stamps.is_up_to_date(output, inputs))
+        with open(output, "w") as f:
+            f.write("modified output")
+        self.assertFalse(stamps.is_up_to_date(output, inputs))
+
+        # a broken stamp file is ignored
+        with open(stamps_path, "w") as f:
+            f.write("{")
+        self.assertEqual(templately.StampDatabase(stamps_path, []).stamps, {})
+
+    def test_watcher(self):
+        """
+        Tests the Watcher class
+
+        Keeps the outputs up to date: when a file changes only the outputs that depend on it are rendered again.
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        files = {"template1": "1 {{ ty.a }}\n", "template2": "2 {{ ty.b }}\n", "a": "A", "b": "B"}
+        for name in files:
+            with open(os.path.join(tmp_dir, name), "w") as f:
+                f.write(files[name])
+
+        def resolver(t_template):
+            return {name: os.path.join(tmp_dir, name) for name in t_template.placeholders}
+
+        watcher = templately.Watcher(templately.re_builder("{{", "ty.", "}}"), templately.PollingMonitor(0.01), 0.01)
+        watcher.add(os.path.join(tmp_dir, "template1"), os.path.join(tmp_dir, "output1"), resolver)
+        watcher.add(os.path.join(tmp_dir, "template2"), os.path.join(tmp_dir, "output2"), resolver)
+        self.assertEqual(watcher.render_all(), 0)
+
+        # each file is associated to the outputs that use it
+        self.assertEqual(watcher.affected_outputs([os.path.join(tmp_dir, "a")]), {os.path.join(tmp_dir, "output1")})
+        self.assertEqual(watcher.affected_outputs([os.path.join(tmp_dir, "template2")]),
+                         {os.path.join(tmp_dir, "output2")})
+
+        # a changed injected file renders only the output that uses it
+        with open(os.path.join(tmp_dir, "a"), "w") as f:
+            f.write("AA")
+        self.assertEqual(watcher.rebuild([os.path.join(tmp_dir, "a")]), {os.path.join(tmp_dir, "output1"): True})
+        with open(os.path.join(tmp_dir, "output1"), "r") as f:
+            self.assertEqual(f.read(), "1 AA\n")
+
+        # a changed template is compiled again and its new placeholders become dependencies
+        with open(os.path.join(tmp_dir, "template2"), "w") as f:
+            f.write("2 {{ ty.a }}!\n")
+        watcher.run(1)
+        with open(os.path.join(tmp_dir, "output2"), "r") as f:
+            self.assertEqual(f.read(), "2 AA!\n")
+        self.assertEqual(watcher.affected_outputs([os.path.join(tmp_dir, "b")]), set())
+        self.assertEqual(watcher.affected_outputs([os.path.join(tmp_dir, "a")]),
+                         {os.path.join(tmp_dir, "output1"), os.path.join(tmp_dir, "output2")})
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is available only on Linux")
+    def test_inotify_monitor(self):
+        """
+        Tests the InotifyMonitor class
+
+        Notices the changes of a set of files with the Linux inotify API (used through :mod:`ctypes`).
+        """
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+
+        watched = os.path.join(tmp_dir, "watched")
+        with open(watched, "w") as f:
+            f.write("content")
+
+        monitor = templately.InotifyMonitor()
+        self.addCleanup(monitor.close)
+        monitor.watch([watched])
+
+        self.assertEqual(monitor.wait(0.01), set())
+
+        # files that aren't watched are ignored
+        with open(os.path.join(tmp_dir, "other"), "w") as f:
+            f.write("content")
+        self.assertEqual(monitor.wait(0.1), set())
+
+        # a file replaced by a rename is noticed
+        with open(os.path.join(tmp_dir, "watched.tmp"), "w") as f:
+            f.write("new content")
+        os.replace(os.path.join(tmp_dir, "watched.tmp"), watched)
+        self.assertEqual(monitor.wait(1.0), {watched})
+
+    def test_find_pending_tag(self):
+        """
+        Tests find_pending_tag(t_text, t_start, t_tags) function
+
+        Returns the position of the first tag inside <t_text> (from <t_start>) that could be completed by more text.
+        """
+
+        tags = [("{{", "ty.")]
+
+        # no tag
+        self.assertEqual(templately.find_pending_tag("only text", 0, tags), 9)
+
+        # the beginning of a placeholder
+        self.assertEqual(templately.find_pending_tag("text {{ ty.placehol", 0, tags), 5)
+        self.assertEqual(templately.find_pending_tag("text {{ t", 0, tags), 5)
+        self.assertEqual(templately.find_pending_tag("text {{   ", 0, tags), 5)
+
+        # an opening tag that can't be a placeholder, then the beginning of an opening tag
+        self.assertEqual(templately.find_pending_tag("text {{ not a placeholder {", 0, tags), 26)
+
+        # the search starts from t_start
+        self.assertEqual(templately.find_pending_tag("{{ ty.a text", 3, tags), 12)
+
+    def test_iter_template_segments(self):
+        """
+        Tests iter_template_segments(t_fin, t_regex_pattern, t_tags, t_chunk_size) function
+
+        Reads the template file <t_fin> in chunks of <t_chunk_size> characters and yields its segments.
+        """
+
+        regex_pattern = templately.re_builder("{{", "ty.", "}}")
+
+        text = "this is\n{{ ty.placeholder1 }} a {{ ty.placeholder2 }}\ntest {{ ty.placeholder3 }}{{ t" \
+               "{{ ty.a }\n}}{{ ty.b }}{{ ty. long name }}x{{"
+
+        expected = templately.Template(io.StringIO(text), regex_pattern).segments
+
+        # every chunk size splits the placeholders in different points,
+        # the placeholders longer than the chunks are kept until they are closed
+        for chunk_size in range(1, 60):
+            segments = []
+            for kind, value in templately.iter_template_segments(io.StringIO(text), regex_pattern, [("{{", "ty.")],
+                                                                 chunk_size):
+                # join the consecutive literal segments, like the Template class does
+                if segments and kind == templately.SEGMENT_LITERAL and segments[-1][0] == kind:
+                    segments[-1] = (kind, segments[-1][1] + value)
+                else:
+                    segments.append((kind, value))
+
+            self.assertEqual(tuple(segments), expected)
+
+    def test_stream_render(self):
+        """
+        Tests stream_render(t_fin, t_fout, t_placeholders_index, t_regex_pattern, t_tags, t_chunk_size) function
+
+        Renders the template file <t_fin> to <t_fout> while it is read, with bounded memory.
+        """
+
+        expected_output = "this is\n----\nthis\nis placeholder1\ncontent\n---- a ----\nthis\nis placeholder2\n" \
+                          "content\n----\ntest ----\nthis\nis placeholder3\ncontent\n----"
+
+        for chunk_size in (32, 65536):
+            fout = io.StringIO()
+            with open(os.path.join(test_path, "template.txt"), "r") as t_fin:
+                placeholders = templately.stream_render(t_fin, fout,
+                                                        {"placeholder1": os.path.join(test_path, "file1.txt"),
+                                                         "placeholder2": os.path.join(test_path, "file2.txt"),
+                                                         "placeholder3": os.path.join(test_path, "file3.txt")},
+                                                        templately.re_builder("{{", "ty.", "}}"), [("{{", "ty.")],
+                                                        chunk_size)
+
+            self.assertEqual(placeholders, ["placeholder1", "placeholder2", "placeholder3"])
+            self.assertEqual(fout.getvalue(), expected_output)
+
+        # with more dialects the output doesn't depend on the chunk size
+        # > "{ ty.a }" matches inside "{{ ty.a }" until the last "}" is read
+        regex_pattern = templately.re_builder_multi((("{{", "ty.", "}}"), ("{", "ty.", "}")))
+        mapping = {"placeholder1": os.path.join(test_path, "file1.txt"),
+                   "placeholder2": os.path.join(test_path, "file2.txt")}
+        text = "key: {{ ty.placeholder1 }} and { ty.placeholder2 } end {{ ty.placeholder2 }}{ ty.placeholder1 }\n" \
+               "{ ty.placeholder1 }} {{ {{ ty.placeholder2 }} {"
+        expected_output = io.StringIO()
+        templately.Template(io.StringIO(text), regex_pattern).render(expected_output, mapping)
+
+        for chunk_size in range(1, 40):
+            fout = io.StringIO()
+            templately.stream_render(io.StringIO(text), fout, mapping, regex_pattern, [("{{", "ty."), ("{", "ty.")],
+                                     chunk_size)
+            self.assertEqual(fout.getvalue(), expected_output.getvalue())
+
+        # a wrong placeholder of the standard input leaves the output as it was
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        output = os.path.join(tmp_dir, "out.txt")
+        with open(output, "w") as fout:
+            fout.write("old output")
+
+        with unittest.mock.patch("sys.stdin", io.StringIO("{{ ty.placeholder1 }} {{ ty.unknown }}")):
+            with self.assertRaises(SystemExit) as cm:
+                templately.main(["-", output, "placeholder1=" + os.path.join(test_path, "file1.txt")])
+        self.assertEqual(cm.exception.code, 2)
+        self.assertEqual(os.listdir(tmp_dir), ["out.txt"])
+        with open(output, "r") as fin:
+            self.assertEqual(fin.read(), "old output")
+
+        # the incremental and watch modes can't be used in stream mode, neither with the standard input
+        stamps = os.path.join(tmp_dir, "stamps.json")
+        for template in (os.path.join(test_path, "template.txt"), "-"):
+            for options in (["--stream", "--incremental", "--stamps=" + stamps], ["--stream", "--watch"],
+                            ["--incremental", "--stamps=" + stamps], ["--watch"]):
+                if template != "-" and "--stream" not in options:
+                    continue
+
+                with unittest.mock.patch("sys.stdin", io.StringIO("{{ ty.placeholder1 }}")):
+                    with self.assertRaises(SystemExit) as cm:
+                        templately.main(options + [template, output,
+                                                   "placeholder1=" + os.path.join(test_path, "file1.txt")])
+                self.assertEqual(cm.exception.code, 5)
+                self.assertFalse(os.path.exists(stamps))
+
 
 if __name__ == "__main__":
     # start unit tests